@@ -0,0 +1,377 @@
+"""
+A memory-mapped local archive of buckets, for offline analysis.
+
+Parsing a JSON (or NDJSON, see `export`) export again for every analysis is
+slow. An archive stores the events of each bucket in fixed-width columns
+instead, which are read through `mmap` without parsing or copying, and which
+several processes can share through the page cache.
+
+The layout of an archive file (in native byte order, which is checked when
+opening) is:
+
+- an 8 byte magic and the offset of the footer (int64),
+- per bucket, sorted by start time: the starts in microseconds since the
+  Unix epoch (int64), the durations in seconds (float64), the event IDs
+  (int64, -1 if missing) and for each data key the codes of its values
+  (int32, -1 if missing),
+- a dictionary of all distinct data values, as the offsets (int64) of their
+  JSON encodings in a UTF-8 blob,
+- a JSON footer with the bucket metadata and the offsets of the columns.
+
+The sorted starts, together with the longest duration of the bucket, are its
+time index: the events overlapping a time range are found by bisection.
+"""
+
+import json
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from datetime import datetime, timedelta
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .records import EventColumns, EventRecord
+from .streaming import DEFAULT_WINDOW, EventStream, bucket_range
+from .timestamps import EPOCH, epoch_us
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+MAGIC = b"AWARCH01"
+_HEADER_SIZE = 16
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class _BucketWriter:
+    """Collects the columns of a bucket, encoding data values into the shared dictionary."""
+
+    def __init__(self, lookup: Dict[str, int]) -> None:
+        self.lookup = lookup
+        self.starts = array("q")
+        self.durations = array("d")
+        self.ids = array("q")
+        self.codes: Dict[str, array[int]] = {}
+
+    def append(self, e: EventRecord) -> None:
+        n = len(self.starts)
+        self.starts.append(epoch_us(e.timestamp))
+        self.durations.append(e.duration_seconds)
+        self.ids.append(e.id if isinstance(e.id, int) else -1)
+        lookup = self.lookup
+        for key, value in e.data.items():
+            codes = self.codes.get(key)
+            if codes is None:
+                codes = self.codes[key] = array("i", [-1]) * n
+            encoded = json.dumps(value)
+            code = lookup.get(encoded)
+            if code is None:
+                code = lookup[encoded] = len(lookup)
+            codes.append(code)
+        for codes in self.codes.values():
+            if len(codes) == n:
+                codes.append(-1)
+
+    def sort(self) -> None:
+        starts = self.starts
+        order = sorted(range(len(starts)), key=starts.__getitem__)
+        if all(i == j for i, j in enumerate(order)):
+            return
+        self.starts = array("q", (starts[i] for i in order))
+        self.durations = array("d", (self.durations[i] for i in order))
+        self.ids = array("q", (self.ids[i] for i in order))
+        for key, codes in self.codes.items():
+            self.codes[key] = array("i", (codes[i] for i in order))
+
+
+def _copy(typecode: str, view: memoryview) -> "array[Any]":
+    a = array(typecode)
+    with view.cast("B") as raw:
+        a.frombytes(raw)
+    return a
+
+
+def _write_array(f: IO[bytes], a: "array[Any]") -> int:
+    # Aligned, so that the columns can be cast in place
+    offset = f.tell()
+    padding = -offset % 8
+    f.write(b"\0" * padding)
+    a.tofile(f)
+    return offset + padding
+
+
+def write_archive(
+    path: str, buckets: Iterable[Tuple[Dict[str, Any], Iterable[EventRecord]]]
+) -> Dict[str, int]:
+    """
+    Writes buckets, given as pairs of their metadata and events, to an archive file.
+
+    The file is written next to the path and moved into place when complete.
+    Returns the number of archived events per bucket.
+    """
+    lookup: Dict[str, int] = {}
+    footer: Dict[str, Any] = {"byteorder": sys.byteorder, "buckets": {}}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _HEADER_SIZE)
+        for meta, events in buckets:
+            writer = _BucketWriter(lookup)
+            for e in events:
+                writer.append(e)
+            writer.sort()
+            meta = {k: v for k, v in meta.items() if k != "events"}
+            footer["buckets"][meta["id"]] = {
+                "meta": meta,
+                "count": len(writer.starts),
+                "max_duration": max(writer.durations, default=0.0),
+                "starts": _write_array(f, writer.starts),
+                "durations": _write_array(f, writer.durations),
+                "ids": _write_array(f, writer.ids),
+                "keys": {
+                    key: _write_array(f, codes) for key, codes in writer.codes.items()
+                },
+            }
+
+        # Dicts keep insertion order, so the values are ordered by code
+        blob = "".join(lookup).encode("utf-8")
+        offsets = array("q", [0])
+        for value in lookup:
+            offsets.append(offsets[-1] + len(value.encode("utf-8")))
+        footer["values"] = {
+            "count": len(lookup),
+            "offsets": _write_array(f, offsets),
+            "blob": f.tell(),
+        }
+        f.write(blob)
+
+        footer_offset = f.tell()
+        f.write(json.dumps(footer).encode("utf-8"))
+        f.seek(0)
+        f.write(MAGIC + array("q", [footer_offset]).tobytes())
+    os.replace(tmp_path, path)
+    return {
+        bucket_id: bucket["count"] for bucket_id, bucket in footer["buckets"].items()
+    }
+
+
+def archive_buckets(
+    client: "ActivityWatchClient",
+    path: str,
+    bucket_ids: Optional[List[str]] = None,
+    window: timedelta = DEFAULT_WINDOW,
+) -> Dict[str, int]:
+    """Archives buckets (all of them by default), streaming their events from the server."""
+    buckets = client.bucket_registry.buckets()
+    if bucket_ids is None:
+        bucket_ids = list(buckets)
+
+    def bucket_events(bucket_id: str) -> Iterator[EventRecord]:
+        start, end = bucket_range(client, bucket_id, buckets[bucket_id])
+        return iter(EventStream(client, bucket_id, start, end, window))
+
+    return write_archive(
+        path,
+        ((buckets[bucket_id], bucket_events(bucket_id)) for bucket_id in bucket_ids),
+    )
+
+
+class ArchivedBucket:
+    """
+    The events of a bucket in an archive.
+
+    `starts`, `durations` and `ids` are views of the columns in the mapped
+    file, sorted by start.
+    """
+
+    def __init__(self, archive: "Archive", info: Dict[str, Any]) -> None:
+        self.archive = archive
+        self.meta: Dict[str, Any] = info["meta"]
+        self.max_duration: float = info["max_duration"]
+        n = info["count"]
+        self.starts = archive._view(info["starts"], n, "q")
+        self.durations = archive._view(info["durations"], n, "d")
+        self.ids = archive._view(info["ids"], n, "q")
+        self.codes = {
+            key: archive._view(offset, n, "i") for key, offset in info["keys"].items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def span(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Tuple[int, int]:
+        """
+        Returns the index range of the events starting before `end` and possibly ending after `start`.
+
+        Events starting up to the longest duration of the bucket before
+        `start` are included, since they might overlap it. This is a superset
+        of the events overlapping the range, see `select` for only those.
+        """
+        lo, hi = 0, len(self)
+        if start is not None:
+            lo = bisect_left(
+                self.starts,
+                epoch_us(start) - round(self.max_duration * 1_000_000),
+            )
+        if end is not None:
+            hi = bisect_left(self.starts, epoch_us(end), lo)
+        return lo, hi
+
+    def select(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Tuple[List[int], int, int]:
+        """
+        Returns the indexes of the events overlapping a time range, as `(head, mid, hi)`.
+
+        The events are those at the indexes in `head` (which start before
+        `start`, but end after it) followed by those from `mid` to `hi`.
+        """
+        lo, hi = self.span(start, end)
+        if start is None:
+            return [], lo, hi
+        start_us = epoch_us(start)
+        mid = bisect_left(self.starts, start_us, lo, hi)
+        starts, durations = self.starts, self.durations
+        head = [
+            i
+            for i in range(lo, mid)
+            if starts[i] + round(durations[i] * 1_000_000) > start_us
+        ]
+        return head, mid, hi
+
+    def columns(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        keys: Optional[Iterable[str]] = None,
+    ) -> EventColumns:
+        """
+        Loads the events of a time range into `EventColumns`, with the data values of `keys` (default: all).
+
+        The columns are copied out of the file with a single copy each, and
+        the values re-encoded like `to_columns` does. Only events overlapping
+        the range are included, see `select`.
+        """
+        head, mid, hi = self.select(start, end)
+
+        def column(typecode: str, view: memoryview) -> "array[Any]":
+            return array(typecode, [view[i] for i in head]) + _copy(
+                typecode, view[mid:hi]
+            )
+
+        columns = EventColumns(
+            ids=[i if i >= 0 else None for i in column("q", self.ids)],
+            timestamps=column("q", self.starts),
+            durations=column("d", self.durations),
+        )
+        for key in self.codes if keys is None else keys:
+            if key in self.codes:
+                codes, dictionary = self._encode(column("i", self.codes[key]))
+                columns.codes[key] = codes
+                columns.dictionaries[key] = dictionary
+        return columns
+
+    def _encode(self, codes: "array[int]") -> Tuple["array[int]", List[str]]:
+        display_value = self.archive._display_value
+        lookup: Dict[str, int] = {}
+        remap = {-1: -1}
+        # Ordered by first occurrence, like in to_columns
+        for code in dict.fromkeys(codes):
+            if code >= 0:
+                remap[code] = lookup.setdefault(display_value(code), len(lookup))
+        return array("l", map(remap.__getitem__, codes)), list(lookup)
+
+    def events(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Iterator[EventRecord]:
+        """Iterates over the events overlapping a time range, sorted by start."""
+        head, mid, hi = self.select(start, end)
+        value = self.archive._value
+        codes = list(self.codes.items())
+        starts, durations, ids = self.starts, self.durations, self.ids
+        for i in chain(head, range(mid, hi)):
+            data = {key: value(c[i]) for key, c in codes if c[i] >= 0}
+            event_id = ids[i]
+            yield EventRecord(
+                event_id if event_id >= 0 else None,
+                EPOCH + starts[i] * _MICROSECOND,
+                durations[i],
+                data,
+            )
+
+
+class Archive:
+    """An archive file opened through `mmap`, closes it when used as a context manager."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        self._views: List[memoryview] = []
+        if bytes(self._buffer[:8]) != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an event archive")
+        footer_offset = self._buffer[8:_HEADER_SIZE].cast("q")[0]
+        footer = json.loads(bytes(self._buffer[footer_offset:]))
+        if footer["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"{path} was written with another byte order")
+
+        values = footer["values"]
+        self._value_offsets = self._view(values["offsets"], values["count"] + 1, "q")
+        self._blob_offset: int = values["blob"]
+        self._values: List[Any] = [None] * values["count"]
+        self._decoded = bytearray(values["count"])
+
+        self.buckets: Dict[str, ArchivedBucket] = {
+            bucket_id: ArchivedBucket(self, info)
+            for bucket_id, info in footer["buckets"].items()
+        }
+
+    def _view(self, offset: int, n: int, typecode: str) -> memoryview:
+        size = array(typecode).itemsize
+        view = self._buffer[offset : offset + n * size].cast(typecode)  # type: ignore
+        self._views.append(view)
+        return view
+
+    def _value(self, code: int) -> Any:
+        # Decoded once per distinct value
+        if not self._decoded[code]:
+            start = self._blob_offset + self._value_offsets[code]
+            end = self._blob_offset + self._value_offsets[code + 1]
+            self._values[code] = json.loads(bytes(self._buffer[start:end]))
+            self._decoded[code] = 1
+        return self._values[code]
+
+    def _display_value(self, code: int) -> str:
+        v = self._value(code)
+        if isinstance(v, list):
+            return " > ".join(v)
+        return v if isinstance(v, str) else str(v)
+
+    def close(self) -> None:
+        # Views into the mapping have to be released before it can be closed
+        self.buckets = {}
+        for view in self._views:
+            view.release()
+        self._buffer.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
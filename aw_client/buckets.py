@@ -0,0 +1,140 @@
+"""
+A cache of the bucket metadata of a server.
+
+`ActivityWatchClient.get_buckets` downloads the metadata of all buckets on
+every call. `BucketRegistry` keeps it for a while (`ttl` seconds) and
+provides indexed lookups of buckets by type, hostname and client.
+
+The server has no conditional requests, so once the TTL has passed the
+buckets are fetched again. The indexes are only rebuilt (and `version`
+incremented) when a bucket was added or removed, or its type, hostname or
+client changed, not when events were added to it. Anything derived from the
+bucket list can use `version` to know when it has to be recomputed.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from types import MappingProxyType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+from . import queries
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+# The event type of the buckets of aw-watcher-web
+BROWSER_BUCKET_TYPE = "web.tab.current"
+
+
+_INDEXED_FIELDS = ("type", "hostname", "client")
+
+
+def _fingerprint(buckets: Dict[str, dict]) -> Dict[str, Any]:
+    # Only what the indexes depend on, since last_updated changes with every new event
+    return {
+        bucket_id: tuple(bucket.get(field) for field in _INDEXED_FIELDS)
+        for bucket_id, bucket in buckets.items()
+    }
+
+
+class BucketRegistry:
+    """Cached bucket metadata, with lookups by type, hostname and client."""
+
+    def __init__(
+        self,
+        client: "ActivityWatchClient",
+        ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.clock = clock
+        # Incremented each time the buckets change
+        self.version = 0
+        self._lock = threading.Lock()
+        self._buckets: Mapping[str, dict] = MappingProxyType({})
+        self._fingerprint: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self._indexes: Dict[str, Dict[Any, List[str]]] = {}
+        self._browsers: List[Tuple[str, str]] = []
+
+    def buckets(self) -> Mapping[str, dict]:
+        """
+        Returns the metadata of all buckets, fetching it again if it's older than the TTL.
+
+        The mapping is shared by all callers, so it's read-only.
+        """
+        with self._lock:
+            self._revalidate()
+            return self._buckets
+
+    def invalidate(self) -> None:
+        """Makes the next lookup fetch the buckets again, for example after creating a bucket."""
+        with self._lock:
+            self._fetched_at = -self.ttl
+
+    def _revalidate(self) -> None:
+        if self._fingerprint is not None and self.clock() - self._fetched_at < self.ttl:
+            return
+        buckets = self.client.get_buckets()
+        self._buckets = MappingProxyType(buckets)
+        self._fetched_at = self.clock()
+        fingerprint = _fingerprint(buckets)
+        if fingerprint == self._fingerprint:
+            return
+        self._fingerprint = fingerprint
+        self._indexes = {}
+        for field in _INDEXED_FIELDS:
+            index = defaultdict(list)
+            for bucket_id, bucket in buckets.items():
+                index[bucket.get(field)].append(bucket_id)
+            self._indexes[field] = dict(index)
+        self._browsers = queries.browsersWithBuckets(
+            self._indexes["type"].get(BROWSER_BUCKET_TYPE, [])
+        )
+        self.version += 1
+
+    def get(self, bucket_id: str) -> Optional[dict]:
+        return self.buckets().get(bucket_id)
+
+    def find(
+        self,
+        type: Optional[str] = None,
+        hostname: Optional[str] = None,
+        client: Optional[str] = None,
+    ) -> List[str]:
+        """Returns the IDs of the buckets matching all the given fields."""
+        with self._lock:
+            self._revalidate()
+            buckets, indexes = self._buckets, self._indexes
+        matches: Optional[List[str]] = None
+        for field, value in (
+            ("type", type),
+            ("hostname", hostname),
+            ("client", client),
+        ):
+            if value is None:
+                continue
+            ids = indexes[field].get(value, [])
+            if matches is None:
+                matches = ids
+            else:
+                found = set(ids)
+                matches = [bucket_id for bucket_id in matches if bucket_id in found]
+        return list(buckets if matches is None else matches)
+
+    def browsers(self) -> List[Tuple[str, str]]:
+        """Returns (browser name, bucket ID) pairs for the browser buckets, like `queries.browsersWithBuckets`."""
+        with self._lock:
+            self._revalidate()
+            return list(self._browsers)
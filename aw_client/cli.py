@@ -2,20 +2,24 @@
 
 import json
 import logging
+import os
 import textwrap
 import time
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 
 import click
 from aw_core import Event
+from aw_core.dirs import get_cache_dir
 from tabulate import tabulate
 
 import aw_client
 
-from . import queries
+from . import compaction, queries, summaries
+from .buckets import BROWSER_BUCKET_TYPE
 from .classes import default_classes, get_classes
+from .records import EventRecord, parse_records
 
 now = datetime.now(timezone.utc)
 td1day = timedelta(days=1)
@@ -74,12 +78,52 @@ def heartbeat(obj: _Context, bucket_id: str, data: str, pulsetime: int):
 @main.command(help="List all buckets")
 @click.pass_obj
 def buckets(obj: _Context):
-    buckets = obj.client.get_buckets()
+    buckets = obj.client.bucket_registry.buckets()
     print("Buckets:")
     for bucket in buckets:
         print(f" - {bucket}")
 
 
+@main.command(help="Archive buckets to a memory-mapped file for offline analysis")
+@click.argument("path")
+@click.option(
+    "--bucket", "bucket_ids", multiple=True, help="Bucket to archive (default: all)"
+)
+@click.pass_obj
+def archive(obj: _Context, path: str, bucket_ids: Tuple[str, ...]):
+    counts = obj.client.archive_to_file(path, list(bucket_ids) or None)
+    for bucket_id, n in counts.items():
+        print(f" - {bucket_id}: {n} events")
+    print(f"Archived {sum(counts.values())} events to {path}")
+
+
+@main.command(help="Export buckets to an NDJSON file, gzipped if it ends in .gz")
+@click.argument("path")
+@click.option(
+    "--bucket", "bucket_ids", multiple=True, help="Bucket to export (default: all)"
+)
+@click.pass_obj
+def export(obj: _Context, path: str, bucket_ids: Tuple[str, ...]):
+    counts = obj.client.export_to_file(path, list(bucket_ids) or None)
+    for bucket_id, n in counts.items():
+        print(f" - {bucket_id}: {n} events")
+    print(f"Exported {sum(counts.values())} events to {path}")
+
+
+@main.command(
+    name="import",
+    help="Import buckets from a JSON or NDJSON export file, resuming if interrupted",
+)
+@click.argument("path")
+@click.option("--chunk-size", default=1000, help="Events per request")
+@click.pass_obj
+def import_(obj: _Context, path: str, chunk_size: int):
+    counts = obj.client.import_from_file(path, chunk_size=chunk_size)
+    for bucket_id, n in counts.items():
+        print(f" - {bucket_id}: {n} events")
+    print(f"Imported {sum(counts.values())} events from {path}")
+
+
 @main.command(help="Query events from bucket with ID `bucket_id`")
 @click.argument("bucket_id")
 @click.pass_obj
@@ -148,8 +192,10 @@ def query(
             )
 
 
-@main.command(help="Generate an activity report")
-@click.argument("hostname")
+@main.command(
+    help="Generate an activity report, combined over all given hosts if several are given"
+)
+@click.argument("hostnames", nargs=-1, required=True)
 @click.option("--cache", is_flag=True)
 @click.option("--start", default=now - td1day, type=click.DateTime())
 @click.option("--stop", default=now + td1yr, type=click.DateTime())
@@ -157,7 +203,7 @@ def query(
 @click.pass_obj
 def report(
     obj: _Context,
-    hostname: str,
+    hostnames: Tuple[str, ...],
     cache: bool,
     start: datetime,
     stop: datetime,
@@ -165,27 +211,42 @@ def report(
     limit: int = 10,
 ):
     logger.info(f"Querying between {start} and {stop}")
-    bid_window = f"aw-watcher-window_{hostname}"
-    bid_afk = f"aw-watcher-afk_{hostname}"
 
     if not start.tzinfo:
         start = start.astimezone()
     if not stop.tzinfo:
         stop = stop.astimezone()
 
-    bid_browsers: List[str] = []
+    # The browser buckets of each host
+    bid_browsers: Dict[str, List[str]] = {
+        hostname: obj.client.bucket_registry.find(
+            type=BROWSER_BUCKET_TYPE, hostname=hostname
+        )
+        for hostname in hostnames
+    }
 
     classes = get_classes()
-    params = queries.DesktopQueryParams(
-        bid_browsers=bid_browsers,
-        classes=classes,
-        filter_classes=[],
-        filter_afk=True,
-        include_audible=True,
-        bid_window=bid_window,
-        bid_afk=bid_afk,
-    )
-    query = queries.fullDesktopQuery(params)
+    # Only fetch what is printed
+    projection: queries.Projection = {
+        "window.cat_events": ["$category"],
+        "window.title_events": ["app", "title"],
+    }
+    if len(hostnames) > 1:
+        query = queries.multiHostQuery(
+            hostnames, classes=classes, bid_browsers=bid_browsers
+        )
+    else:
+        hostname = hostnames[0]
+        params = queries.DesktopQueryParams(
+            bid_browsers=bid_browsers[hostname],
+            classes=classes,
+            filter_classes=[],
+            filter_afk=True,
+            include_audible=True,
+            bid_window=f"aw-watcher-window_{hostname}",
+            bid_afk=f"aw-watcher-afk_{hostname}",
+        )
+        query = queries.fullDesktopQuery(params, projection=projection)
     logger.debug("Query: \n" + queries.pretty_query(query))
 
     result = obj.client.query(query, [(start, stop)], cache=cache, name=name)
@@ -195,6 +256,12 @@ def report(
         print()
         # print(period["window"]["cat_events"])
 
+        for hostname, host_period in period.get("hosts", {}).items():
+            print(
+                f"Duration on {hostname}:\t",
+                timedelta(seconds=host_period["duration"]),
+            )
+
         cat_events = _parse_events(period["window"]["cat_events"])
         print_top(
             cat_events,
@@ -213,11 +280,100 @@ def report(
         )
 
 
-def _parse_events(events: List[dict]) -> List[Event]:
-    return [Event(**event) for event in events]
+@main.command(help="Show a summary of each of the last days, reusing stored summaries")
+@click.argument("hostname")
+@click.option("--days", default=7, help="Number of days to show")
+@click.option("--offset", default=0, help="Hours after midnight that a day starts")
+@click.option("--no-store", is_flag=True, help="Don't read or write stored summaries")
+@click.pass_obj
+def daily(obj: _Context, hostname: str, days: int, offset: int, no_store: bool):
+    day_offset = timedelta(hours=offset)
+    today = (datetime.now().astimezone() - day_offset).date()
+    dates = [today - timedelta(days=i) for i in reversed(range(days))]
+
+    store = (
+        None
+        if no_store
+        else summaries.SummaryStore(summaries.default_store_path(obj.client.testing))
+    )
+    bid_browsers = [bucket_id for _, bucket_id in obj.client.bucket_registry.browsers()]
+    result = summaries.daily_summaries(
+        obj.client,
+        store,
+        hostname,
+        dates,
+        day_offset=day_offset,
+        bid_browsers=bid_browsers,
+    )
+
+    def _top(durations: Dict[str, float]) -> str:
+        return max(durations, key=lambda k: durations[k], default="")
+
+    print(
+        tabulate(
+            [
+                (
+                    day,
+                    str(timedelta(seconds=summary["duration"])).split(".")[0],
+                    _top(summary["categories"]),
+                    _top(summary["apps"]),
+                    _top(summary["domains"]),
+                )
+                for day, summary in result.items()
+            ],
+            headers=["Date", "Duration", "Top category", "Top app", "Top domain"],
+        )
+    )
+
+
+@main.command(
+    help="Compact old events in a bucket, merging consecutive events with the same data"
+)
+@click.argument("bucket_id")
+@click.option("--older-than", default=30, help="Only compact events older than N days")
+@click.option(
+    "--pulsetime", default=0.0, help="Also merge events with gaps of up to N seconds"
+)
+@click.option(
+    "--min-duration", default=0.0, help="Drop compacted events shorter than N seconds"
+)
+@click.option("--wet", is_flag=True, help="Modify the bucket, instead of a dry run")
+@click.pass_obj
+def compact(
+    obj: _Context,
+    bucket_id: str,
+    older_than: int,
+    pulsetime: float,
+    min_duration: float,
+    wet: bool,
+):
+    checkpoint_path = os.path.join(
+        get_cache_dir("aw-client"), f"compact-{bucket_id}.json"
+    )
+    result = compaction.compact_bucket(
+        obj.client,
+        bucket_id,
+        older_than=timedelta(days=older_than),
+        pulsetime=pulsetime,
+        min_duration=min_duration,
+        checkpoint_path=checkpoint_path if wet else None,
+        dry_run=not wet,
+    )
+    print(
+        f"{'Compacted' if wet else 'Would compact'} {result.events_before} events"
+        f" into {result.events_after} ({result.ratio:.1%})"
+    )
+    if result.dropped_duration:
+        print(f"Dropped {timedelta(seconds=result.dropped_duration)} of short events")
+    if not wet:
+        print("This was a dry run, run with --wet to modify the bucket")
+
+
+def _parse_events(events: List[dict]) -> List[EventRecord]:
+    return parse_records(events)
 
 
-def print_top(events: List[Event], key=lambda e: e.data, title="Events", n=10):
+def print_top(events: List[EventRecord], key=lambda e: e.data, title="Events", n=10):
     print(f"Top {n} {title}" + (f" (out of {len(events)})" if len(events) > 10 else ""))
     print(
         tabulate(
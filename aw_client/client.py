@@ -2,30 +2,44 @@ import functools
 import json
 import logging
 import os
+import re
 import socket
 import threading
 import warnings
 from collections import namedtuple
-from datetime import datetime
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter, sleep
 from typing import (
     Any,
     Callable,
     Dict,
+    Iterable,
     List,
+    Literal,
     Optional,
     Tuple,
     Union,
+    overload,
 )
 
 import persistqueue
 import requests as req
+from requests.adapters import HTTPAdapter
 from aw_core.dirs import get_data_dir
 from aw_core.models import Event
-from aw_transform.heartbeats import heartbeat_merge
 
 from .config import load_config, load_local_server_api_key
+from .archive import archive_buckets
+from .buckets import BucketRegistry
+from .estimates import EventEstimate, estimate_events
+from .export import export_ndjson
+from .imports import import_file
+from .metrics import QueueMetrics
+from .premerge import HeartbeatCheckpoint, HeartbeatPremerger, merge_heartbeats
+from .records import EventRecord, parse_event, parse_events, parse_records
 from .singleinstance import SingleInstance
+from .tracing import Tracer
 
 # FIXME: This line is probably badly placed
 logging.getLogger("requests").setLevel(logging.WARNING)
@@ -45,6 +59,23 @@ def _dt_is_tzaware(dt: datetime) -> bool:
     return dt.tzinfo is not None and dt.tzinfo.utcoffset(dt) is not None
 
 
+def _queued_file_path(client_name: str, testing: bool, version: int, ext: str) -> str:
+    data_dir = get_data_dir("aw-client")
+    queued_dir = os.path.join(data_dir, "queued")
+    if not os.path.exists(queued_dir):
+        os.makedirs(queued_dir)
+
+    return os.path.join(
+        queued_dir,
+        "{}{}.v{}.{}".format(
+            client_name,
+            "-testing" if testing else "",
+            version,
+            ext,
+        ),
+    )
+
+
 def always_raise_for_request_errors(f: Callable[..., req.Response]):
     @functools.wraps(f)
     def g(*args, **kwargs):
@@ -59,7 +90,20 @@ def always_raise_for_request_errors(f: Callable[..., req.Response]):
     return g
 
 
+def _traced(f: Callable):
+    """Groups the requests made by a client method into its traces, see `Tracer.call`."""
+
+    @functools.wraps(f)
+    def g(self: "ActivityWatchClient", *args, **kwargs):
+        with self.tracer.call(f.__name__):
+            return f(self, *args, **kwargs)
+
+    return g
+
+
 class ActivityWatchClient:
+    PREMERGE_VERSION = 1  # update this whenever the premerge checkpoint format changes
+
     def __init__(
         self,
         client_name: str = "unknown",
@@ -98,9 +142,36 @@ class ActivityWatchClient:
 
         self.commit_interval = client_config["commit_interval"]
 
-        self.request_queue = RequestQueue(self)
+        # Request tracing, add hooks with `client.tracer.add_hook(hook)`
+        self.tracer = Tracer()
+
+        # Cached bucket metadata, see `BucketRegistry`
+        self.bucket_registry = BucketRegistry(self)
+
+        # Metrics of the request queue, kept across reconnects
+        self.metrics = QueueMetrics()
+        self.request_queue = RequestQueue(
+            self, self.metrics, on_tick=self._flush_expired_heartbeats
+        )
+        # Pending pre-merged heartbeats are checkpointed so they aren't lost if the process is killed
+        # Keyed by server like SingleInstance, so instances with the same name
+        # talking to different servers don't recover each other's heartbeats.
+        # The file is only opened (and heartbeats left pending by a previous run
+        # committed) on the first queued heartbeat.
+        server_name = re.sub(r"[^\w.-]", "_", f"{server_host}-{server_port}")
+        checkpoint = HeartbeatCheckpoint(
+            _queued_file_path(
+                f"{self.client_name}-at-{server_name}",
+                self.testing,
+                self.PREMERGE_VERSION,
+                "premerge",
+            )
+        )
+        self._premerger = HeartbeatPremerger(
+            self._commit_heartbeat, self.commit_interval, checkpoint=checkpoint
+        )
         # Dict of each last heartbeat in each bucket
-        self.last_heartbeat = {}  # type: Dict[str, Event]
+        self.last_heartbeat = self._premerger.pending  # type: Dict[str, Event]
         self._warned_queue_before_connect = False
 
     #
@@ -118,7 +189,14 @@ class ActivityWatchClient:
 
     @always_raise_for_request_errors
     def _get(self, endpoint: str, params: Optional[dict] = None) -> req.Response:
-        return req.get(self._url(endpoint), params=params, headers=self._headers())
+        return self.tracer.request(
+            "GET",
+            endpoint,
+            req.get,
+            self._url(endpoint),
+            params=params,
+            headers=self._headers(),
+        )
 
     @always_raise_for_request_errors
     def _post(
@@ -130,9 +208,14 @@ class ActivityWatchClient:
         headers = self._headers(
             {"Content-type": "application/json", "charset": "utf-8"}
         )
-        return req.post(
+        body = bytes(json.dumps(data), "utf8")
+        return self.tracer.request(
+            "POST",
+            endpoint,
+            req.post,
             self._url(endpoint),
-            data=bytes(json.dumps(data), "utf8"),
+            payload_bytes=len(body),
+            data=body,
             headers=headers,
             params=params,
         )
@@ -142,39 +225,98 @@ class ActivityWatchClient:
         if data is None:
             data = {}
         headers = self._headers({"Content-type": "application/json"})
-        return req.delete(self._url(endpoint), data=json.dumps(data), headers=headers)
+        body = json.dumps(data)
+        return self.tracer.request(
+            "DELETE",
+            endpoint,
+            req.delete,
+            self._url(endpoint),
+            payload_bytes=len(body),
+            data=body,
+            headers=headers,
+        )
 
+    @_traced
     def get_info(self):
         """Returns a dict currently containing the keys 'hostname' and 'testing'."""
         endpoint = "info"
-        return self._get(endpoint).json()
+        return self.tracer.decode(self._get(endpoint))
 
     #
     #   Event get/post requests
     #
 
+    @overload
+    def get_event(
+        self, bucket_id: str, event_id: int, raw: Literal[False] = False
+    ) -> Optional[Event]: ...
+
+    @overload
+    def get_event(
+        self, bucket_id: str, event_id: int, raw: Literal[True]
+    ) -> Optional[EventRecord]: ...
+
+    @_traced
     def get_event(
         self,
         bucket_id: str,
         event_id: int,
-    ) -> Optional[Event]:
+        raw: bool = False,
+    ) -> Optional[Union[Event, EventRecord]]:
+        """
+        Get a single event, or None if it doesn't exist.
+
+        If `raw` is set, a lightweight `EventRecord` is returned instead of an `Event`.
+        """
         endpoint = f"buckets/{bucket_id}/events/{event_id}"
         try:
-            event = self._get(endpoint).json()
-            return Event(**event)
+            event = self.tracer.decode(self._get(endpoint))
+            if raw:
+                return self.tracer.construct(lambda: EventRecord.from_json_dict(event))
+            return self.tracer.construct(lambda: parse_event(event))
         except req.exceptions.HTTPError as e:
             if e.response and e.response.status_code == 404:
                 return None
             else:
                 raise
 
+    @overload
+    def get_events(
+        self,
+        bucket_id: str,
+        limit: int = -1,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        raw: Literal[False] = False,
+    ) -> List[Event]: ...
+
+    @overload
+    def get_events(
+        self,
+        bucket_id: str,
+        limit: int = -1,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        *,
+        raw: Literal[True],
+    ) -> List[EventRecord]: ...
+
+    @_traced
     def get_events(
         self,
         bucket_id: str,
         limit: int = -1,
         start: Optional[datetime] = None,
         end: Optional[datetime] = None,
-    ) -> List[Event]:
+        raw: bool = False,
+    ) -> Union[List[Event], List[EventRecord]]:
+        """
+        Get events from a bucket, optionally limited to a time range.
+
+        If `raw` is set, lightweight `EventRecord`s are returned instead of
+        `Event`s, which is much cheaper when reading many events. Use
+        `EventRecord.to_event` to convert individual records when needed.
+        """
         endpoint = f"buckets/{bucket_id}/events"
 
         params = dict()  # type: Dict[str, str]
@@ -185,8 +327,10 @@ class ActivityWatchClient:
         if end is not None:
             params["end"] = end.isoformat()
 
-        events = self._get(endpoint, params=params).json()
-        return [Event(**event) for event in events]
+        events = self.tracer.decode(self._get(endpoint, params=params))
+        if raw:
+            return self.tracer.construct(lambda: parse_records(events))
+        return self.tracer.construct(lambda: parse_events(events))
 
     def insert_event(self, bucket_id: str, event: Event) -> None:
         endpoint = f"buckets/{bucket_id}/events"
@@ -202,6 +346,77 @@ class ActivityWatchClient:
         endpoint = f"buckets/{bucket_id}/events/{event_id}"
         self._delete(endpoint)
 
+    @_traced
+    def delete_events(
+        self,
+        bucket_id: str,
+        event_ids: Optional[Iterable[int]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        max_workers: int = 8,
+    ) -> Dict[int, Optional[str]]:
+        """
+        Delete many events, given by their IDs or by a time range.
+
+        Only events which are entirely within the time range are deleted,
+        events overlapping `start` or `end` are kept.
+
+        The server API has no bulk delete, so the DELETE requests are sent
+        concurrently (at most `max_workers` at a time) over a shared pool of
+        connections. Returns the outcome for each ID: None if it was deleted,
+        otherwise the error.
+        """
+        if event_ids is None:
+            if start is None and end is None:
+                raise ValueError("Either event_ids or a time range is required")
+            # The server may cut events at the bounds of the range, which would hide
+            # that they extend past them, so the range is queried with a margin.
+            margin = timedelta(seconds=1)
+            events = self.get_events(
+                bucket_id,
+                start=start - margin if start is not None else None,
+                end=end + margin if end is not None else None,
+                raw=True,
+            )
+            event_ids = [
+                int(e.id)
+                for e in events
+                if e.id is not None
+                and (start is None or e.timestamp >= start)
+                and (end is None or e.timestamp + e.duration <= end)
+            ]
+        event_ids = list(event_ids)
+
+        with req.Session() as session:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            headers = self._headers()
+
+            def delete(event_id: int) -> Optional[str]:
+                endpoint = f"buckets/{bucket_id}/events/{event_id}"
+                try:
+                    r = self.tracer.request(
+                        "DELETE",
+                        endpoint,
+                        session.delete,
+                        self._url(endpoint),
+                        headers=headers,
+                    )
+                    r.raise_for_status()
+                    return None
+                except req.RequestException as e:
+                    return str(e)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                outcomes = dict(zip(event_ids, executor.map(delete, event_ids)))
+
+        failed = sum(1 for outcome in outcomes.values() if outcome is not None)
+        if failed:
+            logger.warning(f"Failed to delete {failed} of {len(outcomes)} events")
+        return outcomes
+
+    @_traced
     def get_eventcount(
         self,
         bucket_id: str,
@@ -209,6 +424,12 @@ class ActivityWatchClient:
         start: Optional[datetime] = None,
         end: Optional[datetime] = None,
     ) -> int:
+        """
+        Count the events in a bucket, optionally limited to a time range.
+
+        The count is capped at `limit` (if not negative), since the server
+        has no limit for counts.
+        """
         endpoint = f"buckets/{bucket_id}/events/count"
 
         params = dict()  # type: Dict[str, str]
@@ -218,7 +439,22 @@ class ActivityWatchClient:
             params["end"] = end.isoformat()
 
         response = self._get(endpoint, params=params)
-        return int(response.text)
+        count = int(response.text)
+        return count if limit < 0 else min(count, limit)
+
+    def estimate_events(
+        self,
+        bucket_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        sample_size: int = 100,
+    ) -> EventEstimate:
+        """
+        Estimate the number of events and their size in a time range of a bucket, without fetching all of them.
+
+        See `estimates.EventEstimate.suggest_window` for choosing window sizes from it.
+        """
+        return estimate_events(self, bucket_id, start, end, sample_size)
 
     def heartbeat(
         self,
@@ -241,43 +477,64 @@ class ActivityWatchClient:
               the function will in that case always returns None.
         """
 
-        endpoint = f"buckets/{bucket_id}/heartbeat?pulsetime={pulsetime}"
-        _commit_interval = commit_interval or self.commit_interval
-
         if queued:
             self._warn_queue_before_connect()
             # Pre-merge heartbeats
-            if bucket_id not in self.last_heartbeat:
-                self.last_heartbeat[bucket_id] = event
-                return None
+            self._premerger.heartbeat(bucket_id, event, pulsetime, commit_interval)
+        else:
+            endpoint = f"buckets/{bucket_id}/heartbeat?pulsetime={pulsetime}"
+            self._post(endpoint, event.to_json_dict())
 
-            last_heartbeat = self.last_heartbeat[bucket_id]
+    def heartbeat_many(
+        self,
+        bucket_id: str,
+        events: List[Event],
+        pulsetime: float,
+        chunk_size: int = 1000,
+    ) -> None:
+        """
+        Send a batch of heartbeats, such as a replay of recorded activity.
 
-            merge = heartbeat_merge(last_heartbeat, event, pulsetime)
+        The heartbeats are merged locally (with the same rules as aw-server) and
+        the merged events are then inserted in chunks of `chunk_size` events.
 
-            if merge:
-                # If last_heartbeat becomes longer than commit_interval
-                # then commit, else cache merged.
-                diff = (last_heartbeat.duration).total_seconds()
-                if diff >= _commit_interval:
-                    data = merge.to_json_dict()
-                    self.request_queue.add_request(endpoint, data)
-                    self.last_heartbeat[bucket_id] = event
-                else:
-                    self.last_heartbeat[bucket_id] = merge
-            else:
-                data = last_heartbeat.to_json_dict()
-                self.request_queue.add_request(endpoint, data)
-                self.last_heartbeat[bucket_id] = event
-        else:
-            self._post(endpoint, event.to_json_dict())
+        Args:
+            bucket_id: The bucket_id of the bucket to send the heartbeats to
+            events: The heartbeat events, sorted by timestamp
+            pulsetime: The maximum amount of time in seconds between two heartbeats for them to be merged
+            chunk_size: Max number of merged events to send per request
+
+        NOTE: Merged events are inserted, so they are not merged with events already in the bucket.
+              A pending pre-merged heartbeat of the bucket (from queued heartbeats) is merged into
+              the batch, so that it can't be committed after the inserted events.
+        """
+        pending = self._premerger.take(bucket_id)
+        if pending is not None:
+            events = sorted([*events, pending], key=lambda e: e.timestamp)
+        merged = merge_heartbeats(events, pulsetime)
+        try:
+            for i in range(0, len(merged), chunk_size):
+                self.insert_events(bucket_id, merged[i : i + chunk_size])
+        except Exception:
+            if pending is not None:
+                # Put back so it isn't lost
+                self._premerger.restore(bucket_id, pending)
+            raise
+
+    def _commit_heartbeat(self, bucket_id: str, pulsetime: float, event: Event) -> None:
+        endpoint = f"buckets/{bucket_id}/heartbeat?pulsetime={pulsetime}"
+        self.request_queue.add_request(endpoint, event.to_json_dict())
+
+    def _flush_expired_heartbeats(self) -> None:
+        self._premerger.flush_expired()
 
     #
     #   Bucket get/post requests
     #
 
+    @_traced
     def get_buckets(self) -> dict:
-        return self._get("buckets/").json()
+        return self.tracer.decode(self._get("buckets/"))
 
     def create_bucket(self, bucket_id: str, event_type: str, queued=False):
         if queued:
@@ -291,9 +548,11 @@ class ActivityWatchClient:
                 "type": event_type,
             }
             self._post(endpoint, data)
+            self.bucket_registry.invalidate()
 
     def delete_bucket(self, bucket_id: str, force: bool = False):
         self._delete(f"buckets/{bucket_id}" + ("?force=1" if force else ""))
+        self.bucket_registry.invalidate()
 
     # @deprecated
     def setup_bucket(self, bucket_id: str, event_type: str):
@@ -301,20 +560,56 @@ class ActivityWatchClient:
 
     # Import & export
 
+    @_traced
     def export_all(self) -> dict:
-        return self._get("export").json()
+        return self.tracer.decode(self._get("export"))
 
+    @_traced
     def export_bucket(self, bucket_id) -> dict:
-        return self._get(f"buckets/{bucket_id}/export").json()
+        return self.tracer.decode(self._get(f"buckets/{bucket_id}/export"))
+
+    def export_to_file(
+        self, path: str, bucket_ids: Optional[List[str]] = None, max_workers: int = 4
+    ) -> Dict[str, int]:
+        """
+        Export buckets (all by default) to an NDJSON file (gzipped if the path ends in `.gz`), streaming their events.
+
+        Unlike `export_all`, the export never needs to be kept in memory.
+        Returns the number of exported events per bucket.
+        """
+        return export_ndjson(self, path, bucket_ids, max_workers=max_workers)
+
+    def archive_to_file(
+        self, path: str, bucket_ids: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """
+        Archive buckets (all by default) to a file for offline analysis, see `archive.Archive` for reading it.
+
+        Returns the number of archived events per bucket.
+        """
+        return archive_buckets(self, path, bucket_ids)
 
     def import_bucket(self, bucket: dict) -> None:
         endpoint = "import"
         self._post(endpoint, {"buckets": {bucket["id"]: bucket}})
+        self.bucket_registry.invalidate()
+
+    def import_from_file(
+        self, path: str, chunk_size: int = 1000, max_workers: int = 4
+    ) -> Dict[str, int]:
+        """
+        Import buckets from a JSON or NDJSON export file, uploading their events in chunks.
+
+        An interrupted import resumes where it stopped when called again.
+        Returns the number of imported events per bucket.
+        """
+        return import_file(self, path, chunk_size=chunk_size, max_workers=max_workers)
 
     #
     #   Query (server-side transformation)
     #
 
+    @_traced
     def query(
         self,
         query: str,
@@ -348,17 +643,18 @@ class ActivityWatchClient:
             "query": query.split("\n"),
         }
         response = self._post(endpoint, data, params=params)
-        return response.json()
+        return self.tracer.decode(response)
 
     #
     # Settings
     #
 
+    @_traced
     def get_setting(self, key: Optional[str] = None) -> dict:
         if key:
-            return self._get(f"settings/{key}").json()
+            return self.tracer.decode(self._get(f"settings/{key}"))
         else:
-            return self._get("settings").json()
+            return self.tracer.decode(self._get("settings"))
 
     def set_setting(self, key: str, value: str) -> None:
         self._post(f"settings/{key}", value)
@@ -379,11 +675,17 @@ class ActivityWatchClient:
             self.request_queue.start()
 
     def disconnect(self):
+        # Commit pending pre-merged heartbeats so they end up in the persistent queue
+        self._premerger.flush_all()
+        self._premerger.close()
+
         self.request_queue.stop()
         self.request_queue.join()
 
         # Throw away old thread object, create new one since same thread cannot be started twice
-        self.request_queue = RequestQueue(self)
+        self.request_queue = RequestQueue(
+            self, self.metrics, on_tick=self._flush_expired_heartbeats
+        )
         # Reset so warn-before-connect fires again if user calls queued ops before reconnecting
         self._warned_queue_before_connect = False
 
@@ -428,10 +730,21 @@ class RequestQueue(threading.Thread):
 
     VERSION = 1  # update this whenever the queue-file format changes
 
-    def __init__(self, client: ActivityWatchClient) -> None:
+    # Times a request failing with HTTP 500 is retried (with exponential backoff) before it's dropped
+    MAX_SERVER_ERROR_RETRIES = 5
+
+    def __init__(
+        self,
+        client: ActivityWatchClient,
+        metrics: Optional[QueueMetrics] = None,
+        on_tick: Optional[Callable[[], None]] = None,
+    ) -> None:
         threading.Thread.__init__(self, daemon=True)
 
         self.client = client
+        self.metrics = metrics or QueueMetrics()
+        # Called regularly from the queue thread, used to commit expired pre-merged heartbeats
+        self._on_tick = on_tick or (lambda: None)
 
         self.connected = False
         self._stop_event = threading.Event()
@@ -442,18 +755,8 @@ class RequestQueue(threading.Thread):
         self._attempt_reconnect_interval = 10
 
         # Setup failed queues file
-        data_dir = get_data_dir("aw-client")
-        queued_dir = os.path.join(data_dir, "queued")
-        if not os.path.exists(queued_dir):
-            os.makedirs(queued_dir)
-
-        persistqueue_path = os.path.join(
-            queued_dir,
-            "{}{}.v{}.persistqueue".format(
-                self.client.client_name,
-                "-testing" if client.testing else "",
-                self.VERSION,
-            ),
+        persistqueue_path = _queued_file_path(
+            self.client.client_name, client.testing, self.VERSION, "persistqueue"
         )
 
         logger.debug(f"queue path '{persistqueue_path}'")
@@ -461,7 +764,9 @@ class RequestQueue(threading.Thread):
         self._persistqueue = persistqueue.FIFOSQLiteQueue(
             persistqueue_path, multithreading=True, auto_commit=False
         )
+        self.metrics.bind_queue(self._persistqueue.qsize)
         self._current = None  # type: Optional[QueuedRequest]
+        self._server_error_retries = 0
 
     def _get_next(self) -> Optional[QueuedRequest]:
         # self._current will always hold the next not-yet-sent event,
@@ -475,6 +780,7 @@ class RequestQueue(threading.Thread):
 
     def _task_done(self) -> None:
         self._current = None
+        self._server_error_retries = 0
         self._persistqueue.task_done()
 
     def _create_buckets(self) -> None:
@@ -500,13 +806,18 @@ class RequestQueue(threading.Thread):
         return self._stop_event.is_set()
 
     def _dispatch_request(self) -> None:
+        self._on_tick()
+        self.metrics.export_due()
+
         request = self._get_next()
         if not request:
             self.wait(0.2)  # seconds to wait before re-polling the empty queue
             return
 
         try:
+            t = perf_counter()
             self.client._post(request.endpoint, request.data)
+            self.metrics.record_sent(perf_counter() - t)
         except req.exceptions.ConnectTimeout:
             # Triggered by:
             #   - server not running (connection refused)
@@ -515,6 +826,7 @@ class RequestQueue(threading.Thread):
             #   https://requests.readthedocs.io/en/latest/api/#requests.ConnectTimeout
 
             self.connected = False
+            self.metrics.record_error("ConnectTimeout", retried=True)
             logger.warning(
                 "Connection refused or timeout, will queue requests until connection is available."
             )
@@ -524,21 +836,36 @@ class RequestQueue(threading.Thread):
             sleep(0.5)
             return
         except req.RequestException as e:
-            if e.response and e.response.status_code == 400:
+            if e.response is not None and e.response.status_code == 400:
                 # HTTP 400 - Bad request
                 # Example case: https://github.com/ActivityWatch/activitywatch/issues/815
                 # We don't want to retry, because a bad payload is likely to fail forever.
+                self.metrics.record_error("400", retried=False)
                 logger.error(f"Bad request, not retrying: {request.data}")
-            elif e.response and e.response.status_code == 500:
+            elif (
+                e.response is not None
+                and e.response.status_code == 500
+                and self._server_error_retries < self.MAX_SERVER_ERROR_RETRIES
+            ):
                 # HTTP 500 - Internal server error
                 # It is possible that the server is in a bad state (and will recover on restart),
-                # in which case we want to retry. I hope this can never caused by a bad payload.
+                # in which case we want to retry. In case it's caused by the payload, the request
+                # is dropped after a few retries so it can't block the queue forever.
+                self.metrics.record_error("500", retried=True)
                 logger.error(f"Internal server error, retrying: {request.data}")
-                sleep(0.5)
+                self.wait(0.5 * 2**self._server_error_retries)
+                self._server_error_retries += 1
                 return
+            elif e.response is not None and e.response.status_code == 500:
+                self.metrics.record_error("500", retried=False)
+                logger.error(
+                    f"Internal server error, not retrying after {self._server_error_retries} retries: {request.data}"
+                )
             else:
+                self.metrics.record_error("other", retried=False)
                 logger.exception(f"Unknown error, not retrying: {request.data}")
         except Exception:
+            self.metrics.record_error("other", retried=False)
             logger.exception(f"Unknown error, not retrying: {request.data}")
 
         # Mark the request as done
@@ -549,6 +876,8 @@ class RequestQueue(threading.Thread):
         while not self.should_stop():
             # Connect
             while not self._try_connect():
+                self._on_tick()
+                self.metrics.export_due()
                 logger.warning(
                     f"Not connected to server, {self._persistqueue.qsize()} requests in queue"
                 )
@@ -570,6 +899,7 @@ class RequestQueue(threading.Thread):
         assert "/heartbeat" in endpoint
         assert isinstance(data, dict)
         self._persistqueue.put(QueuedRequest(endpoint, data))
+        self.metrics.record_enqueue()
 
     def register_bucket(self, bucket_id: str, event_type: str) -> None:
         bucket = Bucket(bucket_id, event_type)
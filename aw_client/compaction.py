@@ -0,0 +1,171 @@
+"""
+Compaction of old events in high-resolution buckets.
+
+Watchers send heartbeats which end up as many short events, and years of them
+slow down every `get_events` and query. Compaction rewrites the events older
+than a cutoff, merging consecutive events with the same data (with the same
+rules as heartbeats, see `premerge.merge_heartbeats`) and optionally filling
+gaps of up to `pulsetime` seconds between them, which lowers the resolution.
+
+Buckets are compacted one time window at a time (see `streaming`). The
+compacted events of a window are inserted before the originals are deleted,
+so nothing is lost if compaction is interrupted, and with a checkpoint file
+it resumes from the last finished window.
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import (
+    TYPE_CHECKING,
+    List,
+    Optional,
+    Tuple,
+)
+
+from aw_core.models import Event
+
+from .premerge import merge_heartbeats
+from .records import EventRecord
+from .streaming import EventStream, bucket_range
+from .timestamps import parse_timestamp
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+logger = logging.getLogger(__name__)
+
+
+def compact_events(events: List[EventRecord], pulsetime: float = 0) -> List[Event]:
+    """Merges consecutive events with the same data, if the gap between them is at most `pulsetime` seconds."""
+    return merge_heartbeats(
+        sorted((e.to_event() for e in events), key=lambda e: e.timestamp), pulsetime
+    )
+
+
+@dataclass
+class CompactionResult:
+    events_before: int = 0
+    events_after: int = 0
+    # Time dropped because of min_duration, in seconds
+    dropped_duration: float = 0.0
+    # The time up to which the bucket has been compacted
+    done_until: Optional[datetime] = None
+
+    @property
+    def ratio(self) -> float:
+        """The fraction of events left after compaction."""
+        return self.events_after / self.events_before if self.events_before else 1.0
+
+
+class _Checkpoint:
+    """Keeps the time up to which a bucket has been compacted in a small JSON file."""
+
+    def __init__(self, path: str, bucket_id: str) -> None:
+        self.path = path
+        self.bucket_id = bucket_id
+
+    def load(self) -> Optional[datetime]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("bucket_id") != self.bucket_id:
+            logger.warning(f"Ignoring checkpoint {self.path} of another bucket")
+            return None
+        return parse_timestamp(state["done_until"])
+
+    def save(self, done_until: datetime) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"bucket_id": self.bucket_id, "done_until": done_until.isoformat()}, f
+            )
+        os.replace(tmp_path, self.path)
+
+
+def compact_bucket(
+    client: "ActivityWatchClient",
+    bucket_id: str,
+    older_than: timedelta = timedelta(days=30),
+    pulsetime: float = 0,
+    min_duration: float = 0,
+    window: timedelta = timedelta(days=1),
+    checkpoint_path: Optional[str] = None,
+    dry_run: bool = False,
+    now: Optional[datetime] = None,
+) -> CompactionResult:
+    """
+    Compacts the events of a bucket older than `older_than`, see `compact_events`.
+
+    Compacted events shorter than `min_duration` seconds are dropped. With
+    `dry_run`, nothing is changed but the result estimates how many events
+    would be left. If `checkpoint_path` is given, progress is saved to it
+    after each window, and a later call for the same bucket resumes from
+    there. Events crossing the cutoff are left as they are.
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - older_than
+    start, _ = bucket_range(client, bucket_id)
+
+    checkpoint = _Checkpoint(checkpoint_path, bucket_id) if checkpoint_path else None
+    if checkpoint is not None:
+        start = checkpoint.load() or start
+
+    result = CompactionResult(done_until=start)
+    if start >= cutoff:
+        return result
+
+    stream = EventStream(client, bucket_id, start, cutoff, window)
+    for window_end, events in stream.windows():
+        # Events ending at the cutoff might continue after it, and are clipped
+        events = [e for e in events if e.timestamp + e.duration < cutoff]
+        compacted = []
+        for e in compact_events(events, pulsetime):
+            if e.duration.total_seconds() >= min_duration:
+                compacted.append(e)
+            else:
+                result.dropped_duration += e.duration.total_seconds()
+
+        result.events_before += len(events)
+        result.events_after += len(compacted)
+
+        if not dry_run and len(compacted) < len(events):
+            _rewrite(client, bucket_id, events, compacted)
+
+        # Pending events haven't been compacted yet, so resuming has to start before them
+        pending_start = stream.pending_start()
+        done_until = min(pending_start, window_end) if pending_start else window_end
+        result.done_until = done_until
+        if checkpoint is not None and not dry_run:
+            checkpoint.save(done_until)
+
+    logger.info(
+        "{} {}: {} events before, {} after".format(
+            "Would compact" if dry_run else "Compacted",
+            bucket_id,
+            result.events_before,
+            result.events_after,
+        )
+    )
+    return result
+
+
+def _rewrite(
+    client: "ActivityWatchClient",
+    bucket_id: str,
+    events: List[EventRecord],
+    compacted: List[Event],
+) -> None:
+    client.insert_events(bucket_id, compacted)
+    outcomes = client.delete_events(
+        bucket_id, [int(e.id) for e in events if e.id is not None]
+    )
+    failed: List[Tuple[int, Optional[str]]] = [
+        (event_id, error) for event_id, error in outcomes.items() if error is not None
+    ]
+    if failed:
+        raise Exception(
+            f"Failed to delete {len(failed)} compacted events, first error: {failed[0][1]}"
+        )
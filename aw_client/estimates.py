@@ -0,0 +1,103 @@
+"""
+Estimating the size of time ranges of buckets before fetching them.
+
+Knowing how many events (and roughly how many bytes) a time range holds
+allows choosing window sizes for streaming (see `streaming`) and exports, so
+that each request is neither tiny nor huge. The count comes from the count
+endpoint of the server, and the size per event from a small sample of the
+events in the range.
+"""
+
+import json
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Optional,
+)
+
+from .streaming import bucket_range
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+
+@dataclass
+class EventEstimate:
+    bucket_id: str
+    start: datetime
+    end: datetime
+    count: int
+    # The average size of the sampled events in JSON, 0 if there were none
+    bytes_per_event: float
+
+    @property
+    def approx_bytes(self) -> int:
+        return round(self.count * self.bytes_per_event)
+
+    def suggest_window(
+        self,
+        target_events: int = 10_000,
+        min_window: timedelta = timedelta(hours=1),
+        max_window: timedelta = timedelta(days=365),
+    ) -> timedelta:
+        """
+        Suggests a window size which fetches about `target_events` events per request.
+
+        Assumes the events are spread evenly over the range.
+        """
+        if self.count == 0:
+            return max_window
+        windows = math.ceil(self.count / target_events)
+        return min(max((self.end - self.start) / windows, min_window), max_window)
+
+
+def estimate_events(
+    client: "ActivityWatchClient",
+    bucket_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sample_size: int = 100,
+    bucket: Optional[dict] = None,
+) -> EventEstimate:
+    """
+    Estimates the number of events and their size in a time range of a bucket (all of it by default).
+
+    Only `sample_size` events are fetched, the most recent ones in the range.
+    Pass the metadata of the bucket as `bucket` if it has already been fetched.
+    """
+    if start is None or end is None:
+        bucket_start, bucket_end = bucket_range(client, bucket_id, bucket)
+        start = start or bucket_start
+        end = end or bucket_end
+
+    count = client.get_eventcount(bucket_id, start=start, end=end)
+    bytes_per_event = 0.0
+    if count and sample_size > 0:
+        sample = client.get_events(
+            bucket_id, limit=sample_size, start=start, end=end, raw=True
+        )
+        if sample:
+            size = sum(len(json.dumps(e.to_json_dict())) for e in sample)
+            bytes_per_event = size / len(sample)
+    return EventEstimate(bucket_id, start, end, count, bytes_per_event)
+
+
+def estimate_buckets(
+    client: "ActivityWatchClient",
+    bucket_ids: Iterable[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sample_size: int = 100,
+) -> Dict[str, EventEstimate]:
+    """Estimates the size of a time range of several buckets, see `estimate_events`."""
+    buckets = client.bucket_registry.buckets() if start is None or end is None else {}
+    return {
+        bucket_id: estimate_events(
+            client, bucket_id, start, end, sample_size, buckets.get(bucket_id)
+        )
+        for bucket_id in bucket_ids
+    }
@@ -0,0 +1,111 @@
+"""
+Streaming export of buckets to NDJSON files.
+
+`ActivityWatchClient.export_all` returns every bucket with all its events in
+a single response, so the whole export has to fit in memory (several times
+over, while decoding). Instead, `export_ndjson` fetches the events of each
+bucket in time windows (see `streaming`) and writes them to the file as they
+arrive, one JSON object per line. Several buckets are exported in parallel.
+
+Files ending in `.gz` are gzip-compressed. Each bucket is written as a
+`{"bucket": {...}}` line with its metadata, followed by one
+`{"bucket_id": ..., "event": {...}}` line per event. Lines of different
+buckets may be interleaved, but a bucket's line always comes before its
+events. See `imports` for reading the files back.
+"""
+
+import gzip
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+from .streaming import DEFAULT_WINDOW, EventStream, bucket_range
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+logger = logging.getLogger(__name__)
+
+
+def open_ndjson(path: str, mode: str = "rt") -> IO[str]:
+    """Opens an NDJSON file, which is gzip-compressed if the path ends in `.gz`."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")  # type: ignore
+    return open(path, mode, encoding="utf-8")
+
+
+class _LineWriter:
+    """Writes batches of lines to a file, from several threads."""
+
+    def __init__(self, f: IO[str]) -> None:
+        self._f = f
+        self._lock = threading.Lock()
+
+    def write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        text = "\n".join(lines) + "\n"
+        with self._lock:
+            self._f.write(text)
+
+
+def _export_bucket(
+    client: "ActivityWatchClient",
+    bucket: Dict[str, Any],
+    writer: _LineWriter,
+    window: timedelta,
+) -> int:
+    bucket_id = bucket["id"]
+    writer.write([json.dumps({"bucket": bucket})])
+
+    start, end = bucket_range(client, bucket_id, bucket)
+    n = 0
+    dumps = json.dumps
+    for _, events in EventStream(client, bucket_id, start, end, window).windows():
+        writer.write(
+            [dumps({"bucket_id": bucket_id, "event": e.to_json_dict()}) for e in events]
+        )
+        n += len(events)
+    logger.info(f"Exported {n} events from {bucket_id}")
+    return n
+
+
+def export_ndjson(
+    client: "ActivityWatchClient",
+    path: str,
+    bucket_ids: Optional[List[str]] = None,
+    window: timedelta = DEFAULT_WINDOW,
+    max_workers: int = 4,
+) -> Dict[str, int]:
+    """
+    Exports buckets (all of them by default) to an NDJSON file, returns the number of events exported per bucket.
+
+    Memory use is bounded by `max_workers` windows of events.
+    """
+    buckets = client.bucket_registry.buckets()
+    if bucket_ids is None:
+        bucket_ids = list(buckets)
+    # The bucket metadata, without the (otherwise possibly included) events
+    selected = [
+        {k: v for k, v in buckets[bucket_id].items() if k != "events"}
+        for bucket_id in bucket_ids
+    ]
+
+    with open_ndjson(path, "wt") as f:
+        writer = _LineWriter(f)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            counts = executor.map(
+                lambda bucket: _export_bucket(client, bucket, writer, window),
+                selected,
+            )
+            return dict(zip(bucket_ids, counts))
@@ -0,0 +1,246 @@
+"""
+Chunked, resumable import of exported buckets.
+
+`ActivityWatchClient.import_bucket` posts a whole bucket with all its events
+in one request, which for large buckets hits request size limits or times
+out, and has to start over on failure. `import_file` instead creates each
+bucket first and then uploads its events in chunks, several at a time.
+
+Event IDs are dropped before uploading, since the server's IDs are global:
+inserting an event with an existing ID would replace that event, even if it
+belongs to another bucket. Instead, progress is saved to a sidecar file (the
+import path with `.progress` appended) after each chunk, so an interrupted
+import resumes without uploading any event twice.
+
+NDJSON files written by `export.export_ndjson` are read incrementally, while
+JSON exports (as returned by `export_all`) have to be loaded in full.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .export import open_ndjson
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+logger = logging.getLogger(__name__)
+
+# ("bucket", bucket metadata) or ("event", (bucket_id, event))
+ExportItem = Tuple[str, Any]
+
+# Called with (bucket_id, number of events imported so far) after each chunk
+ProgressCallback = Callable[[str, int], None]
+
+
+def read_export(path: str) -> Iterator[ExportItem]:
+    """Reads the buckets and events of an NDJSON or JSON export, each bucket before its events."""
+    with open_ndjson(path) as f:
+        first_line = f.readline()
+        try:
+            first = json.loads(first_line)
+        except json.JSONDecodeError:
+            first = None
+
+        if isinstance(first, dict) and "bucket" in first:
+            for line in _chain([first_line], f):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "bucket" in item:
+                    yield "bucket", item["bucket"]
+                else:
+                    yield "event", (item["bucket_id"], item["event"])
+            return
+
+        export = json.loads(first_line + f.read())
+
+    for bucket_id, bucket in export["buckets"].items():
+        events = bucket.pop("events", [])
+        yield "bucket", {**bucket, "id": bucket_id}
+        for e in events:
+            yield "event", (bucket_id, e)
+
+
+def _chain(first: List[str], rest: Iterator[str]) -> Iterator[str]:
+    yield from first
+    yield from rest
+
+
+class _ImportProgress:
+    """
+    The buckets created, and the events uploaded per bucket, saved to a JSON file.
+
+    Events are identified by their position in their bucket. `done` is the number
+    of events uploaded in order, and `uploaded` has the [start, end) ranges of
+    positions uploaded after a chunk which hasn't finished (yet).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.created: Set[str] = set()
+        self.done: Dict[str, int] = {}
+        self.uploaded: Dict[str, List[List[int]]] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.created = set(state["created"])
+            self.done = state["done"]
+            self.uploaded = state.get("uploaded", {})
+            logger.info(f"Resuming import from {path}")
+
+    def add_created(self, bucket_id: str) -> None:
+        with self._lock:
+            self.created.add(bucket_id)
+            self._save()
+
+    def set_done(self, bucket_id: str, done: int, uploaded: List[List[int]]) -> None:
+        with self._lock:
+            self.done[bucket_id] = done
+            if uploaded:
+                self.uploaded[bucket_id] = uploaded
+            else:
+                self.uploaded.pop(bucket_id, None)
+            self._save()
+
+    def _save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            state: Dict[str, Any] = {"created": sorted(self.created), "done": self.done}
+            if self.uploaded:
+                state["uploaded"] = self.uploaded
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+class _BucketUploads:
+    """Tracks the chunks of a bucket, which may finish out of order."""
+
+    def __init__(self, done: int, uploaded: List[List[int]]) -> None:
+        self.done = done
+        # Start position -> size of the chunks which finished before an earlier chunk
+        self.finished: Dict[int, int] = {start: end - start for start, end in uploaded}
+
+    def is_uploaded(self, position: int) -> bool:
+        return position < self.done or any(
+            start <= position < start + size for start, size in self.finished.items()
+        )
+
+    def finish(self, start: int, size: int) -> None:
+        self.finished[start] = size
+        # Only count chunks as done once all chunks before them are
+        while self.done in self.finished:
+            self.done += self.finished.pop(self.done)
+
+    def ranges(self) -> List[List[int]]:
+        return sorted([start, start + size] for start, size in self.finished.items())
+
+
+def import_file(
+    client: "ActivityWatchClient",
+    path: str,
+    chunk_size: int = 1000,
+    max_workers: int = 4,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, int]:
+    """
+    Imports the buckets of an export file, returns the number of events imported per bucket.
+
+    Buckets which already exist on the server (and weren't created by this
+    import) are skipped, like the server does for `import_bucket`. Events are
+    inserted without their IDs, see the module docstring. The progress file
+    is removed once the import is complete.
+    """
+    state = _ImportProgress(path + ".progress")
+    existing = set(client.bucket_registry.buckets())
+    skipped: Set[str] = set()
+    uploads: Dict[str, _BucketUploads] = {}
+    seen: Dict[str, int] = defaultdict(int)
+    # The events to upload of each bucket, and the position of the first one
+    buffers: Dict[str, List[dict]] = defaultdict(list)
+    buffer_starts: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def upload(bucket_id: str, start: int, chunk: List[dict]) -> None:
+        client._post(f"buckets/{bucket_id}/events", chunk)
+        with lock:
+            bucket = uploads[bucket_id]
+            bucket.finish(start, len(chunk))
+            done = bucket.done
+            state.set_done(bucket_id, done, bucket.ranges())
+        if progress:
+            progress(bucket_id, done)
+
+    in_flight: Set[Future] = set()
+
+    def submit(executor: ThreadPoolExecutor, bucket_id: str) -> None:
+        chunk, buffers[bucket_id] = buffers[bucket_id], []
+        start = buffer_starts.pop(bucket_id)
+        in_flight.add(executor.submit(upload, bucket_id, start, chunk))
+        # Bound the number of chunks kept in memory
+        while len(in_flight) >= 2 * max_workers:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                in_flight.remove(future)
+                future.result()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for kind, item in read_export(path):
+            if kind == "bucket":
+                bucket_id = item["id"]
+                if bucket_id in existing and bucket_id not in state.created:
+                    logger.warning(f"Bucket {bucket_id} already exists, skipping it")
+                    skipped.add(bucket_id)
+                    continue
+                if bucket_id not in existing:
+                    client.import_bucket({**item, "events": []})
+                    state.add_created(bucket_id)
+                uploads[bucket_id] = _BucketUploads(
+                    state.done.get(bucket_id, 0), state.uploaded.get(bucket_id, [])
+                )
+                continue
+
+            bucket_id, event = item
+            if bucket_id in skipped:
+                continue
+            position = seen[bucket_id]
+            seen[bucket_id] += 1
+            with lock:
+                uploaded = uploads[bucket_id].is_uploaded(position)
+            if uploaded:
+                # Uploaded by a previous, interrupted import. Chunks must cover
+                # consecutive events, so the events before this one are sent.
+                if buffers[bucket_id]:
+                    submit(executor, bucket_id)
+                continue
+            buffer_starts.setdefault(bucket_id, position)
+            buffers[bucket_id].append({k: v for k, v in event.items() if k != "id"})
+            if len(buffers[bucket_id]) >= chunk_size:
+                submit(executor, bucket_id)
+
+        for bucket_id, buffer in list(buffers.items()):
+            if buffer:
+                submit(executor, bucket_id)
+        for future in in_flight:
+            future.result()
+
+    os.remove(state.path)
+    counts = {bucket_id: bucket.done for bucket_id, bucket in uploads.items()}
+    logger.info(f"Imported {sum(counts.values())} events into {len(counts)} buckets")
+    return counts
@@ -0,0 +1,188 @@
+"""
+Checking for overlap between buckets, and merging them.
+
+Useful to fix duplicate buckets caused by a changing hostname, see
+`examples/merge_buckets.py`. Both buckets are streamed in time windows (see
+`streaming`), and their events are reduced to sorted interval arrays (see
+`intervals`), so large buckets can be compared and merged in
+O((n + m) log n) time with memory bounded by a window.
+"""
+
+import logging
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from aw_core.models import Event
+
+from .intervals import Intervals, intersection, normalize, sum_durations
+from .records import EventRecord
+from .streaming import DEFAULT_WINDOW, EventStream, bucket_range, iter_windows
+from .timestamps import EPOCH, epoch_us
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+logger = logging.getLogger(__name__)
+
+
+def _to_intervals(events: Iterable[EventRecord]) -> Intervals:
+    intervals = Intervals()
+    for e in events:
+        start = epoch_us(e.timestamp)
+        intervals.append(start, start + round(e.duration_seconds * 1_000_000))
+    return normalize(intervals)
+
+
+def _extend(intervals: Intervals, other: Intervals) -> None:
+    """Appends sorted, disjoint intervals which start after `intervals`, joining touching ones."""
+    for start, end in other:
+        if intervals.ends and intervals.ends[-1] >= start:
+            intervals.ends[-1] = max(intervals.ends[-1], end)
+        else:
+            intervals.append(start, end)
+
+
+def _merged_range(
+    client: "ActivityWatchClient",
+    bucket_ids: Tuple[str, str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+) -> Tuple[datetime, datetime]:
+    if start is None or end is None:
+        buckets = client.bucket_registry.buckets()
+        ranges = [
+            bucket_range(client, bucket_id, buckets[bucket_id])
+            for bucket_id in bucket_ids
+        ]
+        start = start or min(r[0] for r in ranges)
+        end = end or max(r[1] for r in ranges)
+    return start, end
+
+
+@dataclass
+class OverlapReport:
+    """The time covered by the events of two buckets, and where they overlap."""
+
+    src_duration: float = 0.0
+    dest_duration: float = 0.0
+    overlap: Intervals = field(default_factory=Intervals)
+
+    @property
+    def overlap_duration(self) -> float:
+        return sum_durations(self.overlap)
+
+    def spans(self) -> List[Tuple[datetime, datetime]]:
+        """Returns the overlapping spans as (start, end) pairs."""
+        return [
+            (EPOCH + timedelta(microseconds=s), EPOCH + timedelta(microseconds=e))
+            for s, e in self.overlap
+        ]
+
+
+def find_overlap(
+    client: "ActivityWatchClient",
+    src_id: str,
+    dest_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    window: timedelta = DEFAULT_WINDOW,
+) -> OverlapReport:
+    """
+    Finds the spans of time covered by events in both buckets.
+
+    Durations are of the time covered by each bucket, so time covered by
+    several (overlapping) events of the same bucket is only counted once.
+    """
+    start, end = _merged_range(client, (src_id, dest_id), start, end)
+    report = OverlapReport()
+    for (_, _, src_events), (_, _, dest_events) in zip(
+        iter_windows(client, src_id, start, end, window),
+        iter_windows(client, dest_id, start, end, window),
+    ):
+        src = _to_intervals(src_events)
+        dest = _to_intervals(dest_events)
+        report.src_duration += sum_durations(src)
+        report.dest_duration += sum_durations(dest)
+        _extend(report.overlap, intersection(src, dest))
+    return report
+
+
+@dataclass
+class MergeResult:
+    inserted: int = 0
+    skipped: int = 0
+    skipped_duration: float = 0.0
+
+
+def merge_buckets(
+    client: "ActivityWatchClient",
+    src_id: str,
+    dest_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    window: timedelta = DEFAULT_WINDOW,
+    chunk_size: int = 1000,
+    dry_run: bool = False,
+) -> MergeResult:
+    """
+    Inserts the events of the source bucket into the destination bucket, skipping those which overlap an event in it.
+
+    Events are inserted in chunks of `chunk_size`, without their IDs (which
+    would otherwise replace the destination events with the same IDs). With
+    `dry_run` nothing is inserted, but the result is the same.
+    """
+    start, end = _merged_range(client, (src_id, dest_id), start, end)
+    result = MergeResult()
+    chunk: List[Event] = []
+
+    def flush() -> None:
+        if chunk and not dry_run:
+            client.insert_events(dest_id, chunk)
+        result.inserted += len(chunk)
+        chunk.clear()
+
+    src = EventStream(client, src_id, start, end, window)
+    dest_windows = iter_windows(client, dest_id, start, end, window)
+    # The time covered by the destination bucket, from the earliest pending source event up to the current window
+    dest = Intervals()
+    for window_end, events in src.windows():
+        for _, dest_window_end, dest_events in dest_windows:
+            _extend(dest, _to_intervals(dest_events))
+            if dest_window_end >= window_end:
+                break
+
+        for e in events:
+            e_start = epoch_us(e.timestamp)
+            e_end = e_start + round(e.duration_seconds * 1_000_000)
+            i = bisect_right(dest.ends, e_start)
+            # Zero-duration events overlap if they are within a destination event
+            if i < len(dest) and dest.starts[i] < max(e_end, e_start + 1):
+                result.skipped += 1
+                result.skipped_duration += e.duration_seconds
+                continue
+            chunk.append(Event(timestamp=e.timestamp, duration=e.duration, data=e.data))
+            if len(chunk) >= chunk_size:
+                flush()
+
+        # Later source events end after the window, or are pending and start at pending_start
+        pending_start = src.pending_start()
+        keep_from = epoch_us(
+            min(pending_start, window_end) if pending_start else window_end
+        )
+        i = bisect_right(dest.ends, keep_from)
+        if i:
+            dest = Intervals(dest.starts[i:], dest.ends[i:])
+
+    flush()
+    logger.info(
+        f"Merged {result.inserted} events from {src_id} into {dest_id}, skipped {result.skipped} overlapping events"
+    )
+    return result
@@ -0,0 +1,203 @@
+"""
+Metrics for the request queue.
+
+Counters are plain attribute increments so recording is cheap enough for the
+hot path. Derived values (rates, queue depth, histograms) are only computed
+when a snapshot is taken, which happens when exporting. Rates are computed
+from the counters saved by earlier snapshots, so they reflect the recent
+throughput rather than the average since the queue was started.
+"""
+
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from time import monotonic, time
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+Snapshot = Dict[str, Any]
+Exporter = Callable[[Snapshot], None]
+
+# Causes of failed requests, as handled by RequestQueue._dispatch_request
+ERROR_CAUSES = ("ConnectTimeout", "400", "500", "other")
+
+
+class QueueMetrics:
+    """Counters, gauges and a latency histogram for a request queue.
+
+    Exporters are callables which receive a snapshot (see `snapshot`) every
+    `interval` seconds, driven by the request queue thread. Use
+    `to_prometheus` to get the metrics in the Prometheus text format.
+
+    The enqueue and drain rates are averaged since the latest snapshot that is
+    at least `RATE_WINDOW` seconds old (or since the start, if there is none).
+    """
+
+    # Upper bounds (in seconds) of the request latency histogram buckets
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    # Seconds over which the enqueue and drain rates are computed
+    RATE_WINDOW = 60.0
+
+    def __init__(self) -> None:
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.errors: Dict[str, int] = {cause: 0 for cause in ERROR_CAUSES}
+        self.retries: Dict[str, int] = {cause: 0 for cause in ERROR_CAUSES}
+
+        # One count per bucket in LATENCY_BUCKETS, plus one for +Inf
+        self.latency_counts = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+        self.last_success: Optional[float] = None
+        # (time, enqueued, sent) at earlier snapshots, for computing rates
+        self._samples: Deque[Tuple[float, int, int]] = deque([(monotonic(), 0, 0)])
+        self._samples_lock = threading.Lock()
+        self._queue_size: Callable[[], int] = lambda: 0
+
+        self._exporters: List[List[Any]] = []  # [exporter, interval, last_export]
+
+    def bind_queue(self, queue_size: Callable[[], int]) -> None:
+        """Set the function used to get the current queue depth."""
+        self._queue_size = queue_size
+
+    def record_enqueue(self) -> None:
+        self.enqueued += 1
+
+    def record_sent(self, latency: float) -> None:
+        self.sent += 1
+        self.latency_counts[bisect_left(self.LATENCY_BUCKETS, latency)] += 1
+        self.latency_sum += latency
+        self.last_success = time()
+
+    def record_error(self, cause: str, retried: bool) -> None:
+        self.errors[cause] += 1
+        if retried:
+            self.retries[cause] += 1
+        else:
+            self.dropped += 1
+
+    def _rates(self, enqueued: int, sent: int) -> Tuple[float, float]:
+        now = monotonic()
+        with self._samples_lock:
+            samples = self._samples
+            # Keep the newest sample which is at least a window old as the baseline
+            while len(samples) > 1 and samples[1][0] <= now - self.RATE_WINDOW:
+                samples.popleft()
+            since, enqueued_before, sent_before = samples[0]
+            samples.append((now, enqueued, sent))
+
+        elapsed = now - since
+        if not elapsed:
+            return 0.0, 0.0
+        return (enqueued - enqueued_before) / elapsed, (sent - sent_before) / elapsed
+
+    def snapshot(self) -> Snapshot:
+        enqueued, sent = self.enqueued, self.sent
+        enqueue_rate, drain_rate = self._rates(enqueued, sent)
+        return {
+            "queue_depth": self._queue_size(),
+            "enqueued": enqueued,
+            "sent": sent,
+            "dropped": self.dropped,
+            "enqueue_rate": enqueue_rate,
+            "drain_rate": drain_rate,
+            "errors": dict(self.errors),
+            "retries": dict(self.retries),
+            "latency_buckets": dict(
+                zip(
+                    [*map(str, self.LATENCY_BUCKETS), "+Inf"],
+                    self.latency_counts,
+                )
+            ),
+            "latency_sum": self.latency_sum,
+            "seconds_since_last_success": (
+                time() - self.last_success if self.last_success is not None else None
+            ),
+        }
+
+    def to_prometheus(self, prefix: str = "aw_client_queue") -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        s = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_depth gauge",
+            f"{prefix}_depth {s['queue_depth']}",
+            f"# TYPE {prefix}_enqueued_total counter",
+            f"{prefix}_enqueued_total {s['enqueued']}",
+            f"# TYPE {prefix}_sent_total counter",
+            f"{prefix}_sent_total {s['sent']}",
+            f"# TYPE {prefix}_dropped_total counter",
+            f"{prefix}_dropped_total {s['dropped']}",
+            f"# TYPE {prefix}_errors_total counter",
+            *(
+                f'{prefix}_errors_total{{cause="{cause}"}} {n}'
+                for cause, n in s["errors"].items()
+            ),
+            f"# TYPE {prefix}_retries_total counter",
+            *(
+                f'{prefix}_retries_total{{cause="{cause}"}} {n}'
+                for cause, n in s["retries"].items()
+            ),
+            f"# TYPE {prefix}_request_latency_seconds histogram",
+        ]
+        cumulative = 0
+        for le, n in s["latency_buckets"].items():
+            cumulative += n
+            lines.append(
+                f'{prefix}_request_latency_seconds_bucket{{le="{le}"}} {cumulative}'
+            )
+        lines += [
+            f"{prefix}_request_latency_seconds_sum {s['latency_sum']}",
+            f"{prefix}_request_latency_seconds_count {cumulative}",
+        ]
+        if s["seconds_since_last_success"] is not None:
+            lines += [
+                f"# TYPE {prefix}_seconds_since_last_success gauge",
+                f"{prefix}_seconds_since_last_success {s['seconds_since_last_success']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def add_exporter(self, exporter: Exporter, interval: float = 60) -> None:
+        """Register an exporter to be called with a snapshot every `interval` seconds."""
+        self._exporters.append([exporter, interval, monotonic()])
+
+    def export_due(self) -> None:
+        """Call the exporters whose interval has passed since they were last called."""
+        if not self._exporters:
+            return
+
+        now = monotonic()
+        for entry in self._exporters:
+            exporter, interval, last_export = entry
+            if now - last_export >= interval:
+                entry[2] = now
+                try:
+                    exporter(self.snapshot())
+                except Exception:
+                    logger.exception("Failed to export queue metrics")
+
+
+def log_summary(snapshot: Snapshot) -> None:
+    """Exporter which logs a one-line summary of the queue metrics."""
+    since_success = snapshot["seconds_since_last_success"]
+    logger.info(
+        "Request queue: {} queued, {} sent ({:.2f}/s), {} dropped, {} retried, last success {}".format(
+            snapshot["queue_depth"],
+            snapshot["sent"],
+            snapshot["drain_rate"],
+            snapshot["dropped"],
+            sum(snapshot["retries"].values()),
+            f"{since_success:.0f}s ago" if since_success is not None else "never",
+        )
+    )
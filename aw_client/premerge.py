@@ -0,0 +1,314 @@
+"""
+Client-side pre-merging of queued heartbeats.
+
+Heartbeats are merged locally (with the same rules as aw-server) and only
+committed to the request queue once the merged event grows longer than the
+commit interval, the data changes, or the pending merge gets too old.
+
+Pending heartbeats can optionally be checkpointed to a small SQLite file, so
+that they survive the watcher being killed and are committed on restart.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from datetime import timedelta
+from time import monotonic
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Iterable,
+    Optional,
+    Tuple,
+)
+
+from aw_core.models import Event
+from aw_transform.heartbeats import heartbeat_merge
+
+logger = logging.getLogger(__name__)
+
+# Called with (bucket_id, pulsetime, event) whenever a merged heartbeat is committed
+CommitCallback = Callable[[str, float, Event], None]
+
+
+def merge_heartbeats(events: Iterable[Event], pulsetime: float) -> List[Event]:
+    """
+    Merges a batch of heartbeats, sorted by timestamp, in a single pass.
+
+    Gives the same result as applying `heartbeat_merge` (the rules used by
+    aw-server) to each heartbeat in turn, but without the quadratic cost of
+    `aw_transform.heartbeat_reduce` and without mutating the input events.
+    """
+    pulse = timedelta(seconds=pulsetime)
+    merged: List[Event] = []
+
+    # The heartbeat currently being merged into, and the end of the merge
+    last: Optional[Event] = None
+    last_end = None
+
+    def _append() -> None:
+        if last is not None and last_end is not None:
+            duration = max(last_end - last.timestamp, last.duration)
+            merged.append(
+                Event(timestamp=last.timestamp, duration=duration, data=last.data)
+            )
+
+    for event in events:
+        end = event.timestamp + event.duration
+        if (
+            last is not None
+            and last_end is not None
+            and event.data == last.data
+            and last.timestamp <= event.timestamp <= last_end + pulse
+            and last.duration >= timedelta(0)
+        ):
+            # Taking the max ensures heartbeats that end before the merge don't shorten it
+            if end > last_end:
+                last_end = end
+            continue
+
+        _append()
+        last, last_end = event, end
+
+    _append()
+    return merged
+
+
+class HeartbeatCheckpoint:
+    """Persists the pending heartbeat of each bucket as one upserted SQLite row.
+
+    The file is only opened when first used, so clients which never queue
+    heartbeats don't create one.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Autocommit, all access is serialized by the lock in HeartbeatPremerger
+            conn = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            # WAL with synchronous=NORMAL makes each upsert a cheap append,
+            # and is still safe if the process (but not the OS) crashes.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending "
+                "(bucket_id TEXT PRIMARY KEY, pulsetime REAL NOT NULL, event TEXT NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def save(self, bucket_id: str, pulsetime: float, event: Event) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO pending (bucket_id, pulsetime, event) VALUES (?, ?, ?)",
+            (bucket_id, pulsetime, event.to_json_str()),
+        )
+
+    def remove(self, bucket_id: str) -> None:
+        self._connection().execute(
+            "DELETE FROM pending WHERE bucket_id = ?", (bucket_id,)
+        )
+
+    def load(self) -> List[Tuple[str, float, Event]]:
+        rows = self._connection().execute(
+            "SELECT bucket_id, pulsetime, event FROM pending"
+        )
+        return [
+            (bucket_id, pulsetime, Event(**json.loads(event)))
+            for bucket_id, pulsetime, event in rows
+        ]
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class HeartbeatPremerger:
+    """Holds the pending pre-merged heartbeat of each bucket.
+
+    Pending heartbeats are scheduled on a timer wheel (a dict of slots keyed
+    by tick), so a bucket that stops receiving heartbeats is still committed
+    at most `max_age` seconds (plus one tick) after its merge was started.
+    Scheduling and expiry are O(1) per bucket, which keeps the overhead
+    independent of the number of buckets.
+
+    If a `checkpoint` is given, every change to a pending heartbeat is saved
+    to it, and `recover` commits the heartbeats left behind by a previous
+    process which didn't get to flush them. Recovery also happens on the
+    first heartbeat, so the checkpoint is never opened by processes which
+    don't send any.
+    """
+
+    def __init__(
+        self,
+        commit: CommitCallback,
+        commit_interval: float,
+        max_age: Optional[float] = None,
+        tick: float = 1.0,
+        checkpoint: Optional[HeartbeatCheckpoint] = None,
+    ) -> None:
+        self._commit = commit
+        self._checkpoint = checkpoint
+        self.commit_interval = commit_interval
+        self.max_age = max_age if max_age is not None else commit_interval
+        self._tick = tick
+
+        # Dict of each last (pending) heartbeat in each bucket
+        self.pending: Dict[str, Event] = {}
+        self._pulsetimes: Dict[str, float] = {}
+
+        # Timer wheel: tick -> bucket ids scheduled to expire at that tick
+        self._slots: Dict[int, List[str]] = {}
+        self._deadlines: Dict[str, int] = {}
+        self._cursor = self._now_tick()
+        self._recovered = checkpoint is None
+
+        self._lock = threading.Lock()
+
+    def _now_tick(self, now: Optional[float] = None) -> int:
+        return int((monotonic() if now is None else now) / self._tick)
+
+    def _schedule(self, bucket_id: str, max_age: float) -> None:
+        deadline = self._now_tick() + max(1, int(max_age / self._tick))
+        self._deadlines[bucket_id] = deadline
+        self._slots.setdefault(deadline, []).append(bucket_id)
+
+    def _save(self, bucket_id: str) -> None:
+        if self._checkpoint is not None:
+            self._checkpoint.save(
+                bucket_id, self._pulsetimes[bucket_id], self.pending[bucket_id]
+            )
+
+    def _set_pending(self, bucket_id: str, event: Event, max_age: float) -> None:
+        self.pending[bucket_id] = event
+        self._schedule(bucket_id, max_age)
+        self._save(bucket_id)
+
+    def _flush(self, bucket_id: str) -> None:
+        # Caller must hold the lock
+        event = self.pending.pop(bucket_id, None)
+        self._deadlines.pop(bucket_id, None)
+        if event is not None:
+            self._commit(bucket_id, self._pulsetimes[bucket_id], event)
+            if self._checkpoint is not None:
+                self._checkpoint.remove(bucket_id)
+
+    def heartbeat(
+        self,
+        bucket_id: str,
+        event: Event,
+        pulsetime: float,
+        commit_interval: Optional[float] = None,
+    ) -> None:
+        """Merge a heartbeat into the pending heartbeat of the bucket, committing if needed."""
+        _commit_interval = commit_interval or self.commit_interval
+        _max_age = commit_interval or self.max_age
+
+        self.flush_expired()
+        with self._lock:
+            if not self._recovered:
+                self._recover()
+            self._pulsetimes[bucket_id] = pulsetime
+
+            if bucket_id not in self.pending:
+                self._set_pending(bucket_id, event, _max_age)
+                return
+
+            last_heartbeat = self.pending[bucket_id]
+
+            merge = heartbeat_merge(last_heartbeat, event, pulsetime)
+
+            if merge:
+                # If last_heartbeat becomes longer than commit_interval
+                # then commit, else cache merged.
+                diff = (last_heartbeat.duration).total_seconds()
+                if diff >= _commit_interval:
+                    self._commit(bucket_id, pulsetime, merge)
+                    self._set_pending(bucket_id, event, _max_age)
+                else:
+                    self.pending[bucket_id] = merge
+                    self._save(bucket_id)
+            else:
+                self._commit(bucket_id, pulsetime, last_heartbeat)
+                self._set_pending(bucket_id, event, _max_age)
+
+    def flush_expired(self, now: Optional[float] = None) -> None:
+        """Commit all pending heartbeats which are older than their max age."""
+        now_tick = self._now_tick(now)
+        if now_tick < self._cursor:
+            # Fast path: this tick has already been processed
+            return
+
+        with self._lock:
+            if now_tick - self._cursor > len(self._slots):
+                # Long gap since last expiry, cheaper to look at the occupied slots
+                due = sorted(t for t in self._slots if t <= now_tick)
+            else:
+                due = [t for t in range(self._cursor, now_tick + 1) if t in self._slots]
+
+            for t in due:
+                for bucket_id in self._slots.pop(t):
+                    # Buckets which have been committed (and perhaps rescheduled)
+                    # since being put in this slot have a different deadline.
+                    if self._deadlines.get(bucket_id) == t:
+                        logger.debug(
+                            f"Flushing expired pre-merged heartbeat: {bucket_id}"
+                        )
+                        self._flush(bucket_id)
+            self._cursor = now_tick + 1
+
+    def take(self, bucket_id: str) -> Optional[Event]:
+        """Remove and return the pending heartbeat of a bucket without committing it, so it can be sent some other way."""
+        with self._lock:
+            event = self.pending.pop(bucket_id, None)
+            self._deadlines.pop(bucket_id, None)
+            if event is not None and self._checkpoint is not None:
+                self._checkpoint.remove(bucket_id)
+            return event
+
+    def restore(self, bucket_id: str, event: Event) -> None:
+        """Put back a heartbeat returned by `take` which couldn't be sent."""
+        with self._lock:
+            if bucket_id in self.pending:
+                # Newer heartbeats have been merged since, so it can't be pending again
+                self._commit(bucket_id, self._pulsetimes[bucket_id], event)
+            else:
+                self._set_pending(bucket_id, event, self.max_age)
+
+    def flush_all(self) -> None:
+        """Commit all pending heartbeats, regardless of age."""
+        with self._lock:
+            for bucket_id in list(self.pending):
+                self._flush(bucket_id)
+            self._slots.clear()
+
+    def recover(self) -> None:
+        """Commit the pending heartbeats saved in the checkpoint by a previous process."""
+        with self._lock:
+            self._recover()
+
+    def _recover(self) -> None:
+        # Caller must hold the lock
+        self._recovered = True
+        if self._checkpoint is None:
+            return
+
+        for bucket_id, pulsetime, event in self._checkpoint.load():
+            if bucket_id in self.pending:
+                continue
+            logger.info(f"Recovered pre-merged heartbeat for bucket: {bucket_id}")
+            self._commit(bucket_id, pulsetime, event)
+            self._checkpoint.remove(bucket_id)
+
+    def close(self) -> None:
+        """Close the checkpoint, it's reopened if more heartbeats are sent."""
+        with self._lock:
+            if self._checkpoint is not None:
+                self._checkpoint.close()
@@ -5,13 +5,18 @@ Most of these are from: https://github.com/ActivityWatch/aw-webui/blob/master/sr
 """
 
 import dataclasses
+import functools
 import json
 import re
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import (
+    Any,
+    Dict,
     List,
+    Mapping,
     Optional,
+    Sequence,
     Tuple,
     Union,
 )
@@ -21,6 +26,7 @@ from typing_extensions import TypeGuard
 import aw_client
 
 from .classes import get_classes
+from .query_ast import optimize_query
 
 
 class EnhancedJSONEncoder(json.JSONEncoder):
@@ -32,44 +38,71 @@ class EnhancedJSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 
+class _Rule(Dict[str, Any]):
+    """A category rule which is hashable by its content, so that it can be part of the query params."""
+
+    def __hash__(self) -> int:  # type: ignore
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash: int = hash(json.dumps(self, sort_keys=True))
+            return self._hash
+
+
+def _freeze_classes(
+    classes: Sequence[Tuple[Sequence[str], dict]],
+) -> Tuple[Tuple[Tuple[str, ...], _Rule], ...]:
+    return tuple((tuple(name), _Rule(rule)) for name, rule in classes)
+
+
 """
 Do these dataclasses look confusing?
 Read up on dataclass inheritance: https://stackoverflow.com/a/53085935/965332
+
+The params are immutable and hashable (list arguments are converted to tuples),
+so that the queries built from them can be cached.
 """
 
 
-@dataclass
+@dataclass(frozen=True)
 class _QueryParamsDefaultsBase:
-    bid_browsers: List[str] = field(default_factory=list)
-    classes: List[Tuple[List[str], dict]] = field(default_factory=list)
-    filter_classes: List[List[str]] = field(default_factory=list)
+    bid_browsers: Sequence[str] = ()
+    classes: Sequence[Tuple[Sequence[str], dict]] = ()
+    filter_classes: Sequence[Sequence[str]] = ()
     filter_afk: bool = True
     include_audible: bool = True
 
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "bid_browsers", tuple(self.bid_browsers))
+        object.__setattr__(self, "classes", _freeze_classes(self.classes))
+        object.__setattr__(
+            self, "filter_classes", tuple(tuple(c) for c in self.filter_classes)
+        )
 
-@dataclass
+
+@dataclass(frozen=True)
 class QueryParams(_QueryParamsDefaultsBase):
     pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class _DesktopQueryParamsBase:
     bid_window: str
     bid_afk: str
     always_active_pattern: Optional[str] = None
 
 
-@dataclass
+@dataclass(frozen=True)
 class DesktopQueryParams(QueryParams, _DesktopQueryParamsBase):
     pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class _AndroidQueryParamsBase:
     bid_android: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class AndroidQueryParams(QueryParams, _AndroidQueryParamsBase):
     pass
 
@@ -82,15 +115,45 @@ def isAndroidParams(params: QueryParams) -> TypeGuard[AndroidQueryParams]:
     return isinstance(params, AndroidQueryParams)
 
 
+@functools.lru_cache(maxsize=32)
+def _classes_to_str(classes: Tuple[Tuple[Tuple[str, ...], _Rule], ...]) -> str:
+    # Needs escaping for regex patterns like '\w' to work (JSON.stringify adds extra unnecessary escaping)
+    classes_str = json.dumps(classes, cls=EnhancedJSONEncoder)
+    return re.sub(r"\\\\", r"\\", classes_str)
+
+
 def canonicalEvents(params: Union[DesktopQueryParams, AndroidQueryParams]) -> str:
     if not params.classes:
         # if categories not explicitly set,
         # get categories from server settings
-        params.classes = get_classes()
+        params = dataclasses.replace(params, classes=get_classes())
+
+    return _canonicalEvents(params)
 
-    # Needs escaping for regex patterns like '\w' to work (JSON.stringify adds extra unnecessary escaping)
-    classes_str = json.dumps(params.classes, cls=EnhancedJSONEncoder)
-    classes_str = re.sub(r"\\\\", r"\\", classes_str)
+
+@functools.lru_cache(maxsize=128)
+def _canonicalEvents(params: Union[DesktopQueryParams, AndroidQueryParams]) -> str:
+    return optimize_query(_canonicalEventsText(params))
+
+
+def _canonicalEventsText(params: Union[DesktopQueryParams, AndroidQueryParams]) -> str:
+    # Escape `"`
+    if isinstance(params, DesktopQueryParams):
+        params = dataclasses.replace(
+            params,
+            bid_window=escape_doublequote(params.bid_window),
+            bid_afk=escape_doublequote(params.bid_afk),
+        )
+    else:
+        params = dataclasses.replace(
+            params, bid_android=escape_doublequote(params.bid_android)
+        )
+    params = dataclasses.replace(
+        params,
+        bid_browsers=[escape_doublequote(bucket) for bucket in params.bid_browsers],
+    )
+
+    classes_str = _classes_to_str(params.classes)
 
     cat_filter_str = json.dumps(params.filter_classes)
 
@@ -168,30 +231,33 @@ def pretty_query(query: str) -> str:
     return "\n".join([line.strip() for line in query.split("\n") if line.strip()])
 
 
-def _browser_in_buckets(browser: str, browserbuckets: List[str]) -> Optional[str]:
-    for bucket in browserbuckets:
-        if browser in bucket:
-            return bucket
-    return None
+@functools.lru_cache(maxsize=1024)
+def _browsers_in_bucket(bucket_id: str) -> Tuple[str, ...]:
+    return tuple(browser for browser in browser_appnames if browser in bucket_id)
 
 
-def browsersWithBuckets(browserbuckets: List[str]) -> List[Tuple[str, str]]:
+def browsersWithBuckets(browserbuckets: Sequence[str]) -> List[Tuple[str, str]]:
     """Returns a list of (browserName, bucketId) pairs for found browser buckets"""
-    browsername_to_bucketid: List[Tuple[str, Optional[str]]] = [
-        (browserName, _browser_in_buckets(browserName, browserbuckets))
-        for browserName in browser_appnames
+    # The first bucket of each browser, each bucket ID is only scanned once
+    bucket_by_browser: Dict[str, str] = {}
+    for bucket_id in browserbuckets:
+        for browser in _browsers_in_bucket(bucket_id):
+            bucket_by_browser.setdefault(browser, bucket_id)
+
+    # Ordered like browser_appnames
+    return [
+        (browser, bucket_by_browser[browser])
+        for browser in browser_appnames
+        if browser in bucket_by_browser
     ]
 
-    # Only return browsers for which a bucket could be found
-    return [t for t in browsername_to_bucketid if t[1]]  # type: ignore
-
 
 def browserEvents(params: DesktopQueryParams) -> str:
     """Returns a list of active browser events (where the browser was the active window) from all browser buckets"""
     code = "browser_events = [];"
 
     for browserName, bucketId in browsersWithBuckets(params.bid_browsers):
-        browser_appnames_str = json.dumps(browser_appnames[browserName])
+        browser_appnames_str = _browser_appnames_json[browserName]
         code += f"""
           events_{browserName} = flood(query_bucket("{bucketId}"));
           window_{browserName} = filter_keyvals(events, "app", {browser_appnames_str});
@@ -242,6 +308,22 @@ browser_appnames = {
     "vivaldi": ["Vivaldi-stable", "Vivaldi-snapshot", "vivaldi.exe"],
 }
 
+# Precomputed from browser_appnames, for constant-time lookups
+browser_by_appname: Dict[str, str] = {
+    appname: browser
+    for browser, appnames in browser_appnames.items()
+    for appname in appnames
+}
+_browser_appnames_json = {
+    browser: json.dumps(appnames) for browser, appnames in browser_appnames.items()
+}
+
+
+def browser_of_app(app: str) -> Optional[str]:
+    """Returns the browser an app name (as reported by aw-watcher-window) belongs to, if any."""
+    return browser_by_appname.get(app)
+
+
 default_limit = 100
 
 
@@ -253,14 +335,131 @@ def escape_doublequote(s: str) -> str:
     return s.replace('"', '\\"')
 
 
+# Maps RETURN field paths (like "window.cat_events", or sections like "window")
+# to the data keys to keep in their events, or None to keep all data keys.
+Projection = Dict[str, Optional[List[str]]]
+
+# The RETURN fields of fullDesktopQuery: the variable holding each field, and the
+# data keys its events are merged by (empty if the events aren't merged, None
+# if the field isn't a list of events).
+_desktop_return_fields: Dict[str, Tuple[str, Optional[Tuple[str, ...]]]] = {
+    "events": ("events", ()),
+    "window.app_events": ("app_events", ("app",)),
+    "window.title_events": ("title_events", ("app", "title")),
+    "window.cat_events": ("cat_events", ("$category",)),
+    "window.active_events": ("not_afk", ()),
+    "window.duration": ("duration", None),
+    "browser.domains": ("browser_domains", ("$domain",)),
+    "browser.urls": ("browser_urls", ("url",)),
+    "browser.duration": ("browser_duration", None),
+}
+
+
+def _project_fields(
+    projection: Optional[Tuple[Tuple[str, Optional[Tuple[str, ...]]], ...]],
+) -> Dict[str, str]:
+    """Returns the expression of each RETURN field to include in the query, with the projection applied."""
+    if projection is None:
+        return {path: var for path, (var, _) in _desktop_return_fields.items()}
+
+    keys_by_path = dict(projection)
+    exprs: Dict[str, str] = {}
+    for path, (var, merged_by) in _desktop_return_fields.items():
+        section = path.split(".")[0]
+        if path in keys_by_path:
+            keys = keys_by_path[path]
+        elif section in keys_by_path and keys_by_path[section] is None:
+            keys = None
+        else:
+            continue
+
+        if keys is None:
+            exprs[path] = var
+        elif merged_by is None:
+            raise ValueError(
+                f"Can't project data keys of {path}, it isn't a list of events"
+            )
+        elif not merged_by:
+            raise ValueError(
+                f"Can't project data keys of {path}, the query can only drop data keys by merging events"
+            )
+        elif not set(merged_by) <= set(keys):
+            raise ValueError(
+                f"Projected data keys of {path} must include {list(merged_by)}, which its events are merged by"
+            )
+        else:
+            # The events are already unique by these keys, so merging by them
+            # again keeps every event and only drops the other data keys.
+            exprs[path] = f"merge_events_by_keys({var}, {json.dumps(list(keys))})"
+    return exprs
+
+
+def _return_dict(fields: Dict[str, str]) -> str:
+    """Renders the RETURN statement from the expressions of its (dotted) field paths."""
+    tree: Dict[str, Any] = {}
+    for path, expr in fields.items():
+        *parents, name = path.split(".")
+        node = tree
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = expr
+
+    def render(node: Union[str, Dict[str, Any]]) -> str:
+        if isinstance(node, str):
+            return node
+        return "{" + ", ".join(f'"{k}": {render(v)}' for k, v in node.items()) + "}"
+
+    return f"RETURN = {render(tree)};"
+
+
 def fullDesktopQuery(
     params: DesktopQueryParams,
+    projection: Optional[Projection] = None,
 ) -> str:
-    # Escape `"`
-    params.bid_window = escape_doublequote(params.bid_window)
-    params.bid_afk = escape_doublequote(params.bid_afk)
-    params.bid_browsers = [escape_doublequote(bucket) for bucket in params.bid_browsers]
+    """
+    Builds the query used for the activity view in aw-webui.
+
+    If a projection is given, only the RETURN fields in it are returned, and
+    statements that are only needed for other fields are left out. Data keys
+    are projected in the query by merging the events by the projected keys, so
+    they can only be given for fields of merged events (like
+    `window.title_events`), and have to include the keys those are merged by.
+    Raises ValueError for unknown fields and keys that can't be projected.
+    """
+    if projection is not None:
+        sections = {path.split(".")[0] for path in _desktop_return_fields}
+        for path, keys in projection.items():
+            if path in _desktop_return_fields:
+                continue
+            if path not in sections:
+                raise ValueError(f"Unknown RETURN field: {path}")
+            if keys is not None:
+                raise ValueError(f"Can't project data keys of a section: {path}")
 
+    if not params.classes:
+        # Resolve the classes before caching, since they might change on the server
+        params = dataclasses.replace(params, classes=get_classes())
+
+    return _fullDesktopQuery(
+        params,
+        (
+            tuple(
+                sorted(
+                    (path, tuple(keys) if keys is not None else None)
+                    for path, keys in projection.items()
+                )
+            )
+            if projection is not None
+            else None
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _fullDesktopQuery(
+    params: DesktopQueryParams,
+    projection: Optional[Tuple[Tuple[str, Optional[Tuple[str, ...]]], ...]] = None,
+) -> str:
     # Build the base query
     query = f"""
     {canonicalEvents(params)}
@@ -292,25 +491,148 @@ def fullDesktopQuery(
         browser_duration = 0;
         """
 
-    # Add the return statement
+    # Add the return statement, with only the projected fields
+    query += _return_dict(_project_fields(projection))
+    return optimize_query(query)
+
+
+def multiHostQuery(
+    hostnames: Sequence[str],
+    classes: Sequence[Tuple[Sequence[str], dict]] = (),
+    filter_classes: Sequence[Sequence[str]] = (),
+    filter_afk: bool = True,
+    always_active_pattern: Optional[str] = None,
+    bid_browsers: Optional[Mapping[str, Sequence[str]]] = None,
+) -> str:
+    """
+    Builds a single query for the activity of several hosts.
+
+    Returns per-host aggregates under "hosts" (keyed by hostname), and the
+    aggregates of all hosts combined under "window" and "browser", like
+    fullDesktopQuery. `bid_browsers` maps hostnames to the IDs of their
+    browser buckets, hosts without any have empty browser aggregates.
+    The classes are only fetched from the server once for all hosts.
+    """
+    if not classes:
+        classes = get_classes()
+    bid_browsers = bid_browsers or {}
+    return _multiHostQuery(
+        tuple(
+            (hostname, tuple(bid_browsers.get(hostname, ()))) for hostname in hostnames
+        ),
+        _freeze_classes(classes),
+        tuple(tuple(c) for c in filter_classes),
+        filter_afk,
+        always_active_pattern,
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _multiHostQuery(
+    hosts: Tuple[Tuple[str, Tuple[str, ...]], ...],
+    classes: Tuple[Tuple[Tuple[str, ...], _Rule], ...],
+    filter_classes: Tuple[Tuple[str, ...], ...],
+    filter_afk: bool,
+    always_active_pattern: Optional[str],
+) -> str:
+    query = ""
+    host_sections = []
+    for i, (hostname, bid_browsers) in enumerate(hosts):
+        params = DesktopQueryParams(
+            bid_window=f"aw-watcher-window_{hostname}",
+            bid_afk=f"aw-watcher-afk_{hostname}",
+            bid_browsers=bid_browsers,
+            classes=classes,
+            filter_classes=filter_classes,
+            filter_afk=filter_afk,
+            always_active_pattern=always_active_pattern,
+        )
+        # The canonical events query reuses the same variable names for each host,
+        # so the results are copied into host-specific variables.
+        query += f"""
+        {canonicalEvents(params)}
+        h{i}_title_events = merge_events_by_keys(events, ["app", "title"]);
+        h{i}_cat_events = sort_by_duration(merge_events_by_keys(events, ["$category"]));
+        h{i}_app_events = sort_by_duration(merge_events_by_keys(h{i}_title_events, ["app"]));
+        h{i}_app_events = limit_events(h{i}_app_events, {default_limit});
+        h{i}_top_title_events = limit_events(sort_by_duration(h{i}_title_events), {default_limit});
+        h{i}_duration = sum_durations(events);
+        """
+        if bid_browsers:
+            # The browser events are already split into URLs by canonicalEvents
+            query += f"""
+            h{i}_browser_urls = merge_events_by_keys(browser_events, ["url"]);
+            h{i}_browser_domains = merge_events_by_keys(browser_events, ["$domain"]);
+            h{i}_top_browser_urls = limit_events(sort_by_duration(h{i}_browser_urls), {default_limit});
+            h{i}_top_browser_domains = limit_events(sort_by_duration(h{i}_browser_domains), {default_limit});
+            h{i}_browser_duration = sum_durations(browser_events);
+            """
+        else:
+            query += f"""
+            h{i}_browser_urls = [];
+            h{i}_browser_domains = [];
+            h{i}_top_browser_urls = [];
+            h{i}_top_browser_domains = [];
+            h{i}_browser_duration = 0;
+            """
+        host_sections.append(
+            f"""
+            "{escape_doublequote(hostname)}": {{
+                "app_events": h{i}_app_events,
+                "title_events": h{i}_top_title_events,
+                "cat_events": h{i}_cat_events,
+                "duration": h{i}_duration,
+                "browser": {{
+                    "domains": h{i}_top_browser_domains,
+                    "urls": h{i}_top_browser_urls,
+                    "duration": h{i}_browser_duration
+                }}
+            }}"""
+        )
+
+    # Combine the already merged per-host events, rather than merging all events again
     query += """
-        RETURN = {
-            "events": events,
-            "window": {
-                "app_events": app_events,
-                "title_events": title_events,
-                "cat_events": cat_events,
-                "active_events": not_afk,
-                "duration": duration
-            },
-            "browser": {
-                "domains": browser_domains,
-                "urls": browser_urls,
-                "duration": browser_duration
-            }
-        };
+    title_events = [];
+    cat_events = [];
+    browser_urls = [];
+    browser_domains = [];
+    """
+    for i in range(len(hosts)):
+        query += f"""
+        title_events = concat(title_events, h{i}_title_events);
+        cat_events = concat(cat_events, h{i}_cat_events);
+        browser_urls = concat(browser_urls, h{i}_browser_urls);
+        browser_domains = concat(browser_domains, h{i}_browser_domains);
+        """
+    query += f"""
+    title_events = sort_by_duration(merge_events_by_keys(title_events, ["app", "title"]));
+    app_events = sort_by_duration(merge_events_by_keys(title_events, ["app"]));
+    cat_events = sort_by_duration(merge_events_by_keys(cat_events, ["$category"]));
+    app_events = limit_events(app_events, {default_limit});
+    title_events = limit_events(title_events, {default_limit});
+    duration = sum_durations(cat_events);
+    browser_urls = sort_by_duration(merge_events_by_keys(browser_urls, ["url"]));
+    browser_domains = sort_by_duration(merge_events_by_keys(browser_domains, ["$domain"]));
+    browser_duration = sum_durations(browser_domains);
+    browser_urls = limit_events(browser_urls, {default_limit});
+    browser_domains = limit_events(browser_domains, {default_limit});
+    RETURN = {{
+        "hosts": {{{",".join(host_sections)}
+        }},
+        "window": {{
+            "app_events": app_events,
+            "title_events": title_events,
+            "cat_events": cat_events,
+            "duration": duration
+        }},
+        "browser": {{
+            "domains": browser_domains,
+            "urls": browser_urls,
+            "duration": browser_duration
+        }}
+    }};
     """
-    return query
+    return optimize_query(query)
 
 
 def test_fullDesktopQuery():
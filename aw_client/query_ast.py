@@ -0,0 +1,411 @@
+"""
+A small AST for the aw-server query language, with optimizer passes.
+
+The query builders in `queries.py` generate query text in fragments, which
+leads to redundant work on the server (such as sorting after every concat,
+or splitting URL events that have already been split). The text is parsed
+into a list of assignments, optimized, and rendered back into query text.
+
+Only the subset of the language generated by the builders is supported:
+assignments of function calls, variables, literals, lists and dicts.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import (
+    Collection,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Var:
+    name: str
+
+
+@dataclass(frozen=True)
+class Literal:
+    # The literal as written in the query, such as `"app"`, `5` or `true`
+    raw: str
+
+
+@dataclass(frozen=True)
+class Call:
+    name: str
+    args: Tuple["Expr", ...]
+
+
+@dataclass(frozen=True)
+class ListExpr:
+    items: Tuple["Expr", ...]
+
+
+@dataclass(frozen=True)
+class DictExpr:
+    # Keys are kept as written, including quotes
+    items: Tuple[Tuple[str, "Expr"], ...]
+
+
+Expr = Union[Var, Literal, Call, ListExpr, DictExpr]
+
+
+@dataclass(frozen=True)
+class Assign:
+    target: str
+    expr: Expr
+
+
+RETURN = "RETURN"
+
+#
+#   Parsing and rendering
+#
+
+_token_re = re.compile(
+    r"""
+    (?P<ws>\s+)
+    | (?P<str>"(?:\\.|[^"\\])*")
+    | (?P<num>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+    | (?P<name>[A-Za-z_$][A-Za-z0-9_$]*)
+    | (?P<punct>[()\[\]{},:=;])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_keywords = {"true", "false", "null"}
+
+
+def _tokenize(query: str) -> Iterator[Tuple[str, str]]:
+    pos = 0
+    while pos < len(query):
+        m = _token_re.match(query, pos)
+        if not m:
+            raise QuerySyntaxError(
+                f"Unexpected character at {pos}: {query[pos : pos + 20]!r}"
+            )
+        pos = m.end()
+        kind = m.lastgroup
+        assert kind is not None
+        if kind != "ws":
+            yield kind, m.group()
+
+
+class _Parser:
+    def __init__(self, query: str) -> None:
+        self.tokens = list(_tokenize(query))
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos][1] if self.pos < len(self.tokens) else None
+
+    def next(self) -> Tuple[str, str]:
+        if self.pos >= len(self.tokens):
+            raise QuerySyntaxError("Unexpected end of query")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, value: str) -> None:
+        kind, token = self.next()
+        if token != value:
+            raise QuerySyntaxError(f"Expected {value!r}, got {token!r}")
+
+    def parse(self) -> List[Assign]:
+        statements = []
+        while self.peek() is not None:
+            if self.peek() == ";":
+                self.next()
+                continue
+            kind, target = self.next()
+            if kind != "name":
+                raise QuerySyntaxError(f"Expected assignment, got {target!r}")
+            self.expect("=")
+            statements.append(Assign(target, self.expr()))
+            self.expect(";")
+        return statements
+
+    def _sequence(self, end: str) -> List[Expr]:
+        items: List[Expr] = []
+        while self.peek() != end:
+            items.append(self.expr())
+            if self.peek() != end:
+                self.expect(",")
+        self.next()
+        return items
+
+    def expr(self) -> Expr:
+        kind, token = self.next()
+        if kind in ("str", "num") or token in _keywords:
+            return Literal(token)
+        if kind == "name":
+            if self.peek() == "(":
+                self.next()
+                return Call(token, tuple(self._sequence(")")))
+            return Var(token)
+        if token == "[":
+            return ListExpr(tuple(self._sequence("]")))
+        if token == "{":
+            items = []
+            while self.peek() != "}":
+                key_kind, key = self.next()
+                if key_kind != "str":
+                    raise QuerySyntaxError(f"Expected dict key, got {key!r}")
+                self.expect(":")
+                items.append((key, self.expr()))
+                if self.peek() != "}":
+                    self.expect(",")
+            self.next()
+            return DictExpr(tuple(items))
+        raise QuerySyntaxError(f"Unexpected token {token!r}")
+
+
+def parse(query: str) -> List[Assign]:
+    """Parses query text into a list of assignments."""
+    return _Parser(query).parse()
+
+
+def render_expr(expr: Expr) -> str:
+    if isinstance(expr, Var):
+        return expr.name
+    if isinstance(expr, Literal):
+        return expr.raw
+    if isinstance(expr, Call):
+        return f"{expr.name}({', '.join(map(render_expr, expr.args))})"
+    if isinstance(expr, ListExpr):
+        return f"[{', '.join(map(render_expr, expr.items))}]"
+    return "{" + ", ".join(f"{k}: {render_expr(v)}" for k, v in expr.items) + "}"
+
+
+def render(statements: List[Assign]) -> str:
+    """Renders assignments into query text, one statement per line."""
+    return "\n".join(f"{s.target} = {render_expr(s.expr)};" for s in statements)
+
+
+def variables(expr: Expr) -> Set[str]:
+    """Returns the names of the variables read by an expression."""
+    if isinstance(expr, Var):
+        return {expr.name}
+    if isinstance(expr, Call):
+        return set().union(*map(variables, expr.args))
+    if isinstance(expr, ListExpr):
+        return set().union(*map(variables, expr.items))
+    if isinstance(expr, DictExpr):
+        return set().union(*(variables(v) for _, v in expr.items))
+    return set()
+
+
+#
+#   Optimizer passes
+#
+
+
+def eliminate_dead_statements(statements: List[Assign]) -> List[Assign]:
+    """
+    Removes assignments whose result is never used by the RETURN statement.
+
+    Queries without a RETURN statement (fragments) are returned as-is.
+    """
+    if not any(s.target == RETURN for s in statements):
+        return statements
+
+    live: Set[str] = set()
+    kept: List[Assign] = []
+    for s in reversed(statements):
+        if s.target == RETURN:
+            if kept:
+                # Only the last RETURN counts
+                continue
+        elif s.target not in live:
+            continue
+        live.discard(s.target)
+        live |= variables(s.expr)
+        kept.append(s)
+    kept.reverse()
+    return kept
+
+
+def _is_call_on(s: Assign, name: str, var: str) -> bool:
+    return (
+        s.target == var
+        and isinstance(s.expr, Call)
+        and s.expr.name == name
+        and s.expr.args[:1] == (Var(var),)
+    )
+
+
+def hoist_sorts(statements: List[Assign]) -> List[Assign]:
+    """
+    Removes a `x = sort_by_timestamp(x)` when x is only concatenated to before being sorted again.
+
+    Turns the sort after every concat into a single sort at the end.
+    """
+    dropped: Set[int] = set()
+    for i, s in enumerate(statements):
+        if not _is_call_on(s, "sort_by_timestamp", s.target):
+            continue
+        var = s.target
+        for later in statements[i + 1 :]:
+            reads = var in variables(later.expr)
+            if _is_call_on(later, "sort_by_timestamp", var):
+                dropped.add(i)
+                break
+            if (
+                _is_call_on(later, "concat", var)
+                and isinstance(later.expr, Call)
+                and not any(var in variables(a) for a in later.expr.args[1:])
+            ):
+                continue
+            if reads or later.target == var:
+                break
+    return [s for i, s in enumerate(statements) if i not in dropped]
+
+
+# Functions which give the same result when applied twice, and the property they establish
+_idempotent = {
+    "split_url_events": "split",
+    "sort_by_timestamp": "sorted",
+}
+# Functions which keep the properties of their first argument (they only remove events)
+_preserves = {
+    "split": {"filter_keyvals", "filter_keyvals_regex", "filter_period_intersect"},
+    "sorted": {"filter_keyvals", "filter_keyvals_regex"},
+}
+_all_properties = frozenset(_idempotent.values())
+
+
+def eliminate_redundant_calls(statements: List[Assign]) -> List[Assign]:
+    """
+    Removes idempotent calls (like `split_url_events`) on values they've already been applied to.
+
+    Tracks which properties each variable is known to have, e.g. that all
+    events in it have been split, through filters and concats.
+    """
+    props: Dict[str, FrozenSet[str]] = {}
+
+    def props_of(expr: Expr) -> FrozenSet[str]:
+        if isinstance(expr, Var):
+            return props.get(expr.name, frozenset())
+        if isinstance(expr, ListExpr) and not expr.items:
+            # Trivially true for an empty list
+            return _all_properties
+        if isinstance(expr, Call) and expr.args:
+            first = props_of(expr.args[0])
+            if expr.name in _idempotent:
+                return first | {_idempotent[expr.name]}
+            if expr.name == "concat":
+                # Concatenation does not keep the order
+                common = first.intersection(*map(props_of, expr.args[1:]))
+                return common - {"sorted"}
+            return frozenset(p for p in first if expr.name in _preserves[p])
+        return frozenset()
+
+    result: List[Assign] = []
+    for s in statements:
+        expr = s.expr
+        if (
+            isinstance(expr, Call)
+            and expr.name in _idempotent
+            and len(expr.args) == 1
+            and _idempotent[expr.name] in props_of(expr.args[0])
+        ):
+            if expr.args[0] == Var(s.target):
+                # Assignment to itself, no-op
+                continue
+            s = Assign(s.target, expr.args[0])
+        props[s.target] = props_of(s.expr)
+        result.append(s)
+    return result
+
+
+def eliminate_common_subexpressions(statements: List[Assign]) -> List[Assign]:
+    """
+    Replaces a call which has already been computed (with unchanged inputs) by a copy of its result.
+
+    Uses value numbering, so that reassigned variables (which are common in
+    the generated queries) are handled correctly.
+    """
+    value_of: Dict[str, int] = {}
+    computed: Dict[object, Tuple[str, int]] = {}
+    counter = iter(range(1 << 62))
+
+    def key(expr: Expr) -> object:
+        if isinstance(expr, Var):
+            if expr.name not in value_of:
+                value_of[expr.name] = next(counter)
+            return ("var", value_of[expr.name])
+        if isinstance(expr, Call):
+            return ("call", expr.name, tuple(map(key, expr.args)))
+        if isinstance(expr, ListExpr):
+            return ("list", tuple(map(key, expr.items)))
+        if isinstance(expr, DictExpr):
+            return ("dict", tuple((k, key(v)) for k, v in expr.items))
+        return ("lit", expr.raw)
+
+    result: List[Assign] = []
+    for s in statements:
+        k = key(s.expr)
+        if isinstance(s.expr, Call) and k in computed:
+            holder, value = computed[k]
+            if value_of.get(holder) == value and holder != s.target:
+                s = Assign(s.target, Var(holder))
+        if isinstance(s.expr, Var):
+            value_of[s.target] = value_of[s.expr.name]
+        else:
+            value_of[s.target] = next(counter)
+            if isinstance(s.expr, Call):
+                computed[k] = (s.target, value_of[s.target])
+        result.append(s)
+    return result
+
+
+def _prune_dict(expr: Expr, fields: Collection[str], prefix: str = "") -> Expr:
+    if not isinstance(expr, DictExpr):
+        return expr
+    items = []
+    for k, v in expr.items:
+        path = prefix + k.strip('"')
+        if path in fields:
+            items.append((k, v))
+        elif any(f.startswith(path + ".") for f in fields):
+            items.append((k, _prune_dict(v, fields, path + ".")))
+    return DictExpr(tuple(items))
+
+
+def prune_return(statements: List[Assign], fields: Collection[str]) -> List[Assign]:
+    """
+    Removes the fields of the RETURN dict that are not in `fields`.
+
+    Nested fields are given as dotted paths, like `window.app_events`.
+    """
+    return [
+        Assign(s.target, _prune_dict(s.expr, fields)) if s.target == RETURN else s
+        for s in statements
+    ]
+
+
+def optimize(
+    statements: List[Assign], return_fields: Optional[Collection[str]] = None
+) -> List[Assign]:
+    """Runs all optimizer passes, optionally only keeping `return_fields` of the RETURN dict."""
+    if return_fields is not None:
+        statements = prune_return(statements, return_fields)
+    statements = eliminate_redundant_calls(statements)
+    statements = hoist_sorts(statements)
+    statements = eliminate_common_subexpressions(statements)
+    return eliminate_dead_statements(statements)
+
+
+def optimize_query(query: str, return_fields: Optional[Collection[str]] = None) -> str:
+    """Parses, optimizes and renders query text."""
+    return render(optimize(parse(query), return_fields))
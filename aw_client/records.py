@@ -0,0 +1,232 @@
+"""
+Lightweight event records for bulk reads.
+
+Constructing a full `aw_core.models.Event` parses the timestamp, builds a
+timedelta and wraps everything in a dict subclass, which dominates the time
+and memory of reading many events. An `EventRecord` only keeps the decoded
+values in slots and parses the timestamp when it is first accessed.
+
+Data values that repeat a lot (like `app` and `title` of window events) are
+interned while decoding, so that each distinct value is only kept once in
+memory. `to_columns` goes further and dictionary-encodes them into integer
+codes, for grouping and aggregating many events.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from aw_core.models import Event
+
+from .timestamps import parse_timestamp, to_epoch_us
+
+# Data keys which usually have few distinct values across many events
+DEFAULT_INTERN_KEYS = ("app", "title", "url", "$category")
+
+
+class Interner:
+    """Replaces equal string values of the given data keys with a single shared instance."""
+
+    def __init__(self, keys: Iterable[str] = DEFAULT_INTERN_KEYS) -> None:
+        self.keys = tuple(keys)
+        self._pool: Dict[str, str] = {}
+
+    def intern(self, s: str) -> str:
+        return self._pool.setdefault(s, s)
+
+    def intern_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        pool = self._pool
+        for key in self.keys:
+            v = data.get(key)
+            if isinstance(v, str):
+                data[key] = pool.setdefault(v, v)
+            elif isinstance(v, list):
+                # Category paths, like ["Work", "Programming"]
+                data[key] = [
+                    pool.setdefault(s, s) if isinstance(s, str) else s for s in v
+                ]
+        return data
+
+
+def _parse_timestamp(ts: str) -> datetime:
+    dt = parse_timestamp(ts)
+    # Same resolution and timezone as Event
+    return dt.replace(microsecond=dt.microsecond // 1000 * 1000).astimezone(
+        timezone.utc
+    )
+
+
+class EventRecord:
+    """
+    A compact, read-only-ish representation of an event.
+
+    Has the same `id`, `timestamp`, `duration` and `data` attributes as
+    `Event`, use `to_event` to convert it into one when needed.
+    """
+
+    __slots__ = ("id", "_timestamp", "_duration", "data")
+
+    def __init__(
+        self,
+        id: Optional[Union[int, str]],
+        timestamp: Union[str, datetime],
+        duration: float,
+        data: Dict[str, Any],
+    ) -> None:
+        self.id = id
+        self._timestamp = timestamp
+        self._duration = duration
+        self.data = data
+
+    @classmethod
+    def from_json_dict(
+        cls, e: Dict[str, Any], interner: Optional[Interner] = None
+    ) -> "EventRecord":
+        data = e["data"] if interner is None else interner.intern_data(e["data"])
+        return cls(e.get("id"), e["timestamp"], e["duration"], data)
+
+    @property
+    def timestamp(self) -> datetime:
+        ts = self._timestamp
+        if isinstance(ts, str):
+            ts = self._timestamp = _parse_timestamp(ts)
+        return ts
+
+    @property
+    def duration(self) -> timedelta:
+        return timedelta(seconds=self._duration)
+
+    @property
+    def duration_seconds(self) -> float:
+        return self._duration
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        """Returns the event in the format used by the server, without parsing the timestamp if it hasn't been."""
+        ts = self._timestamp
+        return {
+            "id": self.id,
+            "timestamp": ts if isinstance(ts, str) else ts.isoformat(),
+            "duration": self._duration,
+            "data": self.data,
+        }
+
+    def to_event(self) -> Event:
+        return Event(
+            id=self.id,
+            timestamp=self.timestamp,
+            duration=self._duration,
+            data=self.data,
+        )
+
+    def __repr__(self) -> str:
+        return f"<EventRecord id={self.id} timestamp={self._timestamp} duration={self._duration} data={self.data}>"
+
+
+def parse_records(
+    events: Iterable[Dict[str, Any]],
+    intern_keys: Optional[Iterable[str]] = DEFAULT_INTERN_KEYS,
+) -> List[EventRecord]:
+    """
+    Converts events as returned by the server (for example in query results) into records.
+
+    The data values of `intern_keys` are interned, pass None to disable.
+    """
+    interner = Interner(intern_keys) if intern_keys else None
+    return [EventRecord.from_json_dict(e, interner) for e in events]
+
+
+def parse_event(e: Dict[str, Any], interner: Optional[Interner] = None) -> Event:
+    """Converts an event as returned by the server into an `Event`, using the fast timestamp parser."""
+    return Event(
+        id=e.get("id"),
+        timestamp=parse_timestamp(e["timestamp"]),
+        duration=e["duration"],
+        data=e["data"] if interner is None else interner.intern_data(e["data"]),
+    )
+
+
+def parse_events(
+    events: Iterable[Dict[str, Any]],
+    intern_keys: Optional[Iterable[str]] = DEFAULT_INTERN_KEYS,
+) -> List[Event]:
+    """Like `parse_records`, but returns `Event`s."""
+    interner = Interner(intern_keys) if intern_keys else None
+    return [parse_event(e, interner) for e in events]
+
+
+@dataclass
+class EventColumns:
+    """
+    Events in a columnar layout.
+
+    Timestamps are microseconds since the Unix epoch and durations are in
+    seconds. The data values of each encoded key are stored as integer codes
+    into `dictionaries[key]`, with -1 where the key is missing.
+    """
+
+    ids: List[Any] = field(default_factory=list)
+    timestamps: "array[int]" = field(default_factory=lambda: array("q"))
+    durations: "array[float]" = field(default_factory=lambda: array("d"))
+    codes: Dict[str, "array[int]"] = field(default_factory=dict)
+    dictionaries: Dict[str, List[str]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.durations)
+
+    def values(self, key: str) -> List[Optional[str]]:
+        """Decodes the values of a key."""
+        dictionary = self.dictionaries[key]
+        return [dictionary[c] if c >= 0 else None for c in self.codes[key]]
+
+    def sum_durations_by(self, key: str) -> Dict[str, float]:
+        """Sums the durations (in seconds) of the events for each distinct value of a key."""
+        dictionary = self.dictionaries[key]
+        sums = [0.0] * len(dictionary)
+        for c, duration in zip(self.codes[key], self.durations):
+            if c >= 0:
+                sums[c] += duration
+        return dict(zip(dictionary, sums))
+
+
+def to_columns(
+    events: Sequence[Dict[str, Any]], keys: Iterable[str] = DEFAULT_INTERN_KEYS
+) -> EventColumns:
+    """
+    Dictionary-encodes events as returned by the server into `EventColumns`.
+
+    Category paths (lists) are encoded as their joined form, like "Work > Programming".
+    """
+    columns = EventColumns(
+        ids=[e.get("id") for e in events],
+        timestamps=to_epoch_us(e["timestamp"] for e in events),
+        durations=array("d", (e["duration"] for e in events)),
+    )
+    for key in keys:
+        lookup: Dict[str, int] = {}
+        codes = array("l")
+        for e in events:
+            v = e["data"].get(key)
+            if v is None:
+                codes.append(-1)
+                continue
+            if isinstance(v, list):
+                v = " > ".join(v)
+            elif not isinstance(v, str):
+                v = str(v)
+            code = lookup.get(v)
+            if code is None:
+                code = lookup[v] = len(lookup)
+            codes.append(code)
+        columns.codes[key] = codes
+        # Dicts keep insertion order, so the keys are ordered by code
+        columns.dictionaries[key] = list(lookup)
+    return columns
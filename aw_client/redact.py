@@ -0,0 +1,169 @@
+"""
+Bulk redaction of sensitive data in events.
+
+Redaction is done in two steps: `plan_redaction` streams the events of a
+bucket in time windows (see `streaming`) and collects the events with data
+matching any of the patterns, and `apply_redaction` replaces them with their
+redacted versions in chunks. Planning first allows previewing the changes,
+and applying in chunks keeps the number of requests low.
+
+All plain string patterns are compiled into a single case-insensitive regex,
+so that each string value is only searched once for them. Compiled patterns
+are searched separately, keeping their own flags and groups.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Union,
+)
+
+from aw_core.models import Event
+
+from .records import EventRecord
+from .streaming import DEFAULT_WINDOW, EventStream, bucket_range
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "REDACTED"
+
+# Called with (done, total) after each applied chunk
+ProgressCallback = Callable[[int, int], None]
+
+
+class Redactor:
+    """
+    Replaces string data values matching any of the patterns.
+
+    Plain strings are matched literally, compiled patterns as regexes, and
+    all matching is case-insensitive. The whole value is replaced, so that no
+    part of the sensitive data is left. If `keys` is given, only those data
+    keys are checked.
+    """
+
+    def __init__(
+        self,
+        patterns: Iterable[Union[str, Pattern]],
+        replacement: str = REDACTED,
+        keys: Optional[Iterable[str]] = None,
+    ) -> None:
+        patterns = list(patterns)
+        if not patterns:
+            raise ValueError("At least one pattern is required")
+        literals = [re.escape(p) for p in patterns if isinstance(p, str)]
+        self.regexes: List[Pattern] = (
+            [re.compile("|".join(literals), re.IGNORECASE)] if literals else []
+        )
+        # Compiled separately, since joining them would drop their flags and renumber their groups
+        self.regexes += [
+            re.compile(p.pattern, p.flags | re.IGNORECASE)
+            for p in patterns
+            if isinstance(p, re.Pattern)
+        ]
+        self.replacement = replacement
+        self.keys = set(keys) if keys is not None else None
+
+    def redact_data(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns a redacted copy of the data, or None if nothing matched."""
+        searches = [regex.search for regex in self.regexes]
+        redacted: Optional[Dict[str, Any]] = None
+        for k, v in data.items():
+            if self.keys is not None and k not in self.keys:
+                continue
+            if isinstance(v, str) and any(search(v) for search in searches):
+                if redacted is None:
+                    redacted = dict(data)
+                redacted[k] = self.replacement
+        return redacted
+
+
+@dataclass
+class RedactionChange:
+    event: EventRecord
+    redacted_data: Dict[str, Any]
+
+    def redacted_event(self) -> Event:
+        # Without ID, since the original event is deleted separately
+        return Event(
+            timestamp=self.event.timestamp,
+            duration=self.event.duration,
+            data=self.redacted_data,
+        )
+
+
+def plan_redaction(
+    client: "ActivityWatchClient",
+    bucket_id: str,
+    redactor: Redactor,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    window: timedelta = DEFAULT_WINDOW,
+) -> List[RedactionChange]:
+    """Finds the events in a bucket which need to be redacted, and what they should be redacted to."""
+    if start is None or end is None:
+        bucket_start, bucket_end = bucket_range(client, bucket_id)
+        start = start or bucket_start
+        end = end or bucket_end
+
+    changes = []
+    for e in EventStream(client, bucket_id, start, end, window):
+        redacted = redactor.redact_data(e.data)
+        if redacted is not None:
+            changes.append(RedactionChange(e, redacted))
+    return changes
+
+
+def apply_redaction(
+    client: "ActivityWatchClient",
+    bucket_id: str,
+    changes: List[RedactionChange],
+    chunk_size: int = 500,
+    progress: Optional[ProgressCallback] = None,
+) -> int:
+    """
+    Replaces the events of planned changes with their redacted versions, in chunks.
+
+    The redacted events of each chunk are inserted before the originals are
+    deleted, so an interrupted redaction never loses events (but might leave
+    some unredacted, in which case it can simply be planned and applied
+    again). Returns the number of redacted events.
+
+    Raises a ValueError before changing anything if an event has no ID,
+    since its unredacted version couldn't be deleted.
+    """
+    missing_ids = [c.event for c in changes if c.event.id is None]
+    if missing_ids:
+        raise ValueError(
+            f"Can't redact {len(missing_ids)} events without an ID, first one: {missing_ids[0]}"
+        )
+
+    done = 0
+    for i in range(0, len(changes), chunk_size):
+        chunk = changes[i : i + chunk_size]
+        client.insert_events(bucket_id, [c.redacted_event() for c in chunk])
+        outcomes = client.delete_events(
+            bucket_id, [int(c.event.id) for c in chunk if c.event.id is not None]
+        )
+        failed = [event_id for event_id, error in outcomes.items() if error is not None]
+        if failed:
+            raise Exception(
+                f"Failed to delete the unredacted versions of events {failed}"
+            )
+        done += len(chunk)
+        if progress:
+            progress(done, len(changes))
+    logger.info(f"Redacted {done} events in {bucket_id}")
+    return done
@@ -0,0 +1,213 @@
+"""
+Time-bucketed rollups of canonical events.
+
+Computing a duration per hour or day by querying each period separately
+re-runs the whole canonical events pipeline (fetching, flooding and
+categorizing the same buckets) once per period. A rollup instead queries the
+canonical events for the whole range once, and splits their durations into
+bins client-side, giving a duration matrix (values × bins) per data key.
+"""
+
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from .queries import AndroidQueryParams, DesktopQueryParams, canonicalEvents
+from .records import EventColumns, to_columns
+from .timestamps import EPOCH, epoch_us, parse_timestamp
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+Granularity = Literal["hour", "day", "week"]
+
+_steps = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+_US = 1_000_000
+
+
+def _localize(dt: datetime, tz: Optional[tzinfo]) -> datetime:
+    # Gives wall-clock times the UTC offset in effect at that time,
+    # moving those skipped by a DST change forward
+    return dt.replace(tzinfo=tz).astimezone(timezone.utc).astimezone(tz)
+
+
+def bin_edges(
+    start: datetime,
+    end: datetime,
+    granularity: Granularity = "day",
+    day_offset: timedelta = timedelta(0),
+) -> List[datetime]:
+    """
+    Returns the edges of the bins covering start to end, in the timezone of start.
+
+    Days (and weeks, which start on Monday) begin at `day_offset` past
+    midnight, like the "start of day" setting in aw-webui. The first bin starts
+    at or before `start`, and the last one ends at or after `end`.
+
+    Day and week edges follow the wall-clock time, so bins spanning a DST
+    change are an hour shorter or longer. This needs `start` to be in a zone
+    with DST rules (like `zoneinfo.ZoneInfo`), not a fixed UTC offset (like
+    the one given by `datetime.astimezone()`).
+    """
+    if start.tzinfo is None or end.tzinfo is None:
+        raise ValueError("start/end needs to have a timezone set")
+    if granularity not in _steps:
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    tz = start.tzinfo
+    step = _steps[granularity]
+    if granularity == "hour":
+        # Hours are stepped in UTC, so that none are skipped or repeated at DST changes
+        first = start.replace(minute=0, second=0, microsecond=0).astimezone(
+            timezone.utc
+        )
+
+        def edge(i: int) -> datetime:
+            return (first + i * step).astimezone(tz)
+
+    else:
+        # Days are stepped in wall-clock time and localized one by one
+        first = datetime.combine(start.date(), time()) + day_offset
+        if _localize(first, tz) > start:
+            first -= timedelta(days=1)
+        if granularity == "week":
+            first -= timedelta(days=first.weekday())
+
+        def edge(i: int) -> datetime:
+            return _localize(first + i * step, tz)
+
+    edges = [edge(0)]
+    # Compared in UTC, since datetimes with the same tzinfo are compared by wall-clock time
+    while edges[-1].astimezone(timezone.utc) < end:
+        edges.append(edge(len(edges)))
+    if len(edges) == 1:
+        edges.append(edge(1))
+    return edges
+
+
+@dataclass
+class Rollup:
+    """
+    Durations (in seconds) of the values of a data key, split into time bins.
+
+    `durations[value][i]` is the time spent with that value between
+    `edges[i]` and `edges[i + 1]`.
+    """
+
+    key: str
+    edges: List[datetime]
+    durations: Dict[str, "array[float]"]
+
+    @property
+    def starts(self) -> List[datetime]:
+        return self.edges[:-1]
+
+    def totals(self) -> Dict[str, float]:
+        """Returns the total duration of each value over all bins, longest first."""
+        totals = {value: sum(row) for value, row in self.durations.items()}
+        return dict(sorted(totals.items(), key=lambda kv: kv[1], reverse=True))
+
+    def bin_totals(self) -> List[float]:
+        """Returns the total duration of all values in each bin."""
+        totals = [0.0] * len(self.starts)
+        for row in self.durations.values():
+            for i, duration in enumerate(row):
+                totals[i] += duration
+        return totals
+
+
+def bin_durations(columns: EventColumns, key: str, edges: List[datetime]) -> Rollup:
+    """Splits the durations of events (grouped by the values of `key`) into the bins given by `edges`."""
+    edges_us = [epoch_us(dt) for dt in edges]
+    n_bins = len(edges) - 1
+    dictionary = columns.dictionaries[key]
+    rows = [array("d", bytes(8 * n_bins)) for _ in dictionary]
+
+    for code, start, duration in zip(
+        columns.codes[key], columns.timestamps, columns.durations
+    ):
+        if code < 0 or duration <= 0:
+            continue
+        end = start + int(duration * _US)
+        row = rows[code]
+        i = max(bisect_right(edges_us, start) - 1, 0)
+        while i < n_bins and edges_us[i] < end:
+            overlap = min(end, edges_us[i + 1]) - max(start, edges_us[i])
+            if overlap > 0:
+                row[i] += overlap / _US
+            i += 1
+
+    return Rollup(key, edges, dict(zip(dictionary, rows)))
+
+
+def split_events(
+    events: Sequence[Dict[str, Any]], edges: List[datetime]
+) -> List[List[Dict[str, Any]]]:
+    """
+    Splits events as returned by the server into one list per bin.
+
+    Events crossing a bin edge are cut in two, so that each list only covers
+    its own bin.
+    """
+    edges_us = [epoch_us(dt) for dt in edges]
+    n_bins = len(edges) - 1
+    bins: List[List[Dict[str, Any]]] = [[] for _ in range(n_bins)]
+    for e in events:
+        start = epoch_us(parse_timestamp(e["timestamp"]))
+        end = start + int(e["duration"] * _US)
+        i = max(bisect_right(edges_us, start) - 1, 0)
+        while i < n_bins and edges_us[i] < max(end, start + 1):
+            lo, hi = max(start, edges_us[i]), min(end, edges_us[i + 1])
+            if lo == start and hi == end:
+                bins[i].append(e)
+            elif hi > lo:
+                bins[i].append(
+                    {
+                        **e,
+                        "timestamp": (EPOCH + timedelta(microseconds=lo)).isoformat(),
+                        "duration": (hi - lo) / _US,
+                    }
+                )
+            i += 1
+    return bins
+
+
+def rollup_query(params: Union[DesktopQueryParams, AndroidQueryParams]) -> str:
+    """Builds the query returning the canonical events for a rollup."""
+    return f"{canonicalEvents(params)}\nRETURN = events;"
+
+
+def rollup(
+    client: "ActivityWatchClient",
+    params: Union[DesktopQueryParams, AndroidQueryParams],
+    start: datetime,
+    end: datetime,
+    granularity: Granularity = "day",
+    day_offset: timedelta = timedelta(0),
+    keys: Sequence[str] = ("$category", "app"),
+) -> Dict[str, Rollup]:
+    """
+    Computes the time spent per value of each of `keys`, split into hourly, daily or weekly bins.
+
+    The canonical events are queried once for the whole range, see `bin_edges`
+    for how the bins are aligned.
+    """
+    edges = bin_edges(start, end, granularity, day_offset)
+    events = client.query(rollup_query(params), [(edges[0], edges[-1])])[0]
+    columns = to_columns(events, keys)
+    return {key: bin_durations(columns, key, edges) for key in keys}
@@ -0,0 +1,165 @@
+"""
+Streaming the events of a bucket in time windows.
+
+Fetching all events of a large bucket at once is slow and needs memory for
+all of them. These helpers fetch one time window at a time, oldest first, so
+that buckets can be processed with memory bounded by the size of a window.
+
+The server clips events to the requested time range, so an event crossing the
+edge of a window is returned in parts. `EventStream` stitches them back
+together by their event ID.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .records import EventRecord
+from .timestamps import EPOCH, epoch_us, parse_timestamp
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+DEFAULT_WINDOW = timedelta(days=7)
+
+
+def bucket_range(
+    client: "ActivityWatchClient", bucket_id: str, bucket: Optional[dict] = None
+) -> Tuple[datetime, datetime]:
+    """
+    Returns a time range covering all events of a bucket.
+
+    Uses the first and last event times from the bucket metadata when the
+    server provides them (from the client's `bucket_registry`, so at most its
+    TTL old), and otherwise falls back to the time the bucket was
+    created until now. Since imported events can be older than the bucket,
+    the start is then moved back (by doubling steps) until no events are
+    left before it.
+
+    Pass the metadata of the bucket as `bucket` if it has already been
+    fetched, instead of looking it up.
+    """
+    if bucket is None:
+        bucket = client.bucket_registry.buckets()[bucket_id]
+    metadata = bucket.get("metadata") or {}
+    end = metadata.get("end")
+    end_dt = (
+        # The end is exclusive
+        parse_timestamp(end) + timedelta(seconds=1)
+        if end
+        else datetime.now(timezone.utc)
+    )
+    if metadata.get("start"):
+        return parse_timestamp(metadata["start"]), end_dt
+
+    created = bucket.get("created")
+    if not created:
+        return EPOCH, end_dt
+    start = parse_timestamp(created)
+    step = timedelta(days=30)
+    while start > EPOCH and client.get_eventcount(bucket_id, end=start) > 0:
+        start = max(start - step, EPOCH)
+        step *= 2
+    return start, end_dt
+
+
+def iter_windows(
+    client: "ActivityWatchClient",
+    bucket_id: str,
+    start: datetime,
+    end: datetime,
+    window: timedelta = DEFAULT_WINDOW,
+) -> Iterator[Tuple[datetime, datetime, List[EventRecord]]]:
+    """
+    Fetches the events of a bucket one window at a time, oldest first.
+
+    Yields the start and end of each window together with its events, sorted
+    by timestamp and clipped to the window by the server.
+    """
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        events = client.get_events(
+            bucket_id, start=window_start, end=window_end, raw=True
+        )
+        events.sort(key=lambda e: e.timestamp)
+        yield window_start, window_end, events
+        window_start = window_end
+
+
+def _end_us(e: EventRecord) -> int:
+    return epoch_us(e.timestamp) + round(e.duration_seconds * 1_000_000)
+
+
+class EventStream:
+    """
+    Iterates over the events of a bucket, fetched window by window.
+
+    Events split by a window edge are stitched back together and yielded
+    once complete, in the window they end in. Events which are still
+    waiting for their continuation are kept in `pending`.
+    """
+
+    def __init__(
+        self,
+        client: "ActivityWatchClient",
+        bucket_id: str,
+        start: datetime,
+        end: datetime,
+        window: timedelta = DEFAULT_WINDOW,
+    ) -> None:
+        self.client = client
+        self.bucket_id = bucket_id
+        self.start = start
+        self.end = end
+        self.window = window
+        self.pending: Dict[Optional[Union[int, str]], EventRecord] = {}
+
+    def pending_start(self) -> Optional[datetime]:
+        """Returns the earliest start of the pending events, if any."""
+        return min((e.timestamp for e in self.pending.values()), default=None)
+
+    def windows(self) -> Iterator[Tuple[datetime, List[EventRecord]]]:
+        """Yields the end of each window, together with the events completed in it."""
+        for _, window_end, events in iter_windows(
+            self.client, self.bucket_id, self.start, self.end, self.window
+        ):
+            window_end_us = epoch_us(window_end)
+            continued: Dict[Optional[Union[int, str]], EventRecord] = {}
+            completed: List[EventRecord] = []
+            for e in events:
+                previous = self.pending.pop(e.id, None)
+                if previous is not None:
+                    end_us = max(_end_us(previous), _end_us(e))
+                    e = EventRecord(
+                        e.id,
+                        previous.timestamp,
+                        (end_us - epoch_us(previous.timestamp)) / 1_000_000,
+                        previous.data,
+                    )
+                if _end_us(e) >= window_end_us and window_end < self.end:
+                    continued[e.id] = e
+                else:
+                    completed.append(e)
+
+            # Pending events that didn't continue into this window ended at the edge
+            completed += self.pending.values()
+            completed.sort(key=lambda e: e.timestamp)
+            self.pending = continued
+            yield window_end, completed
+
+        if self.pending:
+            leftover = sorted(self.pending.values(), key=lambda e: e.timestamp)
+            self.pending = {}
+            yield self.end, leftover
+
+    def __iter__(self) -> Iterator[EventRecord]:
+        for _, events in self.windows():
+            yield from events
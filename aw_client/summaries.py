@@ -0,0 +1,246 @@
+"""
+A local store of daily activity summaries.
+
+The summary of a day (the time spent per category, app and browser domain)
+never changes once the day is over, so it only needs to be computed from the
+raw events once. Summaries of finished days are kept in a small SQLite file,
+keyed by host, day and a hash of the category rules, day offset and browser
+buckets, so that changing any of them invalidates them. Only days without a
+stored summary (such as the current one) are queried from the server.
+
+Summaries made with different settings (for example by callers with other
+day offsets) are kept side by side, and only pruned once their settings
+haven't been used for a while.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from datetime import date, datetime, time, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from aw_core.dirs import get_cache_dir
+
+from .classes import get_classes
+from .queries import DesktopQueryParams, canonicalEvents
+from .query_ast import optimize_query
+
+if TYPE_CHECKING:
+    from .client import ActivityWatchClient
+
+logger = logging.getLogger(__name__)
+
+# Bump when the summary format or the query changes, to discard old summaries
+SUMMARY_VERSION = 1
+
+# Summaries made with settings that haven't been used for this long are removed
+STALE_SETTINGS_AGE = timedelta(days=30)
+
+# {"duration": seconds, "categories": {name: seconds}, "apps": {...}, "domains": {...}}
+Summary = Dict[str, Any]
+
+
+def default_store_path(testing: bool = False) -> str:
+    cache_dir = get_cache_dir("aw-client")
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(
+        cache_dir,
+        "summaries{}.v{}.sqlite".format("-testing" if testing else "", SUMMARY_VERSION),
+    )
+
+
+def settings_hash(
+    classes: Sequence[Tuple[Sequence[str], dict]],
+    day_offset: timedelta = timedelta(0),
+    bid_browsers: Sequence[str] = (),
+) -> str:
+    """Returns a short hash identifying the category rules, day offset and browser buckets a summary was made with."""
+    settings_str = json.dumps(
+        {
+            "classes": [[list(name), rule] for name, rule in classes],
+            "day_offset": day_offset.total_seconds(),
+            "bid_browsers": sorted(bid_browsers),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(settings_str.encode()).hexdigest()[:16]
+
+
+class SummaryStore:
+    """Stores one summary per (host, day, settings hash) as a JSON row, and when each settings hash was last used."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "host TEXT NOT NULL, day TEXT NOT NULL, settings_hash TEXT NOT NULL, "
+            "summary TEXT NOT NULL, PRIMARY KEY (host, day, settings_hash))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            "host TEXT NOT NULL, settings_hash TEXT NOT NULL, used_at REAL NOT NULL, "
+            "PRIMARY KEY (host, settings_hash))"
+        )
+
+    def get(
+        self, host: str, days: Iterable[date], settings_hash: str
+    ) -> Dict[date, Summary]:
+        """Returns the stored summaries of the given days, days without one are left out."""
+        days = list(days)
+        rows = self._conn.execute(
+            "SELECT day, summary FROM summaries WHERE host = ? AND settings_hash = ? "
+            "AND day IN ({})".format(",".join("?" * len(days))),
+            (host, settings_hash, *(day.isoformat() for day in days)),
+        )
+        return {date.fromisoformat(day): json.loads(summary) for day, summary in rows}
+
+    def put(self, host: str, day: date, settings_hash: str, summary: Summary) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO summaries (host, day, settings_hash, summary) VALUES (?, ?, ?, ?)",
+            (host, day.isoformat(), settings_hash, json.dumps(summary)),
+        )
+
+    def mark_used(self, host: str, settings_hash: str, now: datetime) -> None:
+        """Records that the summaries of a host made with these settings were used at `now`."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings (host, settings_hash, used_at) VALUES (?, ?, ?)",
+            (host, settings_hash, now.timestamp()),
+        )
+
+    def prune(
+        self, host: str, now: datetime, max_age: timedelta = STALE_SETTINGS_AGE
+    ) -> int:
+        """Removes the summaries of a host made with settings not used for `max_age`, returns how many were removed."""
+        cutoff = (now - max_age).timestamp()
+        cursor = self._conn.execute(
+            "DELETE FROM summaries WHERE host = ? AND settings_hash NOT IN "
+            "(SELECT settings_hash FROM settings WHERE host = ? AND used_at >= ?)",
+            (host, host, cutoff),
+        )
+        self._conn.execute(
+            "DELETE FROM settings WHERE host = ? AND used_at < ?", (host, cutoff)
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def summary_query(params: DesktopQueryParams) -> str:
+    """Builds the query for the data of a day summary."""
+    query = f"""
+    {canonicalEvents(params)}
+    cat_events = merge_events_by_keys(events, ["$category"]);
+    app_events = merge_events_by_keys(events, ["app"]);
+    duration = sum_durations(events);
+    """
+    if params.bid_browsers:
+        query += """
+        browser_events = split_url_events(browser_events);
+        browser_domains = merge_events_by_keys(browser_events, ["$domain"]);
+        """
+    else:
+        query += """
+        browser_domains = [];
+        """
+    query += """
+    RETURN = {
+        "cat_events": cat_events,
+        "app_events": app_events,
+        "domains": browser_domains,
+        "duration": duration
+    };
+    """
+    # Removes the split_url_events already done by canonicalEvents
+    return optimize_query(query)
+
+
+def _durations_by(events: List[Dict[str, Any]], key: str) -> Dict[str, float]:
+    durations: Dict[str, float] = {}
+    for e in events:
+        value = e["data"].get(key)
+        if isinstance(value, list):
+            value = " > ".join(value)
+        durations[str(value)] = durations.get(str(value), 0.0) + e["duration"]
+    return durations
+
+
+def to_summary(result: Dict[str, Any]) -> Summary:
+    """Converts the result of `summary_query` for one day into a summary."""
+    return {
+        "duration": result["duration"],
+        "categories": _durations_by(result["cat_events"], "$category"),
+        "apps": _durations_by(result["app_events"], "app"),
+        "domains": _durations_by(result["domains"], "$domain"),
+    }
+
+
+def day_period(
+    day: date, day_offset: timedelta = timedelta(0)
+) -> Tuple[datetime, datetime]:
+    """Returns the start and end of a day in local time, with days starting at `day_offset` past midnight."""
+    start = datetime.combine(day, time()).astimezone() + day_offset
+    return start, start + timedelta(days=1)
+
+
+def daily_summaries(
+    client: "ActivityWatchClient",
+    store: Optional[SummaryStore],
+    hostname: str,
+    days: Sequence[date],
+    day_offset: timedelta = timedelta(0),
+    classes: Optional[Sequence[Tuple[Sequence[str], dict]]] = None,
+    bid_browsers: Sequence[str] = (),
+    now: Optional[datetime] = None,
+) -> Dict[date, Summary]:
+    """
+    Returns the summary of each of the given days for a host.
+
+    Summaries of finished days are read from the store if there, and
+    otherwise computed with a single query and added to it. Days which
+    haven't ended yet are always computed. Pass `store=None` to skip the
+    store entirely.
+    """
+    if classes is None:
+        classes = get_classes()
+    h = settings_hash(classes, day_offset, bid_browsers)
+    now = now or datetime.now().astimezone()
+
+    summaries: Dict[date, Summary] = {}
+    if store is not None:
+        store.mark_used(hostname, h, now)
+        removed = store.prune(hostname, now)
+        if removed:
+            logger.info(f"Discarded {removed} stored summaries of unused settings")
+        summaries = store.get(hostname, days, h)
+
+    missing = [day for day in days if day not in summaries]
+    if missing:
+        params = DesktopQueryParams(
+            bid_window=f"aw-watcher-window_{hostname}",
+            bid_afk=f"aw-watcher-afk_{hostname}",
+            bid_browsers=bid_browsers,
+            classes=classes,
+        )
+        periods = [day_period(day, day_offset) for day in missing]
+        results = client.query(summary_query(params), periods)
+        for day, (_, end), result in zip(missing, periods, results):
+            summary = summaries[day] = to_summary(result)
+            if store is not None and end <= now:
+                store.put(hostname, day, h, summary)
+
+    return {day: summaries[day] for day in days}
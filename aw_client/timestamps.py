@@ -0,0 +1,79 @@
+"""
+Fast decoding of ISO 8601 timestamps, as returned by aw-server.
+
+The server always sends timestamps in a fixed format (such as
+`2024-05-01T10:00:00.123000+00:00`), which `datetime.fromisoformat` parses
+an order of magnitude faster than `iso8601.parse_date`. Timestamps it can't
+handle (like a `Z` suffix or nanosecond fractions on older Pythons) are
+normalized first, and only fall back to `iso8601` as a last resort.
+"""
+
+import re
+from array import array
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import (
+    Dict,
+    Iterable,
+    List,
+)
+
+import iso8601
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Timezones by UTC offset, so that datetimes with the same offset share a tzinfo
+_tz_cache: Dict[timedelta, tzinfo] = {timedelta(0): timezone.utc}
+
+_timestamp_re = re.compile(
+    r"^(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})(?:[.,](\d+))?(Z|[+-]\d{2}:?\d{2})?$"
+)
+
+
+def _parse_fallback(s: str) -> datetime:
+    m = _timestamp_re.match(s)
+    if not m:
+        return iso8601.parse_date(s)
+
+    base, fraction, tz = m.groups()
+    if fraction:
+        base += "." + fraction[:6].ljust(6, "0")
+    if tz == "Z":
+        base += "+00:00"
+    elif tz:
+        base += tz if ":" in tz else f"{tz[:3]}:{tz[3:]}"
+    return datetime.fromisoformat(base)
+
+
+def parse_timestamp(s: str) -> datetime:
+    """Parses a timestamp into a timezone-aware datetime, assuming UTC if no timezone is given."""
+    try:
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        dt = _parse_fallback(s)
+
+    tz = dt.tzinfo
+    if tz is None:
+        return dt.replace(tzinfo=timezone.utc)
+    if tz is not timezone.utc:
+        offset = dt.utcoffset()
+        assert offset is not None
+        cached = _tz_cache.setdefault(offset, tz)
+        if cached is not tz:
+            dt = dt.replace(tzinfo=cached)
+    return dt
+
+
+def parse_timestamps(timestamps: Iterable[str]) -> List[datetime]:
+    """Parses a batch of timestamps, see `parse_timestamp`."""
+    return [parse_timestamp(s) for s in timestamps]
+
+
+def epoch_us(dt: datetime) -> int:
+    """Returns the microseconds since the Unix epoch of a timezone-aware datetime."""
+    return (dt - EPOCH) // _MICROSECOND
+
+
+def to_epoch_us(timestamps: Iterable[str]) -> "array[int]":
+    """Parses a batch of timestamps into an array of microseconds since the Unix epoch."""
+    return array("q", (epoch_us(parse_timestamp(s)) for s in timestamps))
@@ -0,0 +1,236 @@
+"""
+Request-level tracing for ActivityWatchClient.
+
+Every request made with `_get`/`_post`/`_delete` can be recorded as a
+`RequestTrace`, together with the time spent decoding the JSON response and
+constructing `Event` objects from it. Finished traces are passed to hooks,
+which can be used to emit spans to a tracing system or to build a local
+profile (see `ProfileReport`).
+
+When no hooks are registered, tracing is skipped entirely.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter, time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import requests as req
+from tabulate import tabulate
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class RequestTrace:
+    method: str
+    endpoint: str
+    # Name of the client method that made the request, if any
+    call: Optional[str] = None
+    start: float = field(default_factory=time)  # unix time, for building spans
+    payload_bytes: int = 0
+    response_bytes: int = 0
+    status_code: Optional[int] = None
+    # Time until the response headers were received, as measured by requests
+    server_time: float = 0.0
+    # Total time of the request, including downloading the response body
+    request_time: float = 0.0
+    decode_time: float = 0.0
+    construct_time: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def total_time(self) -> float:
+        return self.request_time + self.decode_time + self.construct_time
+
+
+TraceHook = Callable[[RequestTrace], None]
+
+
+class Tracer:
+    """Records request traces and passes them to hooks once the calling client method returns."""
+
+    def __init__(self) -> None:
+        self.hooks: List[TraceHook] = []
+        self._local = threading.local()
+
+    def add_hook(self, hook: TraceHook) -> None:
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: TraceHook) -> None:
+        self.hooks.remove(hook)
+
+    def _state(self) -> Tuple[List[str], List[RequestTrace]]:
+        if not hasattr(self._local, "calls"):
+            self._local.calls = []
+            self._local.traces = []
+        return self._local.calls, self._local.traces
+
+    def _emit(self, traces: List[RequestTrace]) -> None:
+        for trace in traces:
+            for hook in self.hooks:
+                try:
+                    hook(trace)
+                except Exception:
+                    logger.exception("Request trace hook failed")
+
+    @contextmanager
+    def call(self, name: str) -> Iterator[None]:
+        """Groups the requests made within a client method, traces are emitted when it returns."""
+        if not self.hooks:
+            yield
+            return
+
+        calls, traces = self._state()
+        calls.append(name)
+        try:
+            yield
+        finally:
+            calls.pop()
+            if not calls:
+                finished = list(traces)
+                traces.clear()
+                self._emit(finished)
+
+    def request(
+        self,
+        method: str,
+        endpoint: str,
+        send: Callable[..., req.Response],
+        *args: Any,
+        payload_bytes: int = 0,
+        **kwargs: Any,
+    ) -> req.Response:
+        """Sends a request with `send(*args, **kwargs)`, tracing it if there are hooks."""
+        if not self.hooks:
+            return send(*args, **kwargs)
+
+        calls, traces = self._state()
+        trace = RequestTrace(
+            method,
+            endpoint,
+            call=calls[0] if calls else None,
+            payload_bytes=payload_bytes,
+        )
+        t = perf_counter()
+        try:
+            r = send(*args, **kwargs)
+        except Exception as e:
+            trace.error = type(e).__name__
+            raise
+        else:
+            trace.status_code = r.status_code
+            trace.server_time = r.elapsed.total_seconds()
+            trace.response_bytes = len(r.content or b"")
+            return r
+        finally:
+            trace.request_time = perf_counter() - t
+            traces.append(trace)
+            if not calls:
+                # Not made from within a traced client method, emit right away
+                traces.clear()
+                self._emit([trace])
+
+    def _last_trace(self) -> Optional[RequestTrace]:
+        _, traces = self._state()
+        return traces[-1] if traces else None
+
+    def decode(self, r: req.Response) -> Any:
+        """Decodes the JSON body of a response, recording the time it took."""
+        if not self.hooks:
+            return r.json()
+
+        t = perf_counter()
+        data = r.json()
+        trace = self._last_trace()
+        if trace is not None:
+            trace.decode_time += perf_counter() - t
+        return data
+
+    def construct(self, f: Callable[[], T]) -> T:
+        """Calls `f` (which should construct objects from a decoded response), recording the time it took."""
+        if not self.hooks:
+            return f()
+
+        t = perf_counter()
+        result = f()
+        trace = self._last_trace()
+        if trace is not None:
+            trace.construct_time += perf_counter() - t
+        return result
+
+
+class ProfileReport:
+    """A trace hook which aggregates traces per client method and request method."""
+
+    def __init__(self) -> None:
+        self.stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def __call__(self, trace: RequestTrace) -> None:
+        key = (trace.call or trace.endpoint, trace.method)
+        stats = self.stats.setdefault(
+            key,
+            {
+                "count": 0,
+                "payload_bytes": 0,
+                "response_bytes": 0,
+                "server_time": 0.0,
+                "request_time": 0.0,
+                "decode_time": 0.0,
+                "construct_time": 0.0,
+            },
+        )
+        stats["count"] += 1
+        for k in stats:
+            if k != "count":
+                stats[k] += getattr(trace, k)
+
+    def report(self) -> str:
+        """Returns a table of the aggregated traces, most expensive first."""
+        rows = sorted(
+            self.stats.items(),
+            key=lambda kv: (
+                kv[1]["request_time"] + kv[1]["decode_time"] + kv[1]["construct_time"]
+            ),
+            reverse=True,
+        )
+        return tabulate(
+            [
+                (
+                    name,
+                    method,
+                    int(s["count"]),
+                    int(s["payload_bytes"]),
+                    int(s["response_bytes"]),
+                    f"{s['server_time']:.3f}",
+                    f"{s['request_time'] - s['server_time']:.3f}",
+                    f"{s['decode_time']:.3f}",
+                    f"{s['construct_time']:.3f}",
+                )
+                for (name, method), s in rows
+            ],
+            headers=[
+                "Call",
+                "Method",
+                "Count",
+                "Sent (B)",
+                "Received (B)",
+                "Server (s)",
+                "Transfer (s)",
+                "Decode (s)",
+                "Construct (s)",
+            ],
+        )
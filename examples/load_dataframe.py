@@ -6,11 +6,11 @@ import os
 import socket
 from datetime import datetime, timedelta, timezone
 
-import iso8601
 import pandas as pd
 from aw_client import ActivityWatchClient
 from aw_client.classes import default_classes
 from aw_client.queries import DesktopQueryParams, canonicalEvents
+from aw_client.timestamps import to_epoch_us
 
 
 def build_query() -> str:
@@ -50,7 +50,7 @@ def main() -> None:
         e["$category"] = " > ".join(e["$category"])
 
     df = pd.json_normalize(events)
-    df["timestamp"] = pd.to_datetime(df["timestamp"].apply(iso8601.parse_date))
+    df["timestamp"] = pd.to_datetime(to_epoch_us(df["timestamp"]), unit="us", utc=True)
     df.set_index("timestamp", inplace=True)
 
     print(df)
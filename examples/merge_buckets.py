@@ -1,7 +1,7 @@
 from datetime import timedelta
 
 import aw_client
-from aw_transform.filter_period_intersect import _intersecting_eventpairs
+from aw_client.merge import find_overlap, merge_buckets
 
 
 def main():
@@ -16,7 +16,7 @@ def main():
     # You need to set testing=False if you're going to run this on your normal instance
     aw = aw_client.ActivityWatchClient(testing=True)
 
-    buckets = aw.get_buckets()
+    buckets = aw.bucket_registry.buckets()
     print("Available bucket IDs:")
     print()
     for id in buckets.keys():
@@ -26,21 +26,24 @@ def main():
     src_id = input("Source bucket ID: ")
     dest_id = input("Destination bucket ID: ")
 
-    src_events = aw.get_events(src_id)
-    print(f"✓ src events: {len(src_events)}")
-    dest_events = aw.get_events(dest_id)
-    print(f"✓ dest events: {len(dest_events)}")
-
     print("Checking overlap...")
-    overlaps = list(_intersecting_eventpairs(src_events, dest_events))
-    if overlaps:
-        total_duration_src = sum((e.duration for e in src_events), timedelta())
-        total_overlap = sum((tp.duration for _, _, tp in overlaps), timedelta())
+    report = find_overlap(aw, src_id, dest_id)
+    print(f"✓ src duration: {timedelta(seconds=report.src_duration)}")
+    print(f"✓ dest duration: {timedelta(seconds=report.dest_duration)}")
+    skip_overlapping = False
+    if report.overlap:
+        total_overlap = timedelta(seconds=report.overlap_duration)
         print(
-            f"Buckets had overlap ({total_overlap} out of {total_duration_src}), can't safely merge, exiting."
+            f"Buckets had overlap ({total_overlap} out of {timedelta(seconds=report.src_duration)}) in these spans:"
         )
-        exit(1)
-    print("No overlap detected, continuing...")
+        for start, end in report.spans()[:10]:
+            print(f" - {start} - {end}")
+        if input("Merge only the non-overlapping events? (y/n): ") != "y":
+            print("Can't safely merge, exiting.")
+            exit(1)
+        skip_overlapping = True
+    else:
+        print("No overlap detected, continuing...")
 
     print("You want to merge these two buckets:")
     print(f" - {src_id}")
@@ -53,7 +56,12 @@ def main():
         exit(1)
 
     print("Inserting source events into destination bucket...")
-    aw.insert_events(dest_id, src_events)
+    result = merge_buckets(aw, src_id, dest_id)
+    print(f"✓ inserted {result.inserted} events")
+    if skip_overlapping:
+        print(
+            f"✓ skipped {result.skipped} overlapping events ({timedelta(seconds=result.skipped_duration)})"
+        )
 
     print("Operation complete")
     if input("Do you want to delete the source bucket? (y/n): ") == "y":
@@ -9,9 +9,9 @@ from datetime import datetime, timedelta, timezone
 from tabulate import tabulate
 from typing import Dict, List, Tuple, Any
 
-from aw_core import Event
 import aw_client
 from aw_client import queries
+from aw_client.records import EventColumns, to_columns
 
 # set up client
 awc = aw_client.ActivityWatchClient("test")
@@ -54,18 +54,18 @@ def get_events(categories=List[Tuple[Tuple[str], Dict[str, Any]]]):
     )
     events = res[0]["events"]
     print(f"Fetched {len(events)} events")
-    return [Event(**e) for e in events]
-
-
-def events2words(events):
-    for e in events:
-        for v in e.data.values():
-            if isinstance(v, str):
-                for word in v.split():
-                    if len(word) >= 3:
-                        # normalize
-                        word = word.lower()
-                        yield (word, e.duration)
+    return to_columns(events, keys=["app", "title"])
+
+
+def events2words(events: EventColumns):
+    # Sum durations per distinct value first, so each value is only split once
+    for key in events.dictionaries:
+        for v, seconds in events.sum_durations_by(key).items():
+            for word in v.split():
+                if len(word) >= 3:
+                    # normalize
+                    word = word.lower()
+                    yield (word, timedelta(seconds=seconds))
 
 
 def main():
@@ -11,12 +11,12 @@ import re
 import socket
 import sys
 from datetime import datetime, time, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Sequence, Tuple
 
 import aw_client
 from aw_client import queries
-from aw_core import Event
-from aw_transform import flood
+from aw_client.intervals import Intervals, flooded_durations
+from aw_client.rollups import rollup_query, split_events
 from tabulate import tabulate
 
 OUTPUT_HTML = os.environ.get("OUTPUT_HTML", "").lower() == "true"
@@ -37,17 +37,16 @@ assert _pretty_timedelta(timedelta(seconds=120)) == "   2:00"
 assert _pretty_timedelta(timedelta(hours=9, minutes=5)) == "9:05:00"
 
 
-def generous_approx(events: List[dict], max_break: float) -> timedelta:
+def generous_approx(events: List[dict], max_breaks: Sequence[float]) -> List[timedelta]:
     """
     Returns a generous approximation of worked time by including non-categorized time when shorter than a specific duration
 
-    max_break: Max time (in seconds) to flood when there's an empty slot between events
+    max_breaks: Max times (in seconds) to flood when there's an empty slot between events, one result is returned for each
     """
-    events_e: List[Event] = [Event(**e) for e in events]
-    return sum(
-        map(lambda e: e.duration, flood(events_e, max_break)),
-        timedelta(),
-    )
+    return [
+        timedelta(seconds=s)
+        for s in flooded_durations(Intervals.from_events(events), max_breaks)
+    ]
 
 
 def query(regex: str, timeperiods, hostname: str):
@@ -68,7 +67,7 @@ def query(regex: str, timeperiods, hostname: str):
 
     aw = aw_client.ActivityWatchClient(client_name="working_hours")
 
-    canonicalQuery = queries.canonicalEvents(
+    query = rollup_query(
         queries.DesktopQueryParams(
             bid_window=f"aw-watcher-window_{hostname}",
             bid_afk=f"aw-watcher-afk_{hostname}",
@@ -76,15 +75,15 @@ def query(regex: str, timeperiods, hostname: str):
             filter_classes=[["Work"]],
         )
     )
-    query = f"""
-    {canonicalQuery}
-    duration = sum_durations(events);
-    RETURN = {{"events": events, "duration": duration}};
-    """
 
-    res = aw.query(query, timeperiods)
+    # Query the whole range at once, and split the events into days afterwards
+    edges = [start for start, _ in timeperiods] + [timeperiods[-1][1]]
+    events = aw.query(query, [(edges[0], edges[-1])])[0]
 
-    return res
+    return [
+        {"events": day_events, "duration": sum(e["duration"] for e in day_events)}
+        for day_events in split_events(events, edges)
+    ]
 
 
 def main():
@@ -109,8 +108,13 @@ def main():
 
     res = query(regex, timeperiods, hostname)
 
-    for break_time in [0, 5 * 60, 15 * 60]:
-        _print(timeperiods, res, break_time, {"regex": regex})
+    break_times = [0, 5 * 60, 15 * 60]
+    # Durations per day, for each break time
+    durations = [generous_approx(day["events"], break_times) for day in res]
+    for i, break_time in enumerate(break_times):
+        _print(
+            timeperiods, res, [d[i] for d in durations], break_time, {"regex": regex}
+        )
 
     fn = "working_hours_events.json"
     with open(fn, "w") as f:
@@ -118,7 +122,7 @@ def main():
         json.dump(res, f, indent=2)
 
 
-def _print(timeperiods, res, break_time, params: dict):
+def _print(timeperiods, res, durations: List[timedelta], break_time, params: dict):
     print("Using:")
     print(f"  break_time={break_time}")
     print("\n".join(f"  {key}={val}" for key, val in params.items()))
@@ -130,7 +134,7 @@ def _print(timeperiods, res, break_time, params: dict):
                     # Without flooding:
                     # _pretty_timedelta(timedelta(seconds=res[i]["duration"])),
                     # With flooding:
-                    _pretty_timedelta(generous_approx(res[i]["events"], break_time)),
+                    _pretty_timedelta(durations[i]),
                     len(res[i]["events"]),
                 ]
                 for i, (start, stop) in enumerate(timeperiods)
@@ -144,9 +148,7 @@ def _print(timeperiods, res, break_time, params: dict):
         )
     )
 
-    print(
-        f"Total: {sum((generous_approx(res[i]['events'], break_time) for i in range(len(timeperiods))), timedelta())}"
-    )
+    print(f"Total: {sum(durations, timedelta())}")
     print("")
 
 
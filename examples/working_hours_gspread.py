@@ -101,7 +101,7 @@ def update_sheet(sheet_key: str, regex: str):
 
         date = tp[0].date()
         duration = (
-            working_hours.generous_approx(r["events"], break_time).total_seconds()
+            working_hours.generous_approx(r["events"], [break_time])[0].total_seconds()
             / 3600
         )
         row: list[Union[str, float]] = [str(date), duration]
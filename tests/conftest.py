@@ -0,0 +1,12 @@
+import pytest
+
+from aw_client import client as client_module
+
+
+@pytest.fixture
+def client_env(tmp_path, monkeypatch):
+    """Lets tests create clients without the instance lock, keeping queue files in `tmp_path`."""
+    data_dir = tmp_path / "data"
+    monkeypatch.setenv("XDG_DATA_HOME", str(data_dir))
+    monkeypatch.setattr(client_module, "SingleInstance", lambda name: object())
+    return data_dir
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import pytest
+
+from aw_client.archive import Archive, archive_buckets, write_archive
+from aw_client.buckets import BucketRegistry
+from aw_client.records import EventRecord, to_columns
+
+t0 = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+events: List[EventRecord] = [
+    EventRecord(1, t0, 3600.0, {"app": "vim", "title": "archive.py"}),
+    EventRecord(3, t0 + timedelta(hours=3), 60.0, {"app": "vim", "title": "x"}),
+    # Out of order, with other keys and non-string values
+    EventRecord(2, t0 + timedelta(hours=2), 1.5, {"$category": ["Work", "Code"]}),
+    EventRecord(4, t0 + timedelta(days=1), 10.0, {"app": "firefox", "n": 1}),
+]
+
+
+def test_archive_roundtrip(tmp_path):
+    path = str(tmp_path / "events.awa")
+    counts = write_archive(
+        path, [({"id": "a", "type": "t"}, events), ({"id": "b"}, [])]
+    )
+    assert counts == {"a": 4, "b": 0}
+
+    with Archive(path) as archive:
+        bucket = archive.buckets["a"]
+        assert bucket.meta == {"id": "a", "type": "t"}
+        assert len(bucket) == 4
+        assert list(bucket.ids) == [1, 2, 3, 4]
+
+        restored = list(bucket.events())
+        expected = sorted(events, key=lambda e: e.timestamp)
+        assert [e.to_json_dict() for e in restored] == [
+            e.to_json_dict() for e in expected
+        ]
+        assert list(archive.buckets["b"].events()) == []
+
+
+def test_archive_time_range(tmp_path):
+    path = str(tmp_path / "events.awa")
+    write_archive(path, [({"id": "a"}, events)])
+
+    with Archive(path) as archive:
+        bucket = archive.buckets["a"]
+        # Includes the events which might overlap the start
+        start, end = t0 + timedelta(minutes=30), t0 + timedelta(hours=3)
+        assert [e.id for e in bucket.events(start, end)] == [1, 2]
+
+        # The short event 2 might overlap by its start, but ends before it
+        later = t0 + timedelta(hours=2, minutes=1)
+        lo, hi = bucket.span(later)
+        assert list(bucket.ids[lo:hi]) == [2, 3, 4]
+        assert [e.id for e in bucket.events(later)] == [3, 4]
+        assert list(bucket.columns(later).ids) == [3, 4]
+
+        columns = bucket.columns(start, end, keys=["app", "$category"])
+        raw = [e.to_json_dict() for e in bucket.events(start, end)]
+        assert columns == to_columns(raw, keys=["app", "$category"])
+
+
+def test_archive_buckets(tmp_path):
+    class MockClient:
+        def __init__(self) -> None:
+            self.bucket_registry = BucketRegistry(self)  # type: ignore
+
+        def get_buckets(self):
+            return {"a": {"id": "a", "metadata": {"start": t0.isoformat()}}}
+
+        def get_events(self, bucket_id, start, end, raw):
+            return [e for e in events if start <= e.timestamp < end]
+
+    client: Any = MockClient()
+    path = str(tmp_path / "events.awa")
+    counts: Dict[str, int] = archive_buckets(client, path, window=timedelta(hours=1))
+    assert counts == {"a": 4}
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "export.json"
+    path.write_text('{"buckets": {}}' + " " * 16)
+    with pytest.raises(ValueError):
+        Archive(str(path))
@@ -42,14 +42,15 @@ def test_load_local_server_api_key_matches_port(tmp_path, monkeypatch):
     assert load_local_server_api_key("example.com", 5601) is None
 
 
-def test_client_sends_authorization_header_for_local_server(tmp_path, monkeypatch):
+def test_client_sends_authorization_header_for_local_server(
+    tmp_path, monkeypatch, client_env
+):
     monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
     write_server_config(
         tmp_path,
         "config.toml",
         'port = 5600\n\n[auth]\napi_key = "secret123"\n',
     )
-    monkeypatch.setattr(client_module, "SingleInstance", lambda name: object())
 
     captured = {}
 
@@ -66,14 +67,15 @@ def test_client_sends_authorization_header_for_local_server(tmp_path, monkeypatc
     assert captured["headers"]["Authorization"] == "Bearer secret123"
 
 
-def test_client_skips_authorization_header_for_remote_server(tmp_path, monkeypatch):
+def test_client_skips_authorization_header_for_remote_server(
+    tmp_path, monkeypatch, client_env
+):
     monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
     write_server_config(
         tmp_path,
         "config.toml",
         'port = 5600\n\n[auth]\napi_key = "secret123"\n',
     )
-    monkeypatch.setattr(client_module, "SingleInstance", lambda name: object())
 
     captured = {}
 
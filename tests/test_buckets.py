@@ -0,0 +1,96 @@
+from typing import Any
+
+import pytest
+
+from aw_client.buckets import BucketRegistry
+
+
+class MockClient:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.buckets = {
+            "aw-watcher-window_laptop": {
+                "type": "currentwindow",
+                "hostname": "laptop",
+                "client": "aw-watcher-window",
+                "last_updated": "2024-05-01T10:00:00+00:00",
+            },
+            "aw-watcher-afk_laptop": {
+                "type": "afkstatus",
+                "hostname": "laptop",
+                "client": "aw-watcher-afk",
+                "last_updated": "2024-05-01T10:00:00+00:00",
+            },
+            "aw-watcher-window_desktop": {
+                "type": "currentwindow",
+                "hostname": "desktop",
+                "client": "aw-watcher-window",
+                "last_updated": "2024-05-01T10:00:00+00:00",
+            },
+            "aw-watcher-web-firefox": {
+                "type": "web.tab.current",
+                "hostname": "laptop",
+                "client": "aw-client-web",
+                "last_updated": "2024-05-01T10:00:00+00:00",
+            },
+        }
+
+    def get_buckets(self):
+        self.calls += 1
+        return {k: dict(v) for k, v in self.buckets.items()}
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lookups():
+    registry = BucketRegistry(MockClient())  # type: ignore
+    assert registry.find(type="currentwindow") == [
+        "aw-watcher-window_laptop",
+        "aw-watcher-window_desktop",
+    ]
+    assert registry.find(type="currentwindow", hostname="desktop") == [
+        "aw-watcher-window_desktop"
+    ]
+    assert registry.find(client="aw-watcher-afk", hostname="desktop") == []
+    assert len(registry.find()) == 4
+    assert registry.browsers() == [("firefox", "aw-watcher-web-firefox")]
+    assert registry.get("aw-watcher-afk_laptop")["type"] == "afkstatus"  # type: ignore
+
+
+def test_ttl_and_revalidation():
+    client: Any = MockClient()
+    clock = Clock()
+    registry = BucketRegistry(client, ttl=60, clock=clock)
+
+    buckets = registry.buckets()
+    assert registry.version == 1
+    # Shared by all callers, so it can't be modified
+    with pytest.raises(TypeError):
+        buckets["other"] = {}  # type: ignore
+    clock.now = 30
+    assert registry.buckets() is buckets
+    assert client.calls == 1
+
+    # Fetched again after the TTL, new events don't change the indexes
+    client.buckets["aw-watcher-afk_laptop"]["last_updated"] = "2024-05-01T11:00:00"
+    clock.now = 61
+    refreshed = registry.buckets()
+    assert client.calls == 2
+    assert refreshed["aw-watcher-afk_laptop"]["last_updated"] == "2024-05-01T11:00:00"
+    assert registry.version == 1
+
+    client.buckets["aw-watcher-web-chrome"] = {
+        "type": "web.tab.current",
+        "hostname": "laptop",
+        "client": "aw-client-web",
+    }
+    registry.invalidate()
+    assert len(registry.find(type="web.tab.current")) == 2
+    assert client.calls == 3
+    assert registry.version == 2
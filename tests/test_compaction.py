@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from aw_client.buckets import BucketRegistry
+from aw_client.compaction import compact_bucket
+from aw_client.records import EventRecord
+
+start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+now = start + timedelta(days=40)
+
+
+class MockClient:
+    def __init__(self, events: List[EventRecord]) -> None:
+        self.events: Dict[int, EventRecord] = {e.id: e for e in events}  # type: ignore
+        self.next_id = 1000
+        self.requests: List[str] = []
+        self.bucket_registry = BucketRegistry(self)  # type: ignore
+
+    def get_buckets(self):
+        return {"bucket": {"created": start.isoformat()}}
+
+    def get_eventcount(self, bucket_id, end):
+        return sum(1 for e in self.events.values() if e.timestamp < end)
+
+    def get_events(self, bucket_id, start, end, raw):
+        self.requests.append("get")
+        return [
+            e
+            for e in self.events.values()
+            if start <= e.timestamp and e.timestamp + e.duration < end
+        ]
+
+    def insert_events(self, bucket_id, events):
+        self.requests.append("insert")
+        for e in events:
+            self.events[self.next_id] = EventRecord(
+                self.next_id, e.timestamp, e.duration.total_seconds(), e.data
+            )
+            self.next_id += 1
+
+    def delete_events(self, bucket_id, event_ids):
+        self.requests.append("delete")
+        for i in event_ids:
+            del self.events[i]
+        return {i: None for i in event_ids}
+
+
+def _heartbeats() -> List[EventRecord]:
+    events = []
+    for i in range(30):
+        app = "vim" if i < 20 else "firefox"
+        events.append(
+            EventRecord(i, start + timedelta(seconds=10 * i), 9, {"app": app})
+        )
+    # A short event after a long gap
+    events.append(EventRecord(30, start + timedelta(hours=1), 2, {"app": "vim"}))
+    # Recent events are left alone
+    events.append(EventRecord(31, now - timedelta(days=1), 5, {"app": "vim"}))
+    return events
+
+
+def test_compaction_dry_run():
+    client: Any = MockClient(_heartbeats())
+    result = compact_bucket(client, "bucket", pulsetime=1, now=now, dry_run=True)
+    assert (result.events_before, result.events_after) == (31, 3)
+    assert "insert" not in client.requests
+    assert len(client.events) == 32
+
+
+def test_compaction(tmp_path):
+    client: Any = MockClient(_heartbeats())
+    checkpoint_path = str(tmp_path / "compact.json")
+    result = compact_bucket(
+        client,
+        "bucket",
+        pulsetime=1,
+        min_duration=5,
+        now=now,
+        checkpoint_path=checkpoint_path,
+    )
+    assert (result.events_before, result.events_after) == (31, 2)
+    assert result.dropped_duration == 2
+
+    events = sorted(client.events.values(), key=lambda e: e.timestamp)
+    assert [(e.data["app"], e.duration_seconds) for e in events] == [
+        ("vim", 199),
+        ("firefox", 99),
+        ("vim", 5),
+    ]
+
+    # Resumes from the checkpoint, so nothing is fetched again
+    client.requests.clear()
+    result = compact_bucket(client, "bucket", now=now, checkpoint_path=checkpoint_path)
+    assert result.events_before == 0
+    assert client.requests == []
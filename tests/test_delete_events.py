@@ -0,0 +1,81 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import pytest
+import requests
+
+from aw_client import ActivityWatchClient
+from aw_client import client as client_module
+from aw_client.records import EventRecord
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.deleted: List[str] = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def delete(self, url, headers=None):
+        r = requests.Response()
+        r.url = url
+        event_id = url.rsplit("/", 1)[-1]
+        r.status_code = 404 if event_id == "3" else 200
+        with self.lock:
+            self.deleted.append(event_id)
+        return r
+
+
+def test_delete_events(monkeypatch, client_env):
+    session = FakeSession()
+    monkeypatch.setattr(client_module.req, "Session", lambda: session)
+
+    client = ActivityWatchClient("test-client", testing=True)
+    outcomes = client.delete_events("test-bucket", range(5), max_workers=2)
+
+    assert sorted(session.deleted) == ["0", "1", "2", "3", "4"]
+    assert list(outcomes) == [0, 1, 2, 3, 4]
+    assert [i for i, error in outcomes.items() if error is not None] == [3]
+    assert "404" in str(outcomes[3])
+
+    with pytest.raises(ValueError):
+        client.delete_events("test-bucket")
+
+
+def test_delete_events_in_range(monkeypatch, client_env):
+    session = FakeSession()
+    monkeypatch.setattr(client_module.req, "Session", lambda: session)
+    client = ActivityWatchClient("test-client", testing=True)
+
+    start = datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    end = start + timedelta(hours=1)
+    events = [
+        # Starts before the range
+        EventRecord(1, start - timedelta(minutes=5), 600, {}),
+        # Inside, touching the bounds
+        EventRecord(2, start, 60, {}),
+        EventRecord(4, end - timedelta(minutes=1), 60, {}),
+        # Ends after the range
+        EventRecord(5, end - timedelta(minutes=1), 120, {}),
+    ]
+    queried = []
+
+    def get_events(bucket_id, start=None, end=None, raw=False):
+        queried.append((start, end))
+        return [
+            e for e in events if e.timestamp < end and e.timestamp + e.duration > start
+        ]
+
+    monkeypatch.setattr(client, "get_events", get_events)
+
+    outcomes = client.delete_events("test-bucket", start=start, end=end)
+    assert sorted(outcomes) == [2, 4]
+    assert queried[0][0] < start and queried[0][1] > end
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, List
+
+import requests
+
+from aw_client import ActivityWatchClient
+from aw_client import client as client_module
+from aw_client.estimates import EventEstimate, estimate_buckets
+from aw_client.records import EventRecord
+
+t0 = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+class MockClient:
+    def __init__(self, events: List[EventRecord]) -> None:
+        self.events = events
+        self.limits: List[int] = []
+
+    def get_eventcount(self, bucket_id, start, end):
+        return sum(1 for e in self.events if start <= e.timestamp < end)
+
+    def get_events(self, bucket_id, limit, start, end, raw):
+        self.limits.append(limit)
+        events = [e for e in self.events if start <= e.timestamp < end]
+        return events[::-1][:limit]
+
+
+def test_estimate_buckets():
+    events = [
+        EventRecord(i, t0 + timedelta(minutes=i), 60.0, {"app": "vim"})
+        for i in range(1000)
+    ]
+    client: Any = MockClient(events)
+    end = t0 + timedelta(days=1)
+    estimate = estimate_buckets(client, ["a"], t0, end, sample_size=10)["a"]
+
+    assert estimate.count == 1000
+    assert client.limits == [10]
+    assert 50 < estimate.bytes_per_event < 100
+    assert estimate.approx_bytes == round(1000 * estimate.bytes_per_event)
+    assert estimate.suggest_window(target_events=100) == timedelta(hours=2.4)
+
+    empty = estimate_buckets(client, ["a"], end, end + timedelta(days=1))["a"]
+    assert empty == EventEstimate("a", end, end + timedelta(days=1), 0, 0.0)
+    assert client.limits == [10]
+
+
+def test_get_eventcount_limit(monkeypatch, client_env):
+    def get(url, params=None, headers=None):
+        r = requests.Response()
+        r.url = url
+        r.status_code = 200
+        r._content = b"42"
+        return r
+
+    monkeypatch.setattr(client_module.req, "get", get)
+
+    client = ActivityWatchClient("test-client", testing=True)
+    assert client.get_eventcount("test-bucket") == 42
+    assert client.get_eventcount("test-bucket", limit=10) == 10
@@ -0,0 +1,68 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from aw_client.buckets import BucketRegistry
+from aw_client.export import export_ndjson, open_ndjson
+from aw_client.records import EventRecord
+
+created = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+class MockClient:
+    def __init__(self, buckets: Dict[str, List[EventRecord]]) -> None:
+        self.buckets = buckets
+        self.get_buckets_calls = 0
+        self.bucket_registry = BucketRegistry(self)  # type: ignore
+
+    def get_buckets(self):
+        self.get_buckets_calls += 1
+        return {
+            bucket_id: {"id": bucket_id, "created": created.isoformat()}
+            for bucket_id in self.buckets
+        }
+
+    def get_eventcount(self, bucket_id, end):
+        return sum(1 for e in self.buckets[bucket_id] if e.timestamp < end)
+
+    def get_events(self, bucket_id, start, end, raw):
+        return [e for e in self.buckets[bucket_id] if start <= e.timestamp < end]
+
+
+def test_export_ndjson(tmp_path):
+    buckets = {
+        "a": [
+            # Older than the bucket, as if it was imported
+            EventRecord(1, "2024-01-01T00:00:00+00:00", 1.0, {"app": "vim"}),
+            EventRecord(2, "2024-05-02T00:00:00+00:00", 2.0, {"app": "firefox"}),
+        ],
+        "b": [
+            EventRecord(1, created + timedelta(days=i), 1.0, {"status": "afk"})
+            for i in range(20)
+        ],
+    }
+    client: Any = MockClient(buckets)
+    path = str(tmp_path / "export.ndjson.gz")
+
+    counts = export_ndjson(client, path, max_workers=2)
+    assert counts == {"a": 2, "b": 20}
+    assert client.get_buckets_calls == 1
+
+    with open_ndjson(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["bucket"]["id"] for line in lines if "bucket" in line] == ["a", "b"]
+    events_a = [line["event"] for line in lines if line.get("bucket_id") == "a"]
+    assert events_a == [
+        {
+            "id": 1,
+            "timestamp": "2024-01-01T00:00:00+00:00",
+            "duration": 1.0,
+            "data": {"app": "vim"},
+        },
+        {
+            "id": 2,
+            "timestamp": "2024-05-02T00:00:00+00:00",
+            "duration": 2.0,
+            "data": {"app": "firefox"},
+        },
+    ]
@@ -0,0 +1,148 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from aw_client.buckets import BucketRegistry
+from aw_client.export import open_ndjson
+from aw_client.imports import import_file, read_export
+
+
+def _event(i: int) -> dict:
+    return {
+        "id": i,
+        "timestamp": f"2024-05-01T00:{i:02}:00+00:00",
+        "duration": 1.0,
+        "data": {"app": "vim"},
+    }
+
+
+class MockClient:
+    def __init__(
+        self, existing: Optional[Dict[str, int]] = None, fail_after=None
+    ) -> None:
+        # Like the server, event IDs are global rather than per bucket
+        self.events: Dict[int, Tuple[str, dict]] = {}
+        self.bucket_ids = set()
+        self.posts = 0
+        self.fail_after = fail_after
+        self.bucket_registry = BucketRegistry(self)  # type: ignore
+        for bucket_id, n in (existing or {}).items():
+            self.bucket_ids.add(bucket_id)
+            self._post(f"buckets/{bucket_id}/events", [_event(i) for i in range(n)])
+        self.posts = 0
+
+    def get_buckets(self):
+        return {bucket_id: {"id": bucket_id} for bucket_id in self.bucket_ids}
+
+    def import_bucket(self, bucket):
+        assert bucket["events"] == []
+        self.bucket_ids.add(bucket["id"])
+        self.bucket_registry.invalidate()
+
+    def _post(self, endpoint: str, data: List[dict]):
+        if self.fail_after is not None and self.posts >= self.fail_after:
+            raise ConnectionError("server went away")
+        self.posts += 1
+        bucket_id = endpoint.split("/")[1]
+        for e in data:
+            # Events with an ID replace the event with that ID, in any bucket
+            event_id = e["id"] if e.get("id") is not None else len(self.events) + 1000
+            self.events[event_id] = (bucket_id, e)
+
+    def bucket_events(self, bucket_id: str) -> List[dict]:
+        return sorted(
+            (e for bid, e in self.events.values() if bid == bucket_id),
+            key=lambda e: e["timestamp"],
+        )
+
+
+def _write_ndjson(path: str, buckets: Dict[str, List[dict]]) -> None:
+    with open_ndjson(path, "wt") as f:
+        for bucket_id, events in buckets.items():
+            f.write(json.dumps({"bucket": {"id": bucket_id, "type": "t"}}) + "\n")
+            for e in events:
+                f.write(json.dumps({"bucket_id": bucket_id, "event": e}) + "\n")
+
+
+def test_read_export_json(tmp_path):
+    path = str(tmp_path / "export.json")
+    with open(path, "w") as f:
+        json.dump({"buckets": {"a": {"type": "t", "events": [_event(1)]}}}, f)
+    assert list(read_export(path)) == [
+        ("bucket", {"id": "a", "type": "t"}),
+        ("event", ("a", _event(1))),
+    ]
+
+
+def test_import_file(tmp_path):
+    path = str(tmp_path / "export.ndjson.gz")
+    _write_ndjson(path, {"a": [_event(i) for i in range(25)], "b": [_event(1)]})
+    client: Any = MockClient()
+
+    counts = import_file(client, path, chunk_size=10, max_workers=2)
+    assert counts == {"a": 25, "b": 1}
+    assert len(client.bucket_events("a")) == 25
+    assert len(client.bucket_events("b")) == 1
+    assert client.posts == 4
+    assert not os.path.exists(path + ".progress")
+
+
+def test_import_file_resumes(tmp_path):
+    path = str(tmp_path / "export.ndjson")
+    _write_ndjson(path, {"a": [_event(i) for i in range(25)]})
+
+    client: Any = MockClient(fail_after=1)
+    with pytest.raises(ConnectionError):
+        import_file(client, path, chunk_size=10, max_workers=1)
+    with open(path + ".progress") as f:
+        assert json.load(f) == {"created": ["a"], "done": {"a": 10}}
+
+    # The bucket now exists, but was created by the interrupted import
+    client.fail_after = None
+    client.posts = 0
+    assert import_file(client, path, chunk_size=10) == {"a": 25}
+    assert client.posts == 2
+    # Nothing was uploaded twice
+    assert client.bucket_events("a") == [
+        {k: v for k, v in _event(i).items() if k != "id"} for i in range(25)
+    ]
+
+
+def test_import_file_skips_existing(tmp_path):
+    path = str(tmp_path / "export.ndjson")
+    _write_ndjson(path, {"a": [_event(1)], "b": [_event(2)]})
+    client: Any = MockClient(existing={"a": 0})
+
+    assert import_file(client, path) == {"b": 1}
+    assert client.bucket_events("a") == []
+
+
+def test_import_file_keeps_existing_events(tmp_path):
+    path = str(tmp_path / "export.ndjson")
+    _write_ndjson(path, {"a": [_event(i) for i in range(10)]})
+    # The server already has events with the same IDs, in another bucket
+    client: Any = MockClient(existing={"x": 10})
+
+    assert import_file(client, path, chunk_size=4) == {"a": 10}
+    assert client.bucket_events("x") == [_event(i) for i in range(10)]
+    assert len(client.bucket_events("a")) == 10
+    assert all("id" not in e for e in client.bucket_events("a"))
+
+
+def test_import_file_resumes_out_of_order_chunks(tmp_path):
+    path = str(tmp_path / "export.ndjson")
+    _write_ndjson(path, {"a": [_event(i) for i in range(25)]})
+    # The second chunk finished, but the first one didn't
+    with open(path + ".progress", "w") as f:
+        json.dump(
+            {"created": ["a"], "done": {"a": 0}, "uploaded": {"a": [[10, 20]]}}, f
+        )
+    client: Any = MockClient(existing={"a": 0})
+    client._post("buckets/a/events", [_event(i) for i in range(10, 20)])
+    client.posts = 0
+
+    assert import_file(client, path, chunk_size=10) == {"a": 25}
+    assert client.posts == 2
+    assert len(client.bucket_events("a")) == 25
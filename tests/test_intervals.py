@@ -0,0 +1,66 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from aw_core.models import Event
+from aw_transform import flood as aw_flood
+
+from aw_client.intervals import (
+    Intervals,
+    flood,
+    flooded_durations,
+    intersection,
+    normalize,
+    sum_durations,
+    union,
+)
+
+
+def _intervals(*pairs) -> Intervals:
+    iv = Intervals()
+    for start, end in pairs:
+        iv.append(start, end)
+    return iv
+
+
+def test_normalize():
+    iv = normalize(_intervals((5, 8), (0, 2), (1, 3), (3, 4), (6, 7), (9, 9)))
+    assert list(iv) == [(0, 4), (5, 8)]
+
+
+def test_union_and_intersection():
+    a = _intervals((0, 10), (20, 30))
+    b = _intervals((5, 25), (40, 50))
+    assert list(union(a, b)) == [(0, 30), (40, 50)]
+    assert list(intersection(a, b)) == [(5, 10), (20, 25)]
+    assert list(intersection(a, Intervals())) == []
+
+
+def test_flood():
+    second = 1_000_000
+    iv = _intervals(
+        (0, 10 * second), (15 * second, 20 * second), (60 * second, 70 * second)
+    )
+    assert list(flood(iv, 5)) == [(0, 20 * second), (60 * second, 70 * second)]
+    assert flooded_durations(iv, [0, 5, 39, 40]) == [25, 30, 30, 70]
+    assert sum_durations(flood(iv, 40)) == 70
+
+
+def test_flooded_durations_match_aw_transform():
+    rng = random.Random(0)
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    events: List[Dict[str, Any]] = []
+    for _ in range(200):
+        start += timedelta(seconds=rng.randint(0, 600))
+        duration: float = rng.randint(1, 300)
+        events.append(
+            {"timestamp": start.isoformat(), "duration": duration, "data": {"a": 1}}
+        )
+        start += timedelta(seconds=duration)
+
+    max_breaks = [0, 60, 300]
+    durations = flooded_durations(Intervals.from_events(events), max_breaks)
+    for max_break, duration in zip(max_breaks, durations):
+        flooded = aw_flood([Event(**e) for e in events], max_break)
+        expected = sum((e.duration for e in flooded), timedelta())
+        assert duration == expected.total_seconds()
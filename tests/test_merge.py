@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from aw_client.merge import find_overlap, merge_buckets
+from aw_client.records import EventRecord
+from aw_client.streaming import EventStream
+
+start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def _event(id: int, minutes: float, duration_minutes: float, app: str) -> EventRecord:
+    return EventRecord(
+        id, start + timedelta(minutes=minutes), duration_minutes * 60, {"app": app}
+    )
+
+
+class MockClient:
+    """Returns events clipped to the requested range, like aw-server-rust."""
+
+    def __init__(self, buckets: Dict[str, List[EventRecord]]) -> None:
+        self.buckets = buckets
+        self.inserted: List[Any] = []
+
+    def get_events(self, bucket_id, start, end, raw):
+        events = []
+        for e in self.buckets[bucket_id]:
+            e_end = e.timestamp + e.duration
+            if e_end < start or e.timestamp > end:
+                continue
+            clipped_start = max(e.timestamp, start)
+            clipped_end = min(e_end, end)
+            events.append(
+                EventRecord(
+                    e.id,
+                    clipped_start,
+                    (clipped_end - clipped_start).total_seconds(),
+                    e.data,
+                )
+            )
+        # Newest first
+        return events[::-1]
+
+    def insert_events(self, bucket_id, events):
+        self.inserted.append((bucket_id, list(events)))
+
+
+src = [
+    _event(1, 0, 50, "vim"),
+    # Crosses the window edge at 60 minutes
+    _event(2, 55, 10, "firefox"),
+    _event(3, 100, 30, "vim"),
+    _event(4, 170, 5, "vim"),
+]
+dest = [
+    _event(1, 120, 20, "vim"),
+    _event(2, 160, 5, "vim"),
+]
+window = timedelta(hours=1)
+end = start + timedelta(hours=3)
+
+
+def test_event_stream_stitches_events():
+    client: Any = MockClient({"src": src})
+    events = list(EventStream(client, "src", start, end, window))
+    assert [(e.id, e.duration_seconds) for e in events] == [
+        (1, 3000),
+        (2, 600),
+        (3, 1800),
+        (4, 300),
+    ]
+    assert events[1].timestamp == start + timedelta(minutes=55)
+
+
+def test_find_overlap():
+    client: Any = MockClient({"src": src, "dest": dest})
+    report = find_overlap(client, "src", "dest", start, end, window)
+    assert report.src_duration == 95 * 60
+    assert report.dest_duration == 25 * 60
+    assert report.overlap_duration == 10 * 60
+    assert report.spans() == [
+        (start + timedelta(minutes=120), start + timedelta(minutes=130))
+    ]
+
+
+def test_merge_buckets():
+    client: Any = MockClient({"src": src, "dest": dest})
+    result = merge_buckets(client, "src", "dest", start, end, window, chunk_size=2)
+    assert (result.inserted, result.skipped) == (3, 1)
+    assert [len(events) for _, events in client.inserted] == [2, 1]
+    inserted = [e for _, events in client.inserted for e in events]
+    assert [e.data["app"] for e in inserted] == ["vim", "firefox", "vim"]
+    assert all(e.id is None for e in inserted)
+
+    client.inserted.clear()
+    merge_buckets(client, "src", "dest", start, end, window, dry_run=True)
+    assert client.inserted == []
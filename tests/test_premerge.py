@@ -0,0 +1,198 @@
+import os
+import random
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from typing import List
+from time import monotonic
+
+import pytest
+import requests
+from aw_core.models import Event
+from aw_transform.heartbeats import heartbeat_reduce
+from aw_client import ActivityWatchClient
+from aw_client.premerge import (
+    HeartbeatCheckpoint,
+    HeartbeatPremerger,
+    merge_heartbeats,
+)
+
+now = datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+
+
+def heartbeat(seconds: float, app: str = "test") -> Event:
+    return Event(timestamp=now + timedelta(seconds=seconds), data={"app": app})
+
+
+def make_premerger(**kwargs):
+    committed = []
+    premerger = HeartbeatPremerger(
+        lambda bid, pulsetime, e: committed.append((bid, e)), **kwargs
+    )
+    return premerger, committed
+
+
+def test_merges_until_commit_interval():
+    premerger, committed = make_premerger(commit_interval=10)
+    for i in range(12):
+        premerger.heartbeat("bucket", heartbeat(i), pulsetime=2)
+
+    assert len(committed) == 1
+    assert committed[0][1].duration == timedelta(seconds=10)
+    assert premerger.pending["bucket"].timestamp == now + timedelta(seconds=10)
+
+
+def test_commits_on_data_change():
+    premerger, committed = make_premerger(commit_interval=10)
+    premerger.heartbeat("bucket", heartbeat(0, "a"), pulsetime=2)
+    premerger.heartbeat("bucket", heartbeat(1, "a"), pulsetime=2)
+    premerger.heartbeat("bucket", heartbeat(2, "b"), pulsetime=2)
+
+    assert [(bid, e.data["app"], e.duration) for bid, e in committed] == [
+        ("bucket", "a", timedelta(seconds=1))
+    ]
+
+
+def test_flushes_expired_buckets():
+    premerger, committed = make_premerger(commit_interval=10, max_age=5, tick=0.5)
+    premerger.heartbeat("bucket1", heartbeat(0), pulsetime=2)
+    premerger.heartbeat("bucket2", heartbeat(0), pulsetime=2)
+
+    premerger.flush_expired()
+    premerger.flush_expired(now=monotonic() + 2)
+    assert committed == []
+
+    premerger.flush_expired(now=monotonic() + 10)
+    assert sorted(bid for bid, _ in committed) == ["bucket1", "bucket2"]
+    assert premerger.pending == {}
+
+
+def test_flush_all():
+    premerger, committed = make_premerger(commit_interval=10)
+    for i in range(100):
+        premerger.heartbeat(f"bucket{i}", heartbeat(0), pulsetime=2)
+
+    premerger.flush_all()
+    assert len(committed) == 100
+    assert premerger.pending == {}
+
+
+def test_checkpoint_recovery(tmp_path):
+    path = str(tmp_path / "test.premerge")
+    premerger, committed = make_premerger(
+        commit_interval=10, checkpoint=HeartbeatCheckpoint(path)
+    )
+    for i in range(3):
+        premerger.heartbeat("bucket", heartbeat(i), pulsetime=2)
+    assert committed == []
+
+    # Simulate a restart after the process was killed
+    premerger, committed = make_premerger(
+        commit_interval=10, checkpoint=HeartbeatCheckpoint(path)
+    )
+    premerger.recover()
+    assert len(committed) == 1
+    assert committed[0][1].duration == timedelta(seconds=2)
+
+    # Recovered heartbeats are only committed once
+    premerger, committed = make_premerger(
+        commit_interval=10, checkpoint=HeartbeatCheckpoint(path)
+    )
+    premerger.recover()
+    assert committed == []
+
+
+def test_merge_heartbeats_matches_heartbeat_reduce():
+    rng = random.Random(0)
+    events = []
+    t = 0.0
+    for _ in range(500):
+        t += rng.choice([0.5, 1, 1, 3])
+        events.append(
+            Event(
+                timestamp=now + timedelta(seconds=t),
+                duration=rng.choice([0, 0, 2]),
+                data={"app": rng.choice(["a", "a", "b"])},
+            )
+        )
+
+    expected = heartbeat_reduce(deepcopy(events), pulsetime=2)
+    assert merge_heartbeats(events, pulsetime=2) == expected
+
+
+def test_client_checkpoint_is_keyed_by_server(client_env):
+
+    paths = {
+        ActivityWatchClient(
+            "test-client", testing=True, host=host, port=port
+        )._premerger._checkpoint.path  # type: ignore
+        for host, port in [("127.0.0.1", 5666), ("127.0.0.1", 5667), ("::1", 5666)]
+    }
+    assert len(paths) == 3
+    assert all(path.startswith(str(client_env)) for path in paths)
+
+
+def test_client_opens_checkpoint_on_first_heartbeat(client_env):
+    client = ActivityWatchClient("test-client", testing=True)
+    checkpoint = client._premerger._checkpoint
+    assert checkpoint is not None
+    assert not os.path.exists(checkpoint.path)
+
+    client._premerger.heartbeat("bucket", heartbeat(0), pulsetime=2)
+    assert os.path.exists(checkpoint.path)
+
+    # Closed on disconnect, and reopened if heartbeats are sent afterwards
+    client._premerger.close()
+    client._premerger.heartbeat("bucket", heartbeat(1), pulsetime=2)
+    assert [bid for bid, _, _ in checkpoint.load()] == ["bucket"]
+
+
+def test_heartbeat_many_merges_pending_heartbeat(monkeypatch, client_env):
+    client = ActivityWatchClient("test-client", testing=True)
+    inserted: List[Event] = []
+    monkeypatch.setattr(
+        client, "insert_events", lambda bucket_id, events: inserted.extend(events)
+    )
+
+    client._premerger.heartbeat("bucket", heartbeat(0), pulsetime=2)
+    client._premerger.heartbeat("bucket", heartbeat(1), pulsetime=2)
+    client.heartbeat_many("bucket", [heartbeat(i) for i in range(2, 5)], pulsetime=2)
+
+    assert [(e.timestamp, e.duration) for e in inserted] == [
+        (now, timedelta(seconds=4))
+    ]
+    assert client._premerger.pending == {}
+    assert client.request_queue._persistqueue.qsize() == 0
+
+
+def test_heartbeat_many_pending_flushed_during_insert(monkeypatch, client_env):
+    client = ActivityWatchClient("test-client", testing=True)
+    inserted: List[Event] = []
+
+    def insert_events(bucket_id, events):
+        # The tick flushing expired heartbeats while the batch is being inserted
+        client._premerger.flush_all()
+        inserted.extend(events)
+
+    monkeypatch.setattr(client, "insert_events", insert_events)
+
+    client._premerger.heartbeat("bucket", heartbeat(0), pulsetime=2)
+    client.heartbeat_many("bucket", [heartbeat(i) for i in range(1, 3)], pulsetime=2)
+
+    # Only sent once, with the batch
+    assert len(inserted) == 1
+    assert client.request_queue._persistqueue.qsize() == 0
+
+
+def test_heartbeat_many_restores_pending_on_error(monkeypatch, client_env):
+    client = ActivityWatchClient("test-client", testing=True)
+
+    def insert_events(bucket_id, events):
+        raise requests.ConnectionError()
+
+    monkeypatch.setattr(client, "insert_events", insert_events)
+
+    pending = heartbeat(0)
+    client._premerger.heartbeat("bucket", pending, pulsetime=2)
+    with pytest.raises(requests.ConnectionError):
+        client.heartbeat_many("bucket", [heartbeat(1)], pulsetime=2)
+    assert client._premerger.pending == {"bucket": pending}
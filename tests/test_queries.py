@@ -0,0 +1,120 @@
+import dataclasses
+
+import pytest
+
+from aw_client import queries
+from aw_client.classes import default_classes
+
+
+def make_params(**kwargs) -> queries.DesktopQueryParams:
+    defaults = dict(
+        bid_window='aw-watcher-window_my"host',
+        bid_afk="aw-watcher-afk_myhost",
+        bid_browsers=["aw-watcher-web-firefox_myhost"],
+        classes=default_classes,
+    )
+    return queries.DesktopQueryParams(**{**defaults, **kwargs})
+
+
+def test_params_are_immutable_and_hashable():
+    params = make_params()
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        params.bid_window = "other"  # type: ignore
+    assert hash(params) == hash(make_params())
+    assert params == make_params()
+    assert params != make_params(filter_afk=False)
+
+
+def test_fullDesktopQuery_is_cached_and_does_not_mutate_params():
+    params = make_params()
+    query = queries.fullDesktopQuery(params)
+
+    assert params.bid_window == 'aw-watcher-window_my"host'
+    assert 'find_bucket("aw-watcher-window_my\\"host")' in query
+    # Calling again must not escape twice
+    assert queries.fullDesktopQuery(params) is query
+    assert queries.fullDesktopQuery(make_params()) is query
+
+
+def test_canonicalEvents_regex_escaping():
+    params = make_params(classes=[(["Test"], {"type": "regex", "regex": "\\w+"})])
+    assert '"regex": "\\w+"' in queries.canonicalEvents(params)
+
+
+def test_fullDesktopQuery_projection():
+    projection: queries.Projection = {
+        "window.cat_events": ["$category"],
+        "window.title_events": None,
+    }
+    query = queries.fullDesktopQuery(make_params(), projection=projection)
+    # Data keys are dropped by the server
+    assert query.endswith(
+        'RETURN = {"window": {"title_events": title_events, '
+        '"cat_events": merge_events_by_keys(cat_events, ["$category"])}};'
+    )
+    # Statements only needed for other fields are left out
+    assert "browser_urls" not in query
+    assert "app_events" not in query
+
+    query = queries.fullDesktopQuery(make_params(), projection={"browser": None})
+    assert query.endswith(
+        'RETURN = {"browser": {"domains": browser_domains, "urls": browser_urls, '
+        '"duration": browser_duration}};'
+    )
+
+
+@pytest.mark.parametrize(
+    "projection",
+    [
+        {"window.nonexistent": None},
+        {"windows": None},
+        {"window": ["app"]},
+        {"window.duration": ["app"]},
+        # Only merged events can have data keys dropped
+        {"events": ["app"]},
+        # Would merge events which differ in title
+        {"window.title_events": ["app"]},
+    ],
+)
+def test_fullDesktopQuery_invalid_projection(projection):
+    with pytest.raises(ValueError):
+        queries.fullDesktopQuery(make_params(), projection=projection)
+
+
+def test_multiHostQuery():
+    query = queries.multiHostQuery(["host1", 'host"2'], classes=default_classes)
+    assert 'find_bucket("aw-watcher-window_host1")' in query
+    assert 'find_bucket("aw-watcher-window_host\\"2")' in query
+    assert '"host\\"2": {' in query
+    assert query.count("categorize(") == 2
+    assert '"browser": {"domains": browser_domains' in query
+
+
+def test_multiHostQuery_browsers():
+    query = queries.multiHostQuery(
+        ["host1", "host2"],
+        classes=default_classes,
+        bid_browsers={"host1": ["aw-watcher-web-firefox_host1"]},
+    )
+    assert 'query_bucket("aw-watcher-web-firefox_host1")' in query
+    assert "h0_browser_domains = merge_events_by_keys(" in query
+    assert "h1_browser_domains = [];" in query
+
+
+def test_browsersWithBuckets():
+    buckets = [
+        "aw-watcher-web-firefox_host1",
+        "aw-watcher-web-chrome_host1",
+        "aw-watcher-web-firefox_host2",
+    ]
+    assert queries.browsersWithBuckets(buckets) == [
+        ("chrome", "aw-watcher-web-chrome_host1"),
+        ("firefox", "aw-watcher-web-firefox_host1"),
+    ]
+    assert queries.browsersWithBuckets(["aw-watcher-window_host1"]) == []
+
+
+def test_browser_of_app():
+    assert queries.browser_of_app("firefox.exe") == "firefox"
+    assert queries.browser_of_app("Microsoft Edge") == "edge"
+    assert queries.browser_of_app("vim") is None
@@ -0,0 +1,64 @@
+from aw_client.query_ast import optimize_query, parse, render
+
+
+def test_roundtrip():
+    query = (
+        'events = flood(query_bucket(find_bucket("aw-watcher-window_a\\"b")));\n'
+        'events = categorize(events, [[["Work"], {"type": "regex", "regex": "\\w+", "ignore_case": true}]]);\n'
+        'RETURN = {"events": events, "duration": 0};'
+    )
+    assert render(parse(query)) == query
+
+
+def test_dead_statements():
+    query = """
+    events = query_bucket("a");
+    unused = query_bucket("b");
+    RETURN = events;
+    """
+    assert optimize_query(query) == 'events = query_bucket("a");\nRETURN = events;'
+
+
+def test_hoist_sorts_and_redundant_split():
+    query = """
+    browser_events = [];
+    a = split_url_events(query_bucket("a"));
+    browser_events = concat(browser_events, a);
+    browser_events = sort_by_timestamp(browser_events);
+    b = split_url_events(query_bucket("b"));
+    browser_events = concat(browser_events, b);
+    browser_events = sort_by_timestamp(browser_events);
+    browser_events = split_url_events(browser_events);
+    RETURN = browser_events;
+    """
+    optimized = optimize_query(query)
+    assert optimized.count("sort_by_timestamp") == 1
+    assert optimized.count("split_url_events") == 2
+    assert optimized.endswith(
+        "browser_events = sort_by_timestamp(browser_events);\nRETURN = browser_events;"
+    )
+
+
+def test_common_subexpressions():
+    query = """
+    events = query_bucket("a");
+    x = merge_events_by_keys(events, ["app"]);
+    y = merge_events_by_keys(events, ["app"]);
+    events = flood(events);
+    z = merge_events_by_keys(events, ["app"]);
+    RETURN = {"x": x, "y": y, "z": z};
+    """
+    optimized = optimize_query(query)
+    assert "y = x;" in optimized
+    assert 'z = merge_events_by_keys(events, ["app"]);' in optimized
+
+
+def test_prune_return():
+    query = """
+    a = query_bucket("a");
+    b = query_bucket("b");
+    RETURN = {"a": a, "nested": {"b": b, "c": a}};
+    """
+    assert optimize_query(query, return_fields=["nested.b"]) == (
+        'b = query_bucket("b");\nRETURN = {"nested": {"b": b}};'
+    )
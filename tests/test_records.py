@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from aw_core.models import Event
+from aw_client.records import EventRecord, parse_events, parse_records, to_columns
+from aw_client.timestamps import parse_timestamp, parse_timestamps, to_epoch_us
+
+raw_events: List[Dict[str, Any]] = [
+    {
+        "id": 1,
+        "timestamp": "2024-05-01T10:00:00.123456+00:00",
+        "duration": 1.5,
+        "data": {"app": "firefox", "title": "ActivityWatch"},
+    },
+    {
+        "id": 2,
+        "timestamp": "2024-05-01T12:00:00.5Z",
+        "duration": 0,
+        "data": {"app": "vim", "title": "records.py"},
+    },
+]
+
+
+def test_records_match_events():
+    records = parse_records(raw_events)
+    events = [Event(**e) for e in raw_events]
+
+    for record, event in zip(records, events):
+        assert record.id == event.id
+        assert record.timestamp == event.timestamp
+        assert record.duration == event.duration
+        assert record.data == event.data
+        assert record.to_event() == event
+
+
+def test_record_timestamp_is_parsed_lazily():
+    record = EventRecord.from_json_dict(raw_events[0])
+    assert isinstance(record._timestamp, str)
+    assert record.timestamp is record.timestamp
+    assert record.duration == timedelta(seconds=1.5)
+
+
+def test_parse_timestamps():
+    expected = datetime(2024, 5, 1, 10, 0, 0, 123456, tzinfo=timezone.utc)
+    for s in [
+        "2024-05-01T10:00:00.123456+00:00",
+        "2024-05-01T10:00:00.123456Z",
+        "2024-05-01T10:00:00.123456789Z",
+        "2024-05-01T12:00:00.123456+0200",
+        "2024-05-01T10:00:00.123456",
+    ]:
+        assert parse_timestamp(s) == expected, s
+
+    # Equal offsets share the same tzinfo
+    a, b = parse_timestamps(
+        ["2024-05-01T12:00:00+02:00", "2024-06-01T12:00:00.5+02:00"]
+    )
+    assert a.tzinfo is b.tzinfo
+
+    assert list(
+        to_epoch_us(["1970-01-01T00:00:01.5Z", raw_events[0]["timestamp"]])
+    ) == [
+        1_500_000,
+        int(expected.timestamp()) * 1_000_000 + 123456,
+    ]
+
+
+def test_parse_events():
+    assert parse_events(raw_events) == [Event(**e) for e in raw_events]
+
+
+def test_interning():
+    events: List[Dict[str, Any]] = [
+        {"timestamp": "2024-05-01T10:00:00Z", "duration": 1, "data": {"app": a}}
+        for a in ["".join(["fire", "fox"]), "".join(["fi", "refox"])]
+    ]
+    assert events[0]["data"]["app"] is not events[1]["data"]["app"]
+    records = parse_records(events)
+    assert records[0].data["app"] is records[1].data["app"]
+
+
+def test_to_columns():
+    events = raw_events + [
+        {
+            "timestamp": "2024-05-01T13:00:00Z",
+            "duration": 2,
+            "data": {"app": "vim", "$category": ["Work", "Programming"]},
+        }
+    ]
+    columns = to_columns(events)
+    assert len(columns) == 3
+    assert list(columns.codes["app"]) == [0, 1, 1]
+    assert columns.dictionaries["app"] == ["firefox", "vim"]
+    assert columns.values("$category") == [None, None, "Work > Programming"]
+    assert columns.sum_durations_by("app") == {"firefox": 1.5, "vim": 2.0}
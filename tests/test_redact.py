@@ -0,0 +1,93 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, List
+
+import pytest
+
+from aw_client.records import EventRecord
+from aw_client.redact import (
+    RedactionChange,
+    Redactor,
+    apply_redaction,
+    plan_redaction,
+)
+
+start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def test_redactor():
+    redactor = Redactor(["secret", re.compile(r"\d{4}-\d{4}")], keys=["title", "url"])
+    data = {"app": "Secret app", "title": "My SECRET plans", "url": "https://a.b"}
+    assert redactor.redact_data(data) == {
+        "app": "Secret app",
+        "title": "REDACTED",
+        "url": "https://a.b",
+    }
+    assert data["title"] == "My SECRET plans"
+    assert redactor.redact_data({"title": "card 1234-5678"}) == {"title": "REDACTED"}
+    assert redactor.redact_data({"title": "nothing to see"}) is None
+    # Literal strings aren't interpreted as regexes
+    assert Redactor(["a.c"]).redact_data({"title": "abc"}) is None
+    # Compiled patterns keep their flags and groups
+    multiline = Redactor([re.compile(r"a.b", re.DOTALL)])
+    assert multiline.redact_data({"title": "a\nb"}) == {"title": "REDACTED"}
+    repeated = Redactor(["x", re.compile(r"(\w)\1")])
+    assert repeated.redact_data({"title": "book"}) == {"title": "REDACTED"}
+    assert repeated.redact_data({"title": "bok"}) is None
+
+
+class MockClient:
+    def __init__(self) -> None:
+        self.events = [
+            EventRecord(i, start + timedelta(minutes=i), 60, {"title": title})
+            for i, title in enumerate(["secret 1", "public", "Secret 2", "secret 3"])
+        ]
+        self.inserted: List[Any] = []
+        self.deleted: List[int] = []
+
+    def get_events(self, bucket_id, start, end, raw):
+        return [e for e in self.events if start <= e.timestamp < end]
+
+    def insert_events(self, bucket_id, events):
+        self.inserted.append(events)
+
+    def delete_events(self, bucket_id, event_ids):
+        self.deleted += event_ids
+        return {i: None for i in event_ids}
+
+
+def test_plan_and_apply_redaction():
+    client: Any = MockClient()
+    changes = plan_redaction(
+        client,
+        "bucket",
+        Redactor(["secret"]),
+        start,
+        start + timedelta(hours=1),
+        window=timedelta(minutes=2),
+    )
+    assert [c.event.id for c in changes] == [0, 2, 3]
+
+    progress: List[Any] = []
+    n = apply_redaction(
+        client,
+        "bucket",
+        changes,
+        chunk_size=2,
+        progress=lambda done, total: progress.append((done, total)),
+    )
+    assert n == 3
+    assert progress == [(2, 3), (3, 3)]
+    assert [len(chunk) for chunk in client.inserted] == [2, 1]
+    assert all(
+        e.data == {"title": "REDACTED"} and e.id is None for e in client.inserted[0]
+    )
+    assert client.deleted == [0, 2, 3]
+
+
+def test_apply_redaction_requires_ids():
+    client: Any = MockClient()
+    event = EventRecord(None, start, 60, {"title": "secret"})
+    with pytest.raises(ValueError):
+        apply_redaction(client, "bucket", [RedactionChange(event, {"title": "x"})])
+    assert client.inserted == []
@@ -13,7 +13,9 @@ from logging import basicConfig, DEBUG
 basicConfig(level=DEBUG)
 
 import requests
+from aw_client import metrics as metrics_module
 from aw_client.client import RequestQueue
+from aw_client.metrics import QueueMetrics
 
 
 class MockClient:
@@ -51,6 +53,29 @@ def test_basic():
     rq.join()
 
 
+def test_metrics():
+    client = MockClient()
+    rq = RequestQueue(client)  # type: ignore
+
+    # Mockeypatching
+    rq._try_connect = lambda: True  # type: ignore
+    rq.connected = True
+
+    snapshots: list = []
+    rq.metrics.add_exporter(snapshots.append, interval=0)
+
+    rq.start()
+    rq.add_request("/api/0/buckets/test/heartbeat", {})
+    sleep(1)
+    rq.stop()
+    rq.join()
+
+    assert rq.metrics.enqueued == 1
+    assert rq.metrics.sent >= 1
+    assert snapshots and snapshots[-1]["queue_depth"] == 0
+    assert "aw_client_queue_sent_total" in rq.metrics.to_prometheus()
+
+
 def test_complex():
     client = MockClient()
     rq = RequestQueue(client)  # type: ignore
@@ -88,3 +113,74 @@ def test_register_bucket_marks_queue_disconnected_on_create_failure():
 
     assert rq.connected is False
     assert client.create_bucket_calls == [(("test-bucket", "test-type"), {})]
+
+
+def test_metrics_http_errors():
+    class ErrorClient(MockClient):
+        status_code = 500
+
+        def _post(self, *args, **kwargs):
+            r = requests.Response()
+            r.status_code = self.status_code
+            raise requests.exceptions.HTTPError(response=r)
+
+    client = ErrorClient()
+    rq = RequestQueue(client)  # type: ignore
+    rq.add_request("/api/0/buckets/test/heartbeat", {})
+
+    # 500s are retried, so the request stays in the queue
+    rq._dispatch_request()
+    assert rq.metrics.errors["500"] == 1
+    assert rq.metrics.retries["500"] == 1
+    assert rq.metrics.dropped == 0
+    assert rq._current is not None
+
+    # 400s are dropped
+    client.status_code = 400
+    rq._dispatch_request()
+    assert rq.metrics.errors["400"] == 1
+    assert rq.metrics.retries["400"] == 0
+    assert rq.metrics.errors["other"] == 0
+    assert rq.metrics.dropped == 1
+    assert rq._current is None
+
+
+def test_server_errors_are_retried_with_backoff():
+    class ErrorClient(MockClient):
+        def _post(self, *args, **kwargs):
+            r = requests.Response()
+            r.status_code = 500
+            raise requests.exceptions.HTTPError(response=r)
+
+    rq = RequestQueue(ErrorClient())  # type: ignore
+    waits: list = []
+    rq.wait = waits.append  # type: ignore
+    rq.add_request("/api/0/buckets/test/heartbeat", {})
+
+    for _ in range(RequestQueue.MAX_SERVER_ERROR_RETRIES):
+        rq._dispatch_request()
+        assert rq._current is not None
+    assert waits == [0.5, 1, 2, 4, 8]
+
+    # Dropped once out of retries, so it can't block the queue forever
+    rq._dispatch_request()
+    assert rq._current is None
+    assert rq.metrics.retries["500"] == RequestQueue.MAX_SERVER_ERROR_RETRIES
+    assert rq.metrics.errors["500"] == RequestQueue.MAX_SERVER_ERROR_RETRIES + 1
+    assert rq.metrics.dropped == 1
+
+
+def test_metrics_rates_are_recent(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(metrics_module, "monotonic", lambda: now[0])
+    metrics = QueueMetrics()
+
+    for _ in range(100):
+        metrics.record_sent(0.01)
+    now[0] = 10
+    assert metrics.snapshot()["drain_rate"] == 10
+
+    # Nothing sent for more than the window
+    now[0] = 100
+    assert metrics.snapshot()["drain_rate"] == 0
+    assert metrics.snapshot()["sent"] == 100
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from zoneinfo import ZoneInfo
+
+from aw_client.records import to_columns
+from aw_client.rollups import bin_durations, bin_edges, split_events
+
+tz = timezone(timedelta(hours=2))
+
+events: List[Dict[str, Any]] = [
+    {
+        "timestamp": "2024-05-01T09:30:00+00:00",
+        "duration": 3600,
+        "data": {"app": "vim", "$category": ["Work", "Programming"]},
+    },
+    {
+        "timestamp": "2024-05-01T11:00:00+00:00",
+        "duration": 600,
+        "data": {"app": "firefox", "$category": ["Uncategorized"]},
+    },
+    {
+        "timestamp": "2024-05-01T11:50:00+00:00",
+        "duration": 1200,
+        "data": {"app": "vim", "$category": ["Work", "Programming"]},
+    },
+]
+
+
+def test_bin_edges():
+    start = datetime(2024, 5, 1, 3, 30, tzinfo=tz)
+    end = datetime(2024, 5, 3, 12, 0, tzinfo=tz)
+
+    edges = bin_edges(start, end, "day", day_offset=timedelta(hours=4))
+    assert edges[0] == datetime(2024, 4, 30, 4, 0, tzinfo=tz)
+    assert edges[-1] == datetime(2024, 5, 4, 4, 0, tzinfo=tz)
+    assert len(edges) == 5
+
+    hours = bin_edges(start, start + timedelta(hours=2), "hour")
+    assert hours[0] == datetime(2024, 5, 1, 3, 0, tzinfo=tz)
+    assert len(hours) == 4
+
+    # 2024-05-01 is a Wednesday
+    weeks = bin_edges(start, end, "week")
+    assert weeks == [
+        datetime(2024, 4, 29, tzinfo=tz),
+        datetime(2024, 5, 6, tzinfo=tz),
+    ]
+
+
+def lengths(edges: List[datetime]) -> List[timedelta]:
+    # Subtracting datetimes with the same tzinfo gives the wall-clock difference
+    return [b - a.astimezone(timezone.utc) for a, b in zip(edges, edges[1:])]
+
+
+def test_bin_edges_dst():
+    # DST starts on 2024-03-31 at 02:00, and ends on 2024-10-27 at 03:00
+    stockholm = ZoneInfo("Europe/Stockholm")
+    start = datetime(2024, 3, 30, 12, tzinfo=stockholm)
+    end = datetime(2024, 4, 1, 12, tzinfo=stockholm)
+
+    days = bin_edges(start, end, "day")
+    assert [(e.day, e.hour) for e in days] == [(30, 0), (31, 0), (1, 0), (2, 0)]
+    assert lengths(days) == [
+        timedelta(hours=24),
+        timedelta(hours=23),
+        timedelta(hours=24),
+    ]
+    # Starting at the hour skipped by the DST change
+    days = bin_edges(start, end, "day", day_offset=timedelta(hours=2))
+    assert [(e.day, e.hour) for e in days] == [(30, 2), (31, 3), (1, 2), (2, 2)]
+
+    weeks = bin_edges(start, end, "week")
+    assert [(e.month, e.day, e.hour) for e in weeks] == [
+        (3, 25, 0),
+        (4, 1, 0),
+        (4, 8, 0),
+    ]
+
+    # Hours are never skipped or repeated
+    start = datetime(2024, 10, 27, 1, tzinfo=stockholm)
+    hours = bin_edges(start, start + timedelta(hours=3), "hour")
+    assert lengths(hours) == [timedelta(hours=1)] * 4
+    assert [e.hour for e in hours] == [1, 2, 2, 3, 4]
+
+
+def test_bin_durations():
+    start = datetime(2024, 5, 1, 9, tzinfo=timezone.utc)
+    edges = bin_edges(start, start + timedelta(hours=3, minutes=10), "hour")
+    columns = to_columns(events, keys=["app", "$category"])
+
+    apps = bin_durations(columns, "app", edges)
+    assert list(apps.durations["vim"]) == [1800, 1800, 600, 600]
+    assert list(apps.durations["firefox"]) == [0, 0, 600, 0]
+    assert apps.totals() == {"vim": 4800, "firefox": 600}
+    assert apps.bin_totals() == [1800, 1800, 1200, 600]
+
+    categories = bin_durations(columns, "$category", edges)
+    assert sum(categories.durations["Work > Programming"]) == 4800
+
+
+def test_split_events():
+    start = datetime(2024, 5, 1, 9, tzinfo=timezone.utc)
+    edges = bin_edges(start, start + timedelta(hours=3, minutes=10), "hour")
+    bins = split_events(events, edges)
+
+    assert [len(b) for b in bins] == [1, 1, 2, 1]
+    assert [sum(e["duration"] for e in b) for b in bins] == [1800, 1800, 1200, 600]
+    # Events within a single bin are kept as-is
+    assert bins[2][0] is events[1]
+    assert bins[3][0]["timestamp"] == "2024-05-01T12:00:00+00:00"
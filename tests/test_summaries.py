@@ -0,0 +1,117 @@
+from datetime import date, datetime, timedelta
+from typing import Any, List
+
+from aw_client.queries import DesktopQueryParams
+from aw_client.summaries import (
+    SummaryStore,
+    daily_summaries,
+    settings_hash,
+    summary_query,
+)
+
+classes: Any = [(["Work"], {"type": "regex", "regex": "vim"})]
+
+
+class MockClient:
+    def __init__(self) -> None:
+        self.queried: List[Any] = []
+
+    def query(self, query, timeperiods):
+        self.queried.append(timeperiods)
+        return [
+            {
+                "cat_events": [{"duration": 60.0, "data": {"$category": ["Work"]}}],
+                "app_events": [{"duration": 60.0, "data": {"app": "vim"}}],
+                "domains": [],
+                "duration": 60.0,
+            }
+            for _ in timeperiods
+        ]
+
+
+def test_daily_summaries_are_stored(tmp_path):
+    store = SummaryStore(str(tmp_path / "summaries.sqlite"))
+    client: Any = MockClient()
+    days = [date(2024, 5, 1), date(2024, 5, 2)]
+    # The second day hasn't ended yet
+    now = datetime(2024, 5, 2, 12).astimezone()
+
+    result = daily_summaries(client, store, "host", days, classes=classes, now=now)
+    assert result[days[0]] == {
+        "duration": 60.0,
+        "categories": {"Work": 60.0},
+        "apps": {"vim": 60.0},
+        "domains": {},
+    }
+    assert len(client.queried[0]) == 2
+
+    # Only the unfinished day is queried again
+    daily_summaries(client, store, "host", days, classes=classes, now=now)
+    assert len(client.queried[1]) == 1
+
+    # Changing the day offset changes the periods of all days
+    daily_summaries(
+        client,
+        store,
+        "host",
+        days,
+        day_offset=timedelta(hours=4),
+        classes=classes,
+        now=now,
+    )
+    assert len(client.queried[2]) == 2
+    assert client.queried[2][0][0].hour == 4
+
+
+def test_summaries_invalidated_by_classes(tmp_path):
+    store = SummaryStore(str(tmp_path / "summaries.sqlite"))
+    client: Any = MockClient()
+    days = [date(2024, 5, 1)]
+    now = datetime(2024, 6, 1).astimezone()
+
+    daily_summaries(client, store, "host", days, classes=classes, now=now)
+    other_classes: Any = [(["Work"], {"type": "regex", "regex": "emacs"})]
+    assert settings_hash(other_classes) != settings_hash(classes)
+
+    daily_summaries(client, store, "host", days, classes=other_classes, now=now)
+    assert len(client.queried) == 2
+
+    # Summaries made with other settings are kept, so callers don't discard each other's
+    daily_summaries(client, store, "host", days, classes=classes, now=now)
+    assert len(client.queried) == 2
+
+    # Until their settings haven't been used for a while
+    later = now + timedelta(days=31)
+    daily_summaries(client, store, "host", days, classes=classes, now=later)
+    assert len(client.queried) == 2
+    assert store.get("host", days, settings_hash(other_classes)) == {}
+    assert store.get("host", days, settings_hash(classes)) != {}
+
+
+def test_summaries_invalidated_by_browser_buckets(tmp_path):
+    store = SummaryStore(str(tmp_path / "summaries.sqlite"))
+    client: Any = MockClient()
+    days = [date(2024, 5, 1)]
+    now = datetime(2024, 6, 1).astimezone()
+
+    daily_summaries(client, store, "host", days, classes=classes, now=now)
+    daily_summaries(
+        client,
+        store,
+        "host",
+        days,
+        classes=classes,
+        bid_browsers=["aw-watcher-web-firefox"],
+        now=now,
+    )
+    assert len(client.queried) == 2
+
+
+def test_summary_query_splits_urls_once():
+    params = DesktopQueryParams(
+        bid_window="aw-watcher-window_host",
+        bid_afk="aw-watcher-afk_host",
+        bid_browsers=["aw-watcher-web-firefox"],
+        classes=classes,
+    )
+    assert summary_query(params).count("split_url_events(") == 1
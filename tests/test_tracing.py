@@ -0,0 +1,49 @@
+import json
+from datetime import timedelta
+from typing import List
+
+import requests
+
+from aw_client import ActivityWatchClient
+from aw_client import client as client_module
+from aw_client.tracing import ProfileReport, RequestTrace
+
+
+def make_response(data) -> requests.Response:
+    r = requests.Response()
+    r.status_code = 200
+    r._content = json.dumps(data).encode("utf8")
+    r.elapsed = timedelta(milliseconds=5)
+    return r
+
+
+def test_traces_requests(monkeypatch, client_env):
+
+    events = [
+        {"id": i, "timestamp": "2024-05-01T10:00:00+00:00", "duration": 1, "data": {}}
+        for i in range(3)
+    ]
+
+    def fake_get(url, params=None, headers=None):
+        return make_response(events)
+
+    monkeypatch.setattr(client_module.req, "get", fake_get)
+
+    client = ActivityWatchClient("test-client", testing=True)
+    traces: List[RequestTrace] = []
+    report = ProfileReport()
+    client.tracer.add_hook(traces.append)
+    client.tracer.add_hook(report)
+
+    assert len(client.get_events("test-bucket")) == 3
+
+    assert len(traces) == 1
+    trace = traces[0]
+    assert trace.method == "GET"
+    assert trace.call == "get_events"
+    assert trace.endpoint == "buckets/test-bucket/events"
+    assert trace.response_bytes == len(json.dumps(events))
+    assert trace.server_time == 0.005
+    assert trace.decode_time > 0
+    assert trace.construct_time > 0
+    assert "get_events" in report.report()